@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Compara el coste de arranque del núcleo sin GTK (somepyapps) con el de las
+interfaces: tiempo de proceso completo y pico de memoria (RSS) de cada caso.
+
+Cada caso es un proceso nuevo; el tiempo va de lanzarlo a que termina y el
+RSS sale de wait4(). Los casos con GTK se saltan si no está instalado, y los
+que abren ventana si no hay sesión gráfica. Uso:
+    python3 benchmarks/core_import.py [-n 10] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SRC = os.path.join(ROOT, "src")
+GTK = "import gi; gi.require_version('Gtk', '3.0'); from gi.repository import Gtk"
+
+HEADLESS = [
+    ("python vacío", ["-c", "pass"]),
+    ("somepyapps.capture", ["-c", "import somepyapps.capture"]),
+    ("somepyapps.record", ["-c", "import somepyapps.record"]),
+    ("somepyapps.power", ["-c", "import somepyapps.power"]),
+    ("cli power --dry-run", ["-m", "somepyapps", "power", "suspend", "--dry-run", "--no-hooks"]),
+]
+GUI = [
+    ("import Gtk", ["-c", GTK]),
+    ("Gtk + tema", ["-c", f"{GTK}; Gtk.init_check(); from somepyapps import theme; theme.apply()"]),
+    ("Screenme (primer fotograma)", [os.path.join(SRC, "Screenme.py", "screenme.py", "screenme.py"), "--exit-when-ready"]),
+    ("PyLogOut (primer fotograma)", [os.path.join(SRC, "PyLogOut", "PyLogOut", "PyLogOut.py"), "--exit-when-shown"]),
+]
+
+
+def run_once(args):
+    """Devuelve (ms, pico de RSS en KiB) de un proceso python con args."""
+    env = dict(os.environ, PYTHONPATH=SRC)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, *args], env=env, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = (time.perf_counter() - start) * 1000
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} terminó con código {process.returncode}")
+    return elapsed, usage.ru_maxrss
+
+
+def gtk_available():
+    return subprocess.run([sys.executable, "-c", GTK], capture_output=True).returncode == 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="salida en JSON lines")
+    args = parser.parse_args()
+
+    display = bool(os.environ.get("WAYLAND_DISPLAY") or os.environ.get("DISPLAY"))
+    gtk = gtk_available()
+    if not args.json:
+        print(f"{'caso':<30} {'tipo':<9} {'mediana ms':>11} {'mín ms':>9} {'RSS MiB':>8}")
+    for kind, cases in (("headless", HEADLESS), ("gui", GUI)):
+        for name, case in cases:
+            needs_display = case[0] != "-c" or "init_check" in case[1]
+            if kind == "gui" and (not gtk or (needs_display and not display)):
+                reason = "sin GTK" if not gtk else "sin sesión gráfica"
+                if args.json:
+                    print(json.dumps({"case": name, "kind": kind, "skipped": reason}))
+                else:
+                    print(f"{name:<30} {kind:<9} {'(' + reason + ')':>30}")
+                continue
+            samples = [run_once(case) for _ in range(args.runs)]
+            times = [ms for ms, _ in samples]
+            rss = max(kb for _, kb in samples)
+            if args.json:
+                print(json.dumps({
+                    "case": name, "kind": kind, "median_ms": statistics.median(times),
+                    "min_ms": min(times), "max_ms": max(times), "peak_rss_kb": rss,
+                }))
+            else:
+                print(f"{name:<30} {kind:<9} {statistics.median(times):11.1f} {min(times):9.1f} {rss / 1024:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
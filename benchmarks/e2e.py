@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""Banco de pruebas de extremo a extremo de Screenme, Recordme y PyLogOut sin
+sesión Wayland.
+
+Pone benchmarks/fakes al principio del PATH (grim, slurp, wl-copy,
+wf-recorder y hyprctl con latencia configurable), arranca un servidor gráfico
+virtual (Xvfb, o broadwayd si no hay Xvfb) y maneja GrimScreenshotTool,
+MochaRecorder y LogoutMenu desde dentro de su proceso pulsando sus botones.
+Métricas, todas en ms:
+
+    <app>.startup                de lanzar el proceso al primer fotograma
+    screenme.click_to_file*      de pulsar "Capturar" a tener el fichero guardado
+    screenme.click_to_clipboard  ídem con destino portapapeles (wl-copy)
+    recordme.record_start        de pulsar grabar a que wf-recorder ya escribe
+    recordme.record_stop         de pulsar parar al fichero cerrado y verificado
+    pylogout.show                de mostrar el menú residente a su primer fotograma
+    pylogout.logout              de pulsar "cerrar sesión" al final de la acción
+
+Configuración, índice, cachés y sockets van a un directorio temporal, así que
+no se tocan los de la sesión real ni se habla con una instancia residente.
+Con --json cada métrica es una línea JSON con sus percentiles y el commit;
+--compare compara con una salida anterior y termina con código 1 si la
+mediana de alguna métrica empeora más de --tolerance por ciento. Uso:
+    python3 benchmarks/e2e.py [-n 20] [--delay grim=0.03 ...] [--json > base.jsonl]
+    python3 benchmarks/e2e.py --compare base.jsonl
+"""
+
+import argparse
+import collections
+import contextlib
+import glob
+import importlib.util
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SRC = os.path.join(ROOT, "src")
+FAKES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakes")
+APPS = {
+    "screenme": os.path.join(SRC, "Screenme.py", "screenme.py", "screenme.py"),
+    "recordme": os.path.join(SRC, "Recordme.py", "recordme.py", "recordme.py"),
+    "pylogout": os.path.join(SRC, "PyLogOut", "PyLogOut", "PyLogOut.py"),
+}
+# Variable de cada sustituto con su latencia en segundos
+DELAY_VARS = {
+    "grim": "FAKE_GRIM_DELAY",
+    "slurp": "FAKE_SLURP_DELAY",
+    "wl-copy": "FAKE_WL_COPY_DELAY",
+    "wf-recorder": "FAKE_WF_START_DELAY",
+    "hyprctl": "FAKE_HYPRCTL_DELAY",
+}
+PERCENTILES = (50, 90, 95, 99)
+
+
+# --- Lado del proceso hijo: maneja una aplicación dentro de su bucle de GTK ---
+
+def load_app(name):
+    sys.argv = [APPS[name]]
+    spec = importlib.util.spec_from_file_location(name, APPS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Runner:
+    """Ejecuta un escenario escrito como generador dentro del bucle de GTK.
+
+    El escenario cede el control con yield y una retrollamada lo reanuda con
+    resume(valor); el yield devuelve (instante de perf_counter, valor).
+    """
+
+    def __init__(self, Gtk, GLib):
+        self.Gtk = Gtk
+        self.GLib = GLib
+        self.scenario = None
+        self.error = None
+
+    def start(self, scenario):
+        self.scenario = scenario
+        self.GLib.idle_add(self.step, None)
+        self.Gtk.main()
+
+    def resume(self, value=None):
+        self.GLib.idle_add(self.step, (time.perf_counter(), value))
+
+    def step(self, sent):
+        try:
+            self.scenario.send(sent)
+        except StopIteration:
+            self.Gtk.main_quit()
+        except Exception:
+            self.error = traceback.format_exc()
+            self.Gtk.main_quit()
+        return False
+
+    def first_frame(self, window):
+        """Reanuda el escenario tras el siguiente fotograma pintado de window."""
+        def after_paint(clock):
+            clock.disconnect(handler)
+            self.resume()
+
+        window.realize()
+        clock = window.get_frame_clock()
+        handler = clock.connect("after-paint", after_paint)
+        window.queue_draw()
+
+    def sleep(self, seconds):
+        self.GLib.timeout_add(int(seconds * 1000), self.resume)
+
+
+def elapsed_ms(start, resumed):
+    return (resumed[0] - start) * 1000
+
+
+def screenme_scenario(module, runner, samples, runs, out):
+    app = module.GrimScreenshotTool()
+    original = app.engine.on_finished
+
+    def on_finished(job):
+        original(job)
+        runner.resume(job)
+        return False
+
+    app.engine.on_finished = on_finished
+    runner.first_frame(app.window)
+    yield
+    cases = (
+        ("screenme.click_to_file", "full", "file"),
+        ("screenme.click_to_file_area", "area", "file"),
+        ("screenme.click_to_clipboard", "full", "clipboard"),
+    )
+    for metric, mode, destination in cases:
+        app.on_capture_mode_changed(None, mode)
+        app.on_destination_changed(None, destination)
+        for i in range(runs):
+            path = os.path.join(out, f"{metric}-{i}.png")
+            app.filename_entry.set_text(path)
+            start = time.perf_counter()
+            app.capture_button.clicked()
+            resumed = yield
+            job = resumed[1]
+            if job.state != "done":
+                raise RuntimeError(f"{metric}: {job.title}: {job.error}")
+            if destination == "file" and not os.path.getsize(path):
+                raise RuntimeError(f"{metric}: {path} está vacío")
+            samples[metric].append(elapsed_ms(start, resumed))
+            # La ventana vuelve a mostrarse al terminar; se pulsa otra vez cuando ya está pintada
+            runner.first_frame(app.window)
+            yield
+    app.server.close()
+
+
+def recordme_scenario(module, runner, samples, runs, out, hold):
+    app = module.MochaRecorder()
+    original = app.on_session_state
+
+    def on_session_state(session):
+        original(session)
+        if session.state in ("recording", "done", "failed"):
+            runner.resume(session)
+
+    # start_recording pasa self.on_session_state a cada sesión nueva
+    app.on_session_state = on_session_state
+    runner.first_frame(app.window)
+    yield
+    for i in range(runs):
+        app.file_entry.set_text(os.path.join(out, f"recording-{i}.mkv"))
+        start = time.perf_counter()
+        app.record_button.clicked()
+        resumed = yield
+        if resumed[1].state != "recording":
+            raise RuntimeError(f"recordme.record_start: {resumed[1].error}")
+        samples["recordme.record_start"].append(elapsed_ms(start, resumed))
+        runner.sleep(hold)
+        yield
+        start = time.perf_counter()
+        app.record_button.clicked()
+        resumed = yield
+        if resumed[1].state != "done":
+            raise RuntimeError(f"recordme.record_stop: {resumed[1].error}")
+        samples["recordme.record_stop"].append(elapsed_ms(start, resumed))
+
+
+def pylogout_scenario(module, runner, samples, runs):
+    # La acción de cierre de sesión acaba en `hyprctl dispatch exit`: solo con el sustituto
+    if os.path.dirname(shutil.which("hyprctl") or "") != FAKES:
+        raise RuntimeError("hyprctl no es el sustituto de benchmarks/fakes; no se pulsa cerrar sesión")
+    win = module.LogoutMenu(resident=True)
+    win.get_child().show_all()
+    win.realize()
+    original = win.engine.on_done
+
+    def on_done(ok, message):
+        original(ok, message)
+        runner.resume((ok, message))
+
+    win.engine.on_done = on_done
+    for _ in range(runs):
+        start = time.perf_counter()
+        win.present_menu(runner.resume)
+        resumed = yield
+        samples["pylogout.show"].append(elapsed_ms(start, resumed))
+        start = time.perf_counter()
+        win.grid.get_child_at(0, 0).clicked()
+        resumed = yield
+        ok, message = resumed[1]
+        if not ok:
+            raise RuntimeError(f"pylogout.logout: {message}")
+        samples["pylogout.logout"].append(elapsed_ms(start, resumed))
+
+
+def startup_scenario(name, module, runner):
+    if name == "screenme":
+        window = module.GrimScreenshotTool().window
+    elif name == "recordme":
+        window = module.MochaRecorder().window
+    else:
+        window = module.LogoutMenu()
+        window.get_child().show_all()
+        window.present_menu(runner.resume)
+        yield
+        return
+    runner.first_frame(window)
+    yield
+
+
+def drive(args):
+    module = load_app(args.driver)
+    runner = Runner(module.Gtk, module.GLib)
+    samples = collections.defaultdict(list)
+    if args.startup:
+        scenario = startup_scenario(args.driver, module, runner)
+    elif args.driver == "screenme":
+        scenario = screenme_scenario(module, runner, samples, args.runs, args.out)
+    elif args.driver == "recordme":
+        scenario = recordme_scenario(module, runner, samples, args.runs, args.out, args.hold)
+    else:
+        scenario = pylogout_scenario(module, runner, samples, args.runs)
+    runner.start(scenario)
+
+    from somepyapps import trace
+
+    if trace.enabled:
+        trace.dump()
+    if runner.error:
+        print(runner.error, file=sys.stderr)
+    else:
+        print(json.dumps(samples))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # Sin esperar a los hilos de trabajo ni a los procesos hijos de las aplicaciones
+    os._exit(1 if runner.error else 0)
+
+
+# --- Lado del proceso padre: entorno aislado, servidor gráfico y percentiles ---
+
+def isolated_env(tmp, delays):
+    env = dict(os.environ)
+    env["PATH"] = FAKES + os.pathsep + env.get("PATH", "")
+    for name in ("XDG_CONFIG_HOME", "XDG_DATA_HOME", "XDG_CACHE_HOME", "XDG_RUNTIME_DIR"):
+        env[name] = os.path.join(tmp, name.lower())
+        os.makedirs(env[name], mode=0o700)
+    env.pop("SWAYSOCK", None)  # Las pantallas salen del sustituto de hyprctl
+    env["NO_AT_BRIDGE"] = "1"
+    env["FAKE_HYPRCTL_LOG"] = os.path.join(tmp, "hyprctl.log")
+    for tool, seconds in delays.items():
+        env[DELAY_VARS[tool]] = str(seconds)
+    return env
+
+
+@contextlib.contextmanager
+def virtual_display(backend, env):
+    """Añade a env las variables del servidor gráfico elegido mientras dura el bloque."""
+    has_display = bool(os.environ.get("WAYLAND_DISPLAY") or os.environ.get("DISPLAY"))
+    if backend == "auto":
+        backend = "xvfb" if shutil.which("Xvfb") else "broadway" if shutil.which("broadwayd") else "session"
+        if backend == "session" and not has_display:
+            raise SystemExit("hace falta Xvfb o broadwayd, o una sesión gráfica con --backend session")
+    if backend == "session":
+        yield backend
+        return
+
+    if backend == "xvfb":
+        read_fd, write_fd = os.pipe()
+        server = subprocess.Popen(
+            ["Xvfb", "-displayfd", str(write_fd), "-screen", "0", "1920x1080x24", "-nolisten", "tcp"],
+            pass_fds=(write_fd,), stderr=subprocess.DEVNULL,
+        )
+        os.close(write_fd)
+        # Xvfb escribe el número de pantalla cuando ya acepta clientes
+        number = os.read(read_fd, 16).decode().strip()
+        os.close(read_fd)
+        if not number:
+            raise SystemExit("Xvfb no arrancó")
+        env.update(DISPLAY=f":{number}", GDK_BACKEND="x11")
+    else:
+        number = 5 + os.getpid() % 50
+        server = subprocess.Popen(["broadwayd", f":{number}"], env=env, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 5
+        while not glob.glob(os.path.join(env["XDG_RUNTIME_DIR"], "broadway*.socket")):
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit("broadwayd no arrancó")
+            time.sleep(0.05)
+        env.update(BROADWAY_DISPLAY=f":{number}", GDK_BACKEND="broadway")
+    env.pop("WAYLAND_DISPLAY", None)
+    try:
+        yield backend
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_driver(app, env, args, out, startup=False):
+    """Lanza el proceso que maneja app. Devuelve los ms que tardó y sus muestras."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--driver", app, "-n", str(args.runs),
+           "--hold", str(args.hold), "--out", out]
+    if startup:
+        cmd.append("--startup")
+    env = dict(env)
+    if args.trace and not startup:
+        env["SOMEPYAPPS_TRACE"] = os.path.join(os.path.abspath(args.trace), f"{app}.json")
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            cmd, env=env, capture_output=True, text=True, timeout=60 + args.runs * (args.hold + 10),
+        )
+    except subprocess.TimeoutExpired:
+        raise SystemExit(f"{app}: el escenario no terminó a tiempo")
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise SystemExit(f"{app} falló:\n{result.stderr.strip()[-2000:]}")
+    return elapsed, {} if startup else json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * q / 100
+    low = math.floor(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def summarize(metric, samples, context):
+    result = {"metric": metric, "unit": "ms", "n": len(samples)}
+    for q in PERCENTILES:
+        result[f"p{q}"] = round(percentile(samples, q), 3)
+    result.update(
+        min=round(min(samples), 3), max=round(max(samples), 3), mean=round(sum(samples) / len(samples), 3),
+        **context,
+    )
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "-C", ROOT, "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path, tolerance, out):
+    """Compara la mediana de cada métrica con la de path. Devuelve True si alguna empeora de más."""
+    with open(path) as f:
+        base = {r["metric"]: r for r in map(json.loads, filter(str.strip, f)) if "metric" in r}
+    regressed = False
+    print(f"\ncomparación con {path} (commit {next(iter(base.values()), {}).get('commit')})", file=out)
+    for result in results:
+        before = base.get(result["metric"])
+        if before is None:
+            print(f"{result['metric']:<30} (nueva)", file=out)
+            continue
+        change = (result["p50"] - before["p50"]) / before["p50"] * 100 if before["p50"] else 0.0
+        flag = ""
+        if change > tolerance:
+            flag, regressed = "  REGRESIÓN", True
+        print(f"{result['metric']:<30} p50 {before['p50']:9.1f} -> {result['p50']:9.1f} ms ({change:+6.1f} %){flag}",
+              file=out)
+    return regressed
+
+
+def parse_delay(text):
+    tool, _, seconds = text.partition("=")
+    if tool not in DELAY_VARS:
+        raise argparse.ArgumentTypeError(f"sustituto desconocido: {tool} (elige entre {', '.join(DELAY_VARS)})")
+    try:
+        return tool, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"latencia no válida: {text}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs", type=int, default=20, help="repeticiones de cada medida")
+    parser.add_argument("--apps", nargs="+", choices=APPS, default=list(APPS))
+    parser.add_argument("--backend", choices=("auto", "xvfb", "broadway", "session"), default="auto",
+                        help="servidor gráfico: virtual (xvfb, broadway) o la sesión actual")
+    parser.add_argument("--delay", type=parse_delay, action="append", default=[], metavar="SUSTITUTO=SEGUNDOS",
+                        help=f"latencia de un sustituto: {', '.join(DELAY_VARS)}")
+    parser.add_argument("--hold", type=float, default=1.0, help="segundos que dura cada grabación")
+    parser.add_argument("--json", action="store_true", help="salida en JSON lines")
+    parser.add_argument("--compare", metavar="FICHERO", help="salida --json anterior con la que comparar")
+    parser.add_argument("--tolerance", type=float, default=15.0, help="empeoramiento de la mediana admitido (%%)")
+    parser.add_argument("--trace", metavar="DIRECTORIO", help="guardar las trazas de fases de cada aplicación")
+    parser.add_argument("--driver", choices=APPS, help=argparse.SUPPRESS)
+    parser.add_argument("--startup", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.driver:
+        drive(args)
+        return
+
+    if args.trace:
+        os.makedirs(args.trace, exist_ok=True)
+    delays = dict(args.delay)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="somepyapps-e2e-") as tmp:
+        env = isolated_env(tmp, delays)
+        with virtual_display(args.backend, env) as backend:
+            context = {"commit": git_commit(), "backend": backend, "delays": delays}
+            if not args.json:
+                print(f"servidor gráfico: {backend}, commit {context['commit']}, latencias {delays or 'ninguna'}")
+                print(f"{'métrica':<30} {'n':>4} " + " ".join(f"{'p' + str(q):>8}" for q in PERCENTILES)
+                      + f" {'máx':>8}")
+            for app in args.apps:
+                out = os.path.join(tmp, app)
+                os.makedirs(out)
+                startup = [run_driver(app, env, args, out, startup=True)[0] for _ in range(args.runs)]
+                _, samples = run_driver(app, env, args, out)
+                for metric, values in [(f"{app}.startup", startup), *samples.items()]:
+                    result = summarize(metric, values, context)
+                    results.append(result)
+                    if args.json:
+                        print(json.dumps(result), flush=True)
+                    else:
+                        print(f"{metric:<30} {result['n']:>4} "
+                              + " ".join(f"{result['p' + str(q)]:8.1f}" for q in PERCENTILES)
+                              + f" {result['max']:8.1f}", flush=True)
+
+    if args.compare and compare(results, args.compare, args.tolerance, sys.stderr if args.json else sys.stdout):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Compara el tiempo hasta el primer fotograma de PyLogOut en frío con el de
+la instancia residente (ventana ya construida y oculta).
+
+En frío se mide desde lanzar el proceso hasta que sale tras pintar el primer
+fotograma (--exit-when-shown). En caliente, la instancia residente contesta a
+"show" justo después de pintar, así que el tiempo de ida y vuelta del cliente
+es el tiempo hasta el primer fotograma. Necesita una sesión gráfica. Uso:
+    python3 benchmarks/pylogout_startup.py [-n 10]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PYLOGOUT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "src", "PyLogOut", "PyLogOut", "PyLogOut.py"
+)
+
+
+def timed_run(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, PYLOGOUT, *args], check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def wait_for_instance(timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if subprocess.run([sys.executable, PYLOGOUT, "ping"], stderr=subprocess.DEVNULL).returncode == 0:
+            return
+        time.sleep(0.05)
+    raise SystemExit("la instancia residente no respondió a tiempo")
+
+
+def summary(name, samples):
+    print(
+        f"{name:<30} mediana {statistics.median(samples):8.1f} ms   "
+        f"mín {min(samples):8.1f} ms   máx {max(samples):8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    if subprocess.run([sys.executable, PYLOGOUT, "ping"], stderr=subprocess.DEVNULL).returncode == 0:
+        raise SystemExit("ya hay una instancia residente; ciérrala con 'PyLogOut.py quit' antes de medir")
+
+    # Frío: Python, GTK, CSS y los cuatro botones desde cero
+    cold = [timed_run(["--exit-when-shown"]) for _ in range(args.runs)]
+
+    # Caliente: el cliente no carga GTK y la ventana ya existe
+    daemon = subprocess.Popen([sys.executable, PYLOGOUT, "--resident"])
+    try:
+        wait_for_instance()
+        warm = []
+        for _ in range(args.runs):
+            warm.append(timed_run(["show"]))
+            timed_run(["hide"])
+    finally:
+        subprocess.run([sys.executable, PYLOGOUT, "quit"])
+        daemon.wait(timeout=5)
+
+    summary("frío (primer fotograma)", cold)
+    summary("caliente (primer fotograma)", warm)
+    print(f"aceleración mediana: x{statistics.median(cold) / statistics.median(warm):.1f}")
+
+
+if __name__ == "__main__":
+    main()
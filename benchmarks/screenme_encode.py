@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Mide la codificación de Screenme.py para cada formato y preset.
+
+Los fotogramas de referencia son PPM sintéticos, así que no hace falta
+pantalla ni grim. Cada caso se ejecuta en un proceso nuevo para poder medir
+el pico de memoria sin arrastrar el de los casos anteriores. Uso:
+    python3 benchmarks/screenme_encode.py [--4k] [-n 3] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCREENME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "Screenme.py", "screenme.py")
+
+
+def make_frame(kind, width, height):
+    """Genera un PPM (P6) sintético del tipo pedido."""
+    header = f"P6\n{width} {height}\n255\n".encode()
+    if kind == "desktop":
+        # Zonas planas con franjas tipo texto: lo que suele haber en pantalla
+        background = bytes((30, 30, 46)) * width
+        text = ((bytes((30, 30, 46)) * 6 + bytes((205, 214, 244)) * 2) * (width // 8 + 1))[: width * 3]
+        rows = [text if y % 24 < 14 and (y // 24) % 3 else background for y in range(height)]
+        return header + b"".join(rows)
+    if kind == "gradient":
+        rows = []
+        for y in range(height):
+            g = y * 255 // height
+            rows.append(bytes(v for x in range(width) for v in (x * 255 // width, g, 128)))
+        return header + b"".join(rows)
+    # noise: el peor caso, incompresible
+    rng = random.Random(0)
+    return header + rng.randbytes(width * height * 3)
+
+
+def run_case(path, image_format, preset, runs):
+    sys.path.insert(0, SCREENME_DIR)
+    import screenme
+
+    with open(path, "rb") as f:
+        data = f.read()
+    pixbuf = screenme.decode_ppm(data)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, f"out.{image_format}")
+        for _ in range(runs):
+            start = time.perf_counter()
+            screenme.save_pixbuf(pixbuf, out, image_format, preset)
+            times.append((time.perf_counter() - start) * 1000)
+        size = os.path.getsize(out)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "encode_ms": statistics.median(times),
+        "peak_rss_kb": peak,
+        "peak_delta_kb": peak - rss_before,
+        "size_bytes": size,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs", type=int, default=3)
+    parser.add_argument("--4k", dest="uhd", action="store_true", help="usar fotogramas 3840x2160")
+    parser.add_argument("--json", action="store_true", help="salida en JSON lines")
+    parser.add_argument("--case", nargs=3, metavar=("PPM", "FORMAT", "PRESET"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(*args.case, args.runs)
+        return
+
+    sys.path.insert(0, SCREENME_DIR)
+    import screenme
+
+    width, height = (3840, 2160) if args.uhd else (1920, 1080)
+    formats = screenme.writable_formats()
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.json:
+            print(f"{'fotograma':<10} {'formato':<7} {'preset':<9} {'ms':>9} {'pico MiB':>9} {'KiB':>10}")
+        for kind in ("desktop", "gradient", "noise"):
+            path = os.path.join(tmp, f"{kind}.ppm")
+            with open(path, "wb") as f:
+                f.write(make_frame(kind, width, height))
+            for image_format in formats:
+                for preset in screenme.PRESETS:
+                    out = subprocess.run(
+                        [sys.executable, __file__, "-n", str(args.runs), "--case", path, image_format, preset],
+                        check=True, capture_output=True, text=True,
+                    ).stdout
+                    result = json.loads(out)
+                    result.update(frame=kind, width=width, height=height, format=image_format, preset=preset)
+                    if args.json:
+                        print(json.dumps(result))
+                    else:
+                        print(
+                            f"{kind:<10} {image_format:<7} {preset:<9} {result['encode_ms']:9.1f} "
+                            f"{result['peak_delta_kb'] / 1024:9.1f} {result['size_bytes'] / 1024:10.1f}"
+                        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Compara la latencia de arranque en frío de Screenme.py con la del camino
+caliente (orden enviada a una instancia residente).
+
+Los dos caminos se miden hasta el mismo punto, el primer fotograma pintado:
+en frío el proceso sale tras pintarlo (--exit-when-ready) y la instancia
+residente contesta a "show" justo después. Necesita una sesión gráfica. Uso:
+    python3 benchmarks/screenme_startup.py [-n 10]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCREENME = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "src", "Screenme.py", "screenme.py", "screenme.py"
+)
+
+
+def timed_run(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, SCREENME, *args], check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def wait_for_instance(timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if subprocess.run([sys.executable, SCREENME, "ping"], stderr=subprocess.DEVNULL).returncode == 0:
+            return
+        time.sleep(0.05)
+    raise SystemExit("la instancia residente no respondió a tiempo")
+
+
+def summary(name, samples):
+    print(
+        f"{name:<34} mediana {statistics.median(samples):8.1f} ms   "
+        f"mín {min(samples):8.1f} ms   máx {max(samples):8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    if subprocess.run([sys.executable, SCREENME, "ping"], stderr=subprocess.DEVNULL).returncode == 0:
+        raise SystemExit("ya hay una instancia residente; ciérrala con 'screenme.py quit' antes de medir")
+
+    # Frío: importar gi, parsear el CSS, construir todos los widgets y pintar
+    cold = [timed_run(["--exit-when-ready"]) for _ in range(args.runs)]
+
+    # Caliente: el cliente solo habla con el socket, sin cargar GTK
+    daemon = subprocess.Popen([sys.executable, SCREENME, "--resident"])
+    try:
+        wait_for_instance()
+        warm = [timed_run(["ping"]) for _ in range(args.runs)]
+        show = []
+        for _ in range(args.runs):
+            show.append(timed_run(["show"]))
+            timed_run(["hide"])
+    finally:
+        subprocess.run([sys.executable, SCREENME, "quit"])
+        daemon.wait(timeout=5)
+
+    summary("frío (primer fotograma)", cold)
+    summary("caliente (ping)", warm)
+    summary("caliente (show, primer fotograma)", show)
+    print(f"aceleración mediana: x{statistics.median(cold) / statistics.median(show):.1f}")
+
+
+if __name__ == "__main__":
+    main()
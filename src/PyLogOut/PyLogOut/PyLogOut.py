@@ -1,24 +1,273 @@
 #!/usr/bin/env python3
 
-import gi
-import subprocess
+import argparse
 import os
+import sys
+
+# Paquete común somepyapps, en src/ junto a las aplicaciones
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from somepyapps import control, trace
+
+# Socket de control de la instancia residente
+SOCKET_PATH = control.socket_path("pylogout")
+COMMANDS = ("ping", "show", "hide", "toggle", "trace", "quit")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="PyLogOut.py")
+    parser.add_argument("command", nargs="?", choices=COMMANDS, help="orden para la instancia residente")
+    parser.add_argument("--resident", action="store_true", help="construir la ventana oculta y quedarse en segundo plano")
+    parser.add_argument("--exit-when-shown", action="store_true", help="salir tras pintar el primer fotograma (medición)")
+    parser.add_argument("--trace", metavar="FICHERO", help="guardar los tiempos de cada fase (.json: formato Chrome)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    ARGS = parse_args(sys.argv[1:])
+    # Con una instancia residente basta con pasarle la orden, sin cargar GTK.
+    # Una invocación sin orden alterna la ventana.
+    if not ARGS.exit_when_shown:
+        reply = control.send_command(SOCKET_PATH, "ping" if ARGS.resident else ARGS.command or "toggle")
+        if reply is not None:
+            if not reply.startswith("ok"):
+                print(reply, file=sys.stderr)
+                sys.exit(1)
+            if reply[2:].strip():
+                print(reply[2:].strip())
+            sys.exit(0)
+        if ARGS.command == "ping":
+            print("No hay ninguna instancia residente", file=sys.stderr)
+            sys.exit(1)
+    if ARGS.trace:
+        trace.enable(ARGS.trace)
+
+import gi
+import signal
+import time
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk, GLib
+from gi.repository import Gtk, Gdk, Gio, GLib
+from somepyapps import theme
+from somepyapps.power import ACTIONS, hooks_for, load_hooks
+
+# Reglas propias de PyLogOut, sobre las comunes de somepyapps.theme
+STYLE = """
+button {{
+    font-size: 200px;
+    color: white;
+    background-color: {base};
+    border-radius: 20px;
+    border-width: 3px;
+    border-color: {red};
+    padding: 20px;
+    margin: 10px;
+}}
+button:hover {{
+    background-color: {surface1};
+}}
+window {{
+    background-color: rgba(0, 0, 0, 0);
+}}
+.status {{
+    font-size: 24px;
+    color: {text};
+}}
+"""
+
+
+class ActionEngine:
+    """Ejecuta una acción de energía sin bloquear el hilo de GTK.
+
+    Primero lanza en paralelo los ganchos configurados en HOOKS_PATH (sync,
+    guardar sesiones, parar grabaciones...) con un único plazo global: los que
+    no hayan terminado a tiempo se matan y se sigue adelante. Después llama a
+    logind por D-Bus (bus del sistema, o el de sesión con PYLOGOUT_BUS=session
+    para probar con un sustituto) y, si falla, a la orden de reserva.
+    on_status(texto) informa del progreso y on_done(ok, mensaje) del final.
+    """
+
+    def __init__(self, on_status, on_done, config=None):
+        self.config = config or load_hooks()
+        self.deadline = self.config.get("deadline", 10)
+        self.on_status = on_status
+        self.on_done = on_done
+        self.busy = False
+        self.action = None
+        self.pending = {}
+        self.failed = []
+        self.late = []
+        self.deadline_source = None
+        self.cancellable = None
+        self.started = None  # instante monótono de cada fase, para las trazas
+        self.phase = None
+
+    def run(self, action):
+        if self.busy:
+            return
+        self.busy = True
+        self.action = action
+        self.started = self.phase = time.monotonic()
+        self.pending, self.failed, self.late = {}, [], []
+        self.cancellable = Gio.Cancellable()
+        for command in hooks_for(action, self.config):
+            try:
+                process = Gio.Subprocess.new(
+                    ["sh", "-c", command], Gio.SubprocessFlags.STDOUT_SILENCE | Gio.SubprocessFlags.STDERR_SILENCE
+                )
+            except GLib.Error:
+                self.failed.append(command)
+                continue
+            self.pending[process] = command
+            process.wait_async(self.cancellable, self.on_hook_done, command)
+        if not self.pending:
+            self.perform()
+            return
+        self.on_status(f"Esperando a {len(self.pending)} ganchos...")
+        self.deadline_source = GLib.timeout_add(int(self.deadline * 1000), self.on_deadline)
+
+    def on_hook_done(self, process, result, command):
+        try:
+            process.wait_finish(result)
+        except GLib.Error:
+            return  # Cancelado al vencer el plazo
+        if self.pending.pop(process, None) is None:
+            return
+        if not process.get_successful():
+            self.failed.append(command)
+        if not self.pending:
+            GLib.source_remove(self.deadline_source)
+            self.deadline_source = None
+            self.perform()
+
+    def on_deadline(self):
+        self.deadline_source = None
+        self.late = list(self.pending.values())
+        for process in self.pending:
+            process.force_exit()
+        self.pending = {}
+        self.cancellable.cancel()
+        self.perform()
+        return False
+
+    def perform(self):
+        trace.record("hooks", self.phase, cat="power", action=self.action, failed=len(self.failed), late=len(self.late))
+        self.phase = time.monotonic()
+        self.on_status(f"{ACTIONS[self.action]['label']}...")
+        if ACTIONS[self.action]["method"] is None:
+            self.fallback()
+            return
+        bus_type = Gio.BusType.SESSION if os.environ.get("PYLOGOUT_BUS") == "session" else Gio.BusType.SYSTEM
+        Gio.bus_get(bus_type, None, self.on_bus)
+
+    def on_bus(self, source, result):
+        try:
+            bus = Gio.bus_get_finish(result)
+        except GLib.Error as e:
+            self.fallback(e.message)
+            return
+        bus.call(
+            "org.freedesktop.login1", "/org/freedesktop/login1", "org.freedesktop.login1.Manager",
+            ACTIONS[self.action]["method"], GLib.Variant("(b)", (True,)), None,
+            Gio.DBusCallFlags.ALLOW_INTERACTIVE_AUTHORIZATION, 30000, None, self.on_called,
+        )
+
+    def on_called(self, bus, result):
+        try:
+            bus.call_finish(result)
+        except GLib.Error as e:
+            self.fallback(e.message)
+            return
+        trace.record("logind", self.phase, cat="power", action=self.action)
+        self.finish(True, "")
+
+    def fallback(self, reason=None):
+        if reason:
+            trace.record("logind", self.phase, cat="power", action=self.action, error=reason)
+        self.phase = time.monotonic()
+        cmd = ACTIONS[self.action]["fallback"]
+        try:
+            process = Gio.Subprocess.new(cmd, Gio.SubprocessFlags.STDOUT_SILENCE | Gio.SubprocessFlags.STDERR_PIPE)
+        except GLib.Error as e:
+            self.finish(False, f"{reason}\n{e.message}" if reason else e.message)
+            return
+        process.communicate_utf8_async(None, None, self.on_fallback_done, reason)
+
+    def on_fallback_done(self, process, result, reason):
+        try:
+            _, _, stderr = process.communicate_utf8_finish(result)
+        except GLib.Error as e:
+            stderr = e.message
+        trace.record("fallback", self.phase, cat="power", action=self.action, ok=process.get_successful())
+        if process.get_successful():
+            self.finish(True, "")
+        else:
+            error = (stderr or "").strip() or f"{ACTIONS[self.action]['fallback'][0]} falló"
+            self.finish(False, f"{reason}\n{error}" if reason else error)
+
+    def finish(self, ok, message):
+        self.busy = False
+        trace.record("action", self.started, cat="power", action=self.action, ok=ok)
+        notes = []
+        if self.failed:
+            notes.append(f"Ganchos con error: {', '.join(self.failed)}")
+        if self.late:
+            notes.append(f"Ganchos sin terminar a tiempo: {', '.join(self.late)}")
+        self.on_done(ok, "\n".join(filter(None, [message, *notes])))
+
+
+class ControlServer:
+    """Escucha órdenes en SOCKET_PATH desde el bucle de GTK.
+
+    handler(orden, responder) puede contestar en el momento o más tarde, por
+    ejemplo cuando la ventana ya ha pintado su primer fotograma.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.sock = control.claim_socket(SOCKET_PATH)
+        if self.sock is not None:
+            GLib.io_add_watch(self.sock.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN, self.on_incoming)
+
+    def on_incoming(self, fd, condition):
+        try:
+            conn, _ = self.sock.accept()
+        except BlockingIOError:
+            return True
+        conn.settimeout(0.5)
+        try:
+            command = conn.recv(256).decode().strip()
+        except OSError:
+            conn.close()
+            return True
+        
+        def reply(text="ok"):
+            with conn:
+                try:
+                    conn.sendall(f"{text}\n".encode())
+                except OSError:
+                    pass
+        
+        self.handler(command, reply)
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            control.release_socket(self.sock, SOCKET_PATH)
+            self.sock = None
+
 
 class LogoutMenu(Gtk.Window):
-    def __init__(self):
+    def __init__(self, resident=False):
         super().__init__(title="Menú de Logout")
         self.set_wmclass("PyLogOut", "Logout Menu")
+        self.resident = resident
         
-        # Configurar para pantalla completa en Hyprland
-        self.set_default_size(1920, 1080)
-        self.fullscreen()
+        # Pantalla completa en el monitor donde está el puntero, con su tamaño real
+        self.place_on_current_monitor()
         
-        # Configurar el color de fondo principal #1e1e2e
+        # Configurar el color de fondo principal (base de la paleta)
         bg_color = Gdk.RGBA()
-        bg_color.parse("#1e1e2e")
+        bg_color.parse(theme.COLORS["base"])
         self.override_background_color(Gtk.StateFlags.NORMAL, bg_color)
         
         # Crear un grid 2x2 para los botones
@@ -31,32 +280,8 @@ class LogoutMenu(Gtk.Window):
         grid.set_margin_end(10)
         self.add(grid)
         
-        # Estilo CSS para los botones con fondo #1e1e2e
-        css_provider = Gtk.CssProvider()
-        css = """
-        button {
-            font-size: 200px;
-            color: white;
-            background-color: #1e1e2e;
-            border-radius: 20px;
-            border-width: 3px;
-            border-color: #f38ba8;
-            padding: 20px;
-            margin: 10px;
-        }
-        button:hover {
-            background-color: #45475a;
-        }
-        window {
-            background-color: rgba(0, 0, 0, 0);
-        }
-        """
-        css_provider.load_from_data(css.encode())
-        Gtk.StyleContext.add_provider_for_screen(
-            Gdk.Screen.get_default(),
-            css_provider,
-            Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
-        )
+        # Estilo CSS para los botones con fondo base
+        theme.apply(STYLE)
         
         # Botón de Logout
         btn_logout = Gtk.Button(label="󰍃")
@@ -88,39 +313,169 @@ class LogoutMenu(Gtk.Window):
         grid.attach(btn_reboot, 0, 1, 1, 1)
         grid.attach(btn_suspend, 1, 1, 1, 1)
         
+        # Progreso de los ganchos y errores de la acción
+        self.status_label = Gtk.Label()
+        self.status_label.get_style_context().add_class("status")
+        self.status_label.set_no_show_all(True)
+        grid.attach(self.status_label, 0, 2, 2, 1)
+        self.grid = grid
+        self.engine = ActionEngine(self.on_action_status, self.on_action_done)
+        
         # Conectar tecla Escape para cerrar
         self.connect("key-press-event", self.on_key_press)
+        self.connect("delete-event", self.on_delete)
         
-    def on_key_press(self, widget, event):
-        # Cerrar con Escape
-        if event.keyval == Gdk.KEY_Escape:
+    def current_monitor(self):
+        display = Gdk.Display.get_default()
+        monitor = None
+        seat = display.get_default_seat()
+        if seat and seat.get_pointer():
+            _, x, y = seat.get_pointer().get_position()
+            monitor = display.get_monitor_at_point(x, y)
+        return monitor or display.get_primary_monitor() or display.get_monitor(0)
+    
+    def place_on_current_monitor(self):
+        display = Gdk.Display.get_default()
+        monitor = self.current_monitor()
+        geometry = monitor.get_geometry()
+        self.set_default_size(geometry.width, geometry.height)
+        self.resize(geometry.width, geometry.height)
+        for index in range(display.get_n_monitors()):
+            if display.get_monitor(index) == monitor:
+                self.fullscreen_on_monitor(self.get_screen(), index)
+                return
+        self.fullscreen()
+    
+    def present_menu(self, on_first_frame=None):
+        """Muestra la ventana ya construida y avisa cuando se ha pintado el primer fotograma."""
+        if self.get_visible():
+            if on_first_frame:
+                on_first_frame()
+            return
+        start = time.monotonic()
+        self.place_on_current_monitor()
+        self.status_label.hide()
+        for child in self.grid.get_children():
+            child.set_sensitive(True)
+        if on_first_frame:
+            def after_paint(clock):
+                clock.disconnect(handler)
+                trace.record("show", start, cat="pylogout")
+                on_first_frame()
+            
+            self.realize()
+            clock = self.get_frame_clock()
+            handler = clock.connect("after-paint", after_paint)
+        self.present()
+    
+    def dismiss(self):
+        # La instancia residente solo oculta la ventana para reutilizarla
+        if self.resident:
+            self.hide()
+        else:
             self.close()
     
+    def toggle(self):
+        # Como con Escape, el menú no se oculta con una acción en curso
+        if self.get_visible():
+            if not self.engine.busy:
+                self.dismiss()
+        else:
+            self.present_menu()
+        return True  # Mantiene el manejador de SIGUSR1
+    
+    def handle_command(self, command, reply):
+        if command == "ping":
+            reply()
+        elif command == "show":
+            self.present_menu(reply)
+        elif command in ("hide", "toggle") and self.engine.busy:
+            # Como con Escape: ocultarlo dejaría lanzar otra acción mientras sigue esta
+            reply("hay una acción en curso")
+        elif command == "hide":
+            self.hide()
+            reply()
+        elif command == "toggle":
+            if self.get_visible():
+                self.hide()
+                reply()
+            else:
+                self.present_menu(reply)
+        elif command == "trace":
+            if trace.enabled:
+                reply(f"ok {trace.dump()}")
+            else:
+                reply("trazas desactivadas: arranca con --trace FICHERO o SOMEPYAPPS_TRACE")
+        elif command == "quit":
+            reply()
+            Gtk.main_quit()
+        else:
+            reply(f"orden desconocida: {command}")
+    
+    def on_delete(self, window, event):
+        if self.engine.busy:
+            return True
+        if self.resident:
+            self.hide()
+            return True
+        return False
+    
+    def on_key_press(self, widget, event):
+        # Cerrar con Escape, salvo con una acción en curso
+        if event.keyval == Gdk.KEY_Escape and not self.engine.busy:
+            self.dismiss()
+    
     def on_logout_clicked(self, button):
-        # Comando para cerrar sesión en Hyprland
-        subprocess.run(["hyprctl", "dispatch", "exit"])
-        self.close()
+        self.run_action("logout")
     
     def on_poweroff_clicked(self, button):
-        # Comando para apagar
-        subprocess.run(["poweroff"])
-        self.close()
+        self.run_action("poweroff")
     
     def on_reboot_clicked(self, button):
-        # Comando para reiniciar
-        subprocess.run(["reboot"])
-        self.close()
+        self.run_action("reboot")
     
     def on_suspend_clicked(self, button):
-        # Comando para suspender
-        subprocess.run(["suspend"])
-        self.close()
+        self.run_action("suspend")
+    
+    def run_action(self, action):
+        # Los botones quedan inactivos, pero la ventana sigue respondiendo
+        for child in self.grid.get_children():
+            if isinstance(child, Gtk.Button):
+                child.set_sensitive(False)
+        self.engine.run(action)
+    
+    def on_action_status(self, text):
+        self.status_label.set_text(text)
+        self.status_label.show()
+    
+    def on_action_done(self, ok, message):
+        if ok:
+            if message:
+                print(message, file=sys.stderr)
+            self.dismiss()
+            return
+        for child in self.grid.get_children():
+            child.set_sensitive(True)
+        self.on_action_status(f"Error: {message}")
 
-def main():
-    win = LogoutMenu()
+def main(args):
+    win = LogoutMenu(resident=args.resident)
     win.connect("destroy", Gtk.main_quit)
-    win.show_all()
-    Gtk.main()
+    server = ControlServer(win.handle_command)
+    GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGUSR1, win.toggle)
+    if args.resident:
+        # Todo construido y realizado, pero oculto hasta la primera orden
+        win.get_child().show_all()
+        win.realize()
+    elif args.exit_when_shown:
+        win.get_child().show_all()
+        win.present_menu(Gtk.main_quit)
+    else:
+        win.show_all()
+    try:
+        Gtk.main()
+    finally:
+        server.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(ARGS)
\ No newline at end of file
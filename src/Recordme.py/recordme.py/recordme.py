@@ -1,33 +1,872 @@
 import gi
+import collections
+import csv
+import math
+import os
+import queue
+import re
+import shutil
 import subprocess
 import signal
-from datetime import datetime
+import sys
+import tempfile
+import threading
+import time
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk, GLib, Pango
+from gi.repository import Gtk, GLib, Pango
+
+# Shared somepyapps package, in src/ next to the apps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from somepyapps import theme, trace
+from somepyapps.outputs import OutputError, output_provider
+from somepyapps.record import (
+    CONTAINERS, GEOMETRY_RE, INT_TIMEOUT, POST_STEPS, PROFILES, STAGING_MIN_SECONDS, STAGING_RESERVE_SECONDS,
+    TERM_TIMEOUT, GeometryCache, check_finished, concat_entry, default_filename, default_staging_dir, encoder_args,
+    staging_headroom, stop_signals, with_container,
+)
+
+SEGMENT_RE = re.compile(r"^seg_(\d+)\.ts$")
+
+
+def select_region(on_done):
+    """Runs slurp without blocking the main loop. on_done(geometry, error) gets one of the two."""
+    started = time.monotonic()
+    try:
+        process = subprocess.Popen(["slurp"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except FileNotFoundError:
+        on_done(None, "slurp is not installed")
+        return
+    
+    def finished(pid, status):
+        trace.record("slurp", started, cat="record")
+        geometry = process.stdout.read().strip()
+        error = process.stderr.read().strip()
+        process.stdout.close()
+        process.stderr.close()
+        if os.waitstatus_to_exitcode(status) == 0 and GEOMETRY_RE.match(geometry):
+            on_done(geometry, None)
+        else:
+            on_done(None, error or "Selection cancelled")
+    
+    GLib.child_watch_add(GLib.PRIORITY_DEFAULT, process.pid, finished)
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+FPS_RE = re.compile(r"fps[=:\s]+([\d.]+)", re.IGNORECASE)
+FRAME_RE = re.compile(r"frame[=:\s]+(\d+)", re.IGNORECASE)
+# Cumulative count in ffmpeg-style progress ("drop=3"); wf-recorder builds without it never report one
+DROP_RE = re.compile(r"\bdrop(?:ped)?[=:\s]+(\d+)", re.IGNORECASE)
+METRICS_FIELDS = ("t", "cpu_percent", "rss_kb", "bitrate_kbps", "size_bytes", "fps", "frames", "dropped")
+
+
+class RecordingMonitor:
+    """Live health of a running wf-recorder: its stderr, CPU, RSS and output bitrate.
+
+    stderr is drained from a GLib IO watch so the child never blocks on a full
+    pipe, and /proc plus the output size are sampled once per interval. Each
+    sample goes to on_sample and, if metrics_path is set, to a CSV file.
+    """
+
+    def __init__(self, process, filename, on_sample, metrics_path=None, interval=1):
+        self.process = process
+        self.filename = filename
+        self.on_sample = on_sample
+        self.fps = None
+        self.frames = None
+        self.dropped = None
+        self.last_message = ""
+        self.pending = b""
+        self.started = self.last_time = time.monotonic()
+        self.last_ticks = None
+        self.last_size = 0
+        self.metrics_file = None
+        if metrics_path:
+            # Appended to, so every segment of a paused recording lands in one file
+            self.metrics_file = open(metrics_path, "a", newline="")
+            self.metrics = csv.DictWriter(self.metrics_file, METRICS_FIELDS)
+            if self.metrics_file.tell() == 0:
+                self.metrics.writeheader()
+        
+        os.set_blocking(process.stderr.fileno(), False)
+        self.io_source = GLib.io_add_watch(
+            process.stderr.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self.on_stderr
+        )
+        self.timer = GLib.timeout_add_seconds(interval, self.sample)
+
+    def on_stderr(self, fd, condition):
+        try:
+            chunk = os.read(fd, 65536)
+        except BlockingIOError:
+            return True
+        if not chunk:
+            self.process.stderr.close()
+            self.io_source = None
+            return False
+        # Progress lines are usually redrawn with \r
+        *lines, self.pending = re.split(rb"[\r\n]", self.pending + chunk)
+        for line in lines:
+            self.parse(line.decode(errors="replace").strip())
+        return True
+
+    def parse(self, line):
+        if not line:
+            return
+        self.last_message = line
+        match = FPS_RE.search(line)
+        if match:
+            self.fps = float(match.group(1))
+        match = FRAME_RE.search(line)
+        if match:
+            self.frames = int(match.group(1))
+        match = DROP_RE.search(line)
+        if match:
+            self.dropped = int(match.group(1))
+
+    def read_proc(self):
+        """CPU ticks (user + system) and RSS in kB of the child."""
+        with open(f"/proc/{self.process.pid}/stat") as f:
+            # Fields after the command name, which may itself contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])
+        rss = 0
+        with open(f"/proc/{self.process.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+                    break
+        return ticks, rss
+
+    def sample(self):
+        now = time.monotonic()
+        elapsed = now - self.last_time
+        try:
+            ticks, rss = self.read_proc()
+        except (FileNotFoundError, ProcessLookupError, IndexError):
+            ticks, rss = self.last_ticks, 0
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:
+            size = self.last_size
+        
+        cpu = 0.0
+        if self.last_ticks is not None and ticks is not None and elapsed > 0:
+            cpu = (ticks - self.last_ticks) / CLOCK_TICKS / elapsed * 100
+        bitrate = (size - self.last_size) * 8 / elapsed / 1000 if elapsed > 0 else 0.0
+        self.last_time, self.last_ticks, self.last_size = now, ticks, size
+        
+        sample = {
+            "t": round(now - self.started, 1),
+            "cpu_percent": round(cpu, 1),
+            "rss_kb": rss,
+            "bitrate_kbps": round(bitrate, 1),
+            "size_bytes": size,
+            "fps": self.fps,
+            "frames": self.frames,
+            "dropped": self.dropped,
+        }
+        if self.metrics_file:
+            self.metrics.writerow(sample)
+            self.metrics_file.flush()
+        self.on_sample(sample)
+        return True
+
+    def stop(self):
+        """Stop sampling. stderr keeps being drained until the child closes it."""
+        if self.timer is not None:
+            GLib.source_remove(self.timer)
+            self.timer = None
+        if self.metrics_file:
+            self.metrics_file.close()
+            self.metrics_file = None
+
+
+class RecorderProcess:
+    """Lifecycle of one wf-recorder child: starting, recording, finalizing, then done or failed.
+
+    The child is reaped with GLib.child_watch_add, so nothing blocks the main
+    loop. stop() follows somepyapps.record.stop_signals: SIGINT so wf-recorder
+    writes the container trailer, then SIGTERM and SIGKILL if it misses the
+    deadlines. The outcome is judged by check_finished, as in record(). Only one
+    recorder can be active at a time, so two encoders never write at once.
+    on_state(recorder) runs after every state change. Only GLib is used, so
+    the lifecycle runs under a plain GLib.MainLoop without a display.
+    """
+
+    active = None
+
+    def __init__(self, cmd, filename, on_state, int_timeout=INT_TIMEOUT, term_timeout=TERM_TIMEOUT, start_timeout=2):
+        self.cmd = cmd
+        self.filename = filename
+        self.on_state = on_state
+        self.stop_signals = stop_signals(int_timeout, term_timeout)
+        self.start_timeout = start_timeout
+        self.state = "idle"
+        self.error = None
+        self.process = None
+        self.signals_sent = []
+        self.escalation = None
+        self.poll_source = None
+        self.started = None
+        self.stopped = None
+
+    def set_state(self, state):
+        self.state = state
+        self.on_state(self)
+
+    def start(self):
+        """Spawn wf-recorder. Raises FileNotFoundError if it is not installed."""
+        if RecorderProcess.active is not None:
+            raise RuntimeError("another recording is still active")
+        self.process = subprocess.Popen(self.cmd, stderr=subprocess.PIPE)
+        RecorderProcess.active = self
+        self.started = time.monotonic()
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, self.process.pid, self.on_exit)
+        self.poll_source = GLib.timeout_add(100, self.check_started)
+        self.set_state("starting")
+
+    def check_started(self):
+        # Recording once output is flowing, or once the child survived start_timeout
+        try:
+            writing = os.path.getsize(self.filename) > 0
+        except OSError:
+            writing = False
+        if writing or time.monotonic() - self.started > self.start_timeout:
+            trace.record("spawn", self.started, cat="record", writing=writing)
+            self.poll_source = None
+            self.set_state("recording")
+            return False
+        return True
+
+    def stop(self):
+        if self.state not in ("starting", "recording"):
+            return
+        self.remove_sources()
+        self.stopped = time.monotonic()
+        self.escalate(0)
+        self.set_state("finalizing")
+
+    def send(self, sig):
+        # os.kill rather than Popen.send_signal, which polls and could reap the child behind GLib's back
+        try:
+            os.kill(self.process.pid, sig)
+        except ProcessLookupError:
+            return  # Already exited; on_exit runs as soon as GLib reaps it
+        self.signals_sent.append(sig.name)
+
+    def escalate(self, step):
+        self.escalation = None
+        sig, timeout = self.stop_signals[step]
+        self.send(sig)
+        if timeout is not None:
+            self.escalation = GLib.timeout_add_seconds(timeout, self.escalate, step + 1)
+        return False
+
+    def remove_sources(self):
+        for source in (self.escalation, self.poll_source):
+            if source is not None:
+                GLib.source_remove(source)
+        self.escalation = self.poll_source = None
+
+    def on_exit(self, pid, status):
+        self.remove_sources()
+        # GLib reaped the child; tell Popen so it does not try again
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+        RecorderProcess.active = None
+        if self.stopped is not None:
+            trace.record("stop", self.stopped, cat="record", signals=self.signals_sent)
+        
+        self.error = check_finished(
+            self.filename, self.state == "finalizing", self.process.returncode, self.signals_sent
+        )
+        self.set_state("failed" if self.error else "done")
+
+
+class RecordingSession:
+    """A recording made of one wf-recorder segment per stretch between pauses.
+
+    Segments go to a hidden session directory next to filename. pause() lets
+    the current segment finalize and resume() starts the next one. stop() joins
+    them into filename with ffmpeg's concat demuxer (stream copy, no re-encode),
+    or just renames a lone segment. States: starting, recording, pausing,
+    paused, finalizing, joining, then done or failed. on_state(session) runs
+    after every change. On failure the segments are left in the session
+    directory so nothing recorded is lost.
+    """
+
+    def __init__(self, filename, make_cmd, on_state):
+        self.filename = filename
+        self.make_cmd = make_cmd
+        self.on_state = on_state
+        self.container = os.path.splitext(filename)[1].lstrip(".") or "mkv"
+        self.directory = tempfile.mkdtemp(prefix=".recordme-", dir=os.path.dirname(os.path.abspath(filename)))
+        self.segments = []
+        self.recorder = None
+        self.duration = 0.0
+        self.state = "idle"
+        self.error = None
+        self.pause_wanted = False
+
+    def set_state(self, state):
+        self.state = state
+        self.on_state(self)
+
+    def start(self):
+        """Start the next segment. Raises FileNotFoundError if wf-recorder is not installed
+        and RuntimeError if another encoder is still active."""
+        path = os.path.join(self.directory, f"part_{len(self.segments):03d}.{self.container}")
+        self.recorder = RecorderProcess(self.make_cmd(path), path, self.on_recorder_state)
+        try:
+            self.recorder.start()
+        except (FileNotFoundError, RuntimeError):
+            if not self.segments:
+                shutil.rmtree(self.directory, ignore_errors=True)
+            raise
+
+    def pause(self):
+        if self.state == "recording":
+            self.pause_wanted = True
+            self.recorder.stop()
+
+    def resume(self):
+        if self.state == "paused":
+            self.start()
+
+    def stop(self):
+        if self.state in ("starting", "recording"):
+            self.pause_wanted = False
+            self.recorder.stop()
+        elif self.state == "paused":
+            self.join()
+
+    def on_recorder_state(self, recorder):
+        if recorder.state in ("starting", "recording"):
+            self.set_state(recorder.state)
+        elif recorder.state == "finalizing":
+            self.set_state("pausing" if self.pause_wanted else "finalizing")
+        elif recorder.state == "done":
+            self.segments.append(recorder.filename)
+            self.duration += recorder.stopped - recorder.started
+            if self.pause_wanted:
+                self.pause_wanted = False
+                self.set_state("paused")
+            else:
+                self.join()
+        elif recorder.state == "failed":
+            self.error = recorder.error
+            if self.segments:
+                self.error += f" (earlier segments kept in {self.directory})"
+            self.set_state("failed")
+
+    def join(self):
+        if len(self.segments) == 1:
+            os.replace(self.segments[0], self.filename)
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.set_state("done")
+            return
+        
+        list_path = os.path.join(self.directory, "list.txt")
+        with open(list_path, "w") as f:
+            for path in self.segments:
+                f.write(concat_entry(path))
+        try:
+            process = subprocess.Popen(
+                [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", self.filename,
+                ],
+                stderr=subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            self.error = f"ffmpeg is needed to join the segments (kept in {self.directory})"
+            self.set_state("failed")
+            return
+        started = time.monotonic()
+        
+        def finished(pid, status):
+            trace.record("join", started, cat="record", segments=len(self.segments))
+            error = process.stderr.read().decode(errors="replace").strip()
+            process.stderr.close()
+            if os.waitstatus_to_exitcode(status) == 0:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                self.set_state("done")
+            else:
+                self.error = f"{error or 'ffmpeg failed'} (segments kept in {self.directory})"
+                self.set_state("failed")
+        
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, process.pid, finished)
+        self.set_state("joining")
+
+
+class StagingFlusher:
+    """Moves staged recordings to their destination from a background thread.
+
+    Copies are throttled to rate bytes/s so a slow disk never sees a burst.
+    They go to a hidden .part file next to the destination, which is fsynced
+    and renamed into place, so the destination never holds a partial file.
+    Within one filesystem a rename is enough. on_done(source, destination,
+    error) runs on the GTK thread.
+    """
+
+    CHUNK = 1 << 20
+
+    def __init__(self, on_done, rate=None):
+        self.on_done = on_done
+        self.rate = rate
+        self.jobs = queue.Queue()
+        self.pending = 0
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, source, destination):
+        self.pending += 1
+        self.jobs.put((source, destination))
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            source, destination = job
+            try:
+                self.move(source, destination)
+                error = None
+            except OSError as e:
+                error = str(e)
+            GLib.idle_add(self.finished, source, destination, error)
+
+    def finished(self, source, destination, error):
+        self.pending -= 1
+        self.on_done(source, destination, error)
+        return False
+
+    def move(self, source, destination):
+        directory, name = os.path.split(os.path.abspath(destination))
+        if os.stat(source).st_dev == os.stat(directory).st_dev:
+            os.replace(source, destination)
+            return
+        part = os.path.join(directory, f".{name}.part")
+        try:
+            with open(source, "rb") as src, open(part, "wb") as dst:
+                started = time.monotonic()
+                copied = 0
+                while chunk := src.read(self.CHUNK):
+                    dst.write(chunk)
+                    copied += len(chunk)
+                    rate = self.rate
+                    if rate:
+                        ahead = copied / rate - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+                dst.flush()
+                os.fsync(dst.fileno())
+            shutil.copystat(source, part)
+            os.replace(part, destination)
+            trace.record("flush", started, cat="record", bytes=copied, rate=self.rate)
+        except BaseException:
+            try:
+                os.unlink(part)
+            except FileNotFoundError:
+                pass
+            raise
+        os.unlink(source)
+
+    def close(self):
+        """Finish the queued moves at full speed, so nothing is left behind in RAM on exit."""
+        self.rate = None
+        self.jobs.put(None)
+        self.thread.join()
+
+
+# Output position in ffmpeg's -progress lines
+OUT_TIME_RE = re.compile(r"^out_time_(?:us|ms)=(\d+)$")
+
+
+class PostJob:
+    def __init__(self, source, step, duration=None):
+        self.source = source
+        self.step = step
+        self.target = os.path.splitext(source)[0] + POST_STEPS[step]["suffix"]
+        self.duration = duration
+        self.state = "queued"
+        self.progress = 0.0
+        self.error = None
+        self.process = None
+        self.part = None
+        self.io_source = None
+        self.pending = b""
+        self.launched = None
+
+
+class PostProcessQueue:
+    """Runs ffmpeg post-processing jobs for finished recordings, a few at a time.
+
+    Jobs wait in a FIFO and at most max_jobs ffmpeg processes run at once, each
+    reniced so it never competes with a live recording. A burst of recordings
+    only grows the queue. Every job writes to a hidden .part file that is
+    renamed over the target only when ffmpeg succeeds. on_change(job) runs on
+    the main loop whenever a job starts, progresses or ends.
+    """
+
+    def __init__(self, on_change, max_jobs=1, niceness=10):
+        self.on_change = on_change
+        self.max_jobs = max(1, max_jobs)
+        self.niceness = niceness
+        self.pending = collections.deque()
+        self.running = []
+
+    def enqueue(self, source, steps, duration=None):
+        for step in steps:
+            job = PostJob(source, step, duration)
+            self.pending.append(job)
+            self.on_change(job)
+        self.pump()
+
+    def pump(self):
+        while self.pending and len(self.running) < self.max_jobs:
+            self.launch(self.pending.popleft())
+
+    def launch(self, job):
+        directory, name = os.path.split(job.target)
+        stem, ext = os.path.splitext(name)
+        job.part = os.path.join(directory, f".{stem}.part{ext}")
+        # Reniced through nice(1): a preexec_fn is not safe while other threads run
+        cmd = [
+            "nice", "-n", str(self.niceness),
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-progress", "pipe:1", "-y",
+            "-i", job.source, *POST_STEPS[job.step]["args"], job.part,
+        ]
+        try:
+            if shutil.which("ffmpeg") is None:
+                raise FileNotFoundError("ffmpeg")
+            job.process = subprocess.Popen(
+                cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            job.state, job.error = "failed", "ffmpeg is not installed"
+            self.on_change(job)
+            return
+        job.state = "running"
+        job.launched = time.monotonic()
+        self.running.append(job)
+        os.set_blocking(job.process.stdout.fileno(), False)
+        job.io_source = GLib.io_add_watch(
+            job.process.stdout.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+            self.on_progress, job,
+        )
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, job.process.pid, self.on_exit, job)
+        self.on_change(job)
+
+    def on_progress(self, fd, condition, job):
+        try:
+            chunk = os.read(fd, 65536)
+        except BlockingIOError:
+            return True
+        if not chunk:
+            job.io_source = None
+            return False
+        # A read can end mid-line; the tail waits for the next one
+        *lines, job.pending = (job.pending + chunk).split(b"\n")
+        for line in lines:
+            match = OUT_TIME_RE.match(line.decode(errors="replace").strip())
+            if match and job.duration:
+                job.progress = min(1.0, int(match.group(1)) / 1e6 / job.duration)
+        self.on_change(job)
+        return True
+
+    def on_exit(self, pid, status, job):
+        if job.io_source is not None:
+            GLib.source_remove(job.io_source)
+            job.io_source = None
+        job.process.returncode = os.waitstatus_to_exitcode(status)
+        error = job.process.stderr.read().decode(errors="replace").strip()
+        job.process.stdout.close()
+        job.process.stderr.close()
+        if job.state == "cancelled":
+            # shutdown() already dropped it and its .part file
+            return
+        self.running.remove(job)
+        trace.record("post", job.launched, cat="record", step=job.step, code=job.process.returncode)
+        
+        if job.process.returncode == 0 and os.path.exists(job.part):
+            os.replace(job.part, job.target)
+            job.state, job.progress = "done", 1.0
+        else:
+            self.discard_part(job)
+            job.state = "failed"
+            job.error = error.splitlines()[-1] if error else f"ffmpeg exited with code {job.process.returncode}"
+        self.on_change(job)
+        self.pump()
+
+    def discard_part(self, job):
+        try:
+            os.unlink(job.part)
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self):
+        """Drop queued jobs and stop the running ones, leaving no .part files behind.
+
+        Nothing waits here: the children stay owned by their GLib child
+        watches, which reap them as they exit.
+        """
+        self.pending.clear()
+        for job in self.running:
+            job.state = "cancelled"
+            try:
+                os.kill(job.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            # Unlinking is safe while ffmpeg still holds it open
+            self.discard_part(job)
+        self.running = []
+
+
+class ReplayBuffer:
+    """Keeps the last few seconds of screen in a ring of short MPEG-TS segments.
+
+    wf-recorder streams into ffmpeg's segment muxer (stream copy, no extra
+    encode) and old segments are deleted as new ones appear, so the disk
+    footprint stays bounded however long the buffer runs. Segments are cut on
+    keyframes, so their real length can exceed segment_seconds. If either
+    child dies without stop(), on_failed(error) runs and the segments stay on
+    disk for saving until the next start().
+    """
+
+    def __init__(self, directory, segment_seconds=10, keep_seconds=120, on_failed=None):
+        self.directory = directory
+        self.on_failed = on_failed
+        self.encoder_args = []
+        self.segment_seconds = segment_seconds
+        self.keep_seconds = keep_seconds
+        self.recorder = None
+        self.segmenter = None
+        self.prune_source = None
+        self.stopping = False
+        self.on_stopped = None
+
+    @property
+    def running(self):
+        return self.recorder is not None and not self.stopping
+
+    @property
+    def max_segments(self):
+        # Retained window plus the segment currently being written
+        return math.ceil(self.keep_seconds / self.segment_seconds) + 1
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if SEGMENT_RE.match(name):
+                os.unlink(os.path.join(self.directory, name))
+        
+        self.recorder = subprocess.Popen(
+            ["wf-recorder", *self.encoder_args, "-m", "mpegts", "-f", "pipe:1"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.segmenter = subprocess.Popen(
+                [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error",
+                    "-f", "mpegts", "-i", "pipe:0", "-c", "copy",
+                    "-f", "segment", "-segment_time", str(self.segment_seconds),
+                    "-segment_format", "mpegts",
+                    os.path.join(self.directory, "seg_%06d.ts"),
+                ],
+                stdin=self.recorder.stdout,
+            )
+        except FileNotFoundError:
+            self.recorder.kill()
+            self.recorder.wait()
+            self.recorder.stdout.close()
+            self.recorder = None
+            raise
+        finally:
+            if self.recorder:
+                self.recorder.stdout.close()  # Only ffmpeg reads the pipe
+        self.prune_source = GLib.timeout_add_seconds(1, self.prune)
+        children = [self.recorder, self.segmenter]
+        for process in children:
+            GLib.child_watch_add(GLib.PRIORITY_DEFAULT, process.pid, self.on_exit, process, children)
+
+    def stop(self, on_stopped=None):
+        """Asks wf-recorder to stop. on_stopped() runs once both children are reaped and the segments deleted."""
+        if not self.running:
+            return
+        GLib.source_remove(self.prune_source)
+        self.prune_source = None
+        self.stopping = True
+        self.on_stopped = on_stopped
+        # ffmpeg finishes on its own once wf-recorder closes the pipe
+        try:
+            os.kill(self.recorder.pid, signal.SIGINT)
+        except ProcessLookupError:
+            pass  # Already gone; its child watch has not run yet
+
+    def on_exit(self, pid, status, process, children):
+        # GLib reaped the child; tell Popen so it does not try again
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if any(child.returncode is None for child in children) or self.recorder is not children[0]:
+            return
+        if self.prune_source is not None:
+            GLib.source_remove(self.prune_source)
+            self.prune_source = None
+        self.recorder = self.segmenter = None
+        if not self.stopping:
+            # An unexpected exit keeps the segments, so they can still be saved
+            if self.on_failed:
+                self.on_failed(", ".join(
+                    f"{child.args[0]} exited with code {child.returncode}" for child in children if child.returncode
+                ) or "wf-recorder stopped")
+            return
+        for path in self.segments():
+            os.unlink(path)
+        self.stopping = False
+        on_stopped, self.on_stopped = self.on_stopped, None
+        if on_stopped:
+            on_stopped()
+
+    def segments(self):
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_RE.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return [path for _, path in sorted(found)]
+
+    def prune(self):
+        for path in self.segments()[: -self.max_segments]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def disk_usage(self):
+        return sum(os.path.getsize(path) for path in self.segments())
+
+    def save(self, seconds, filename, on_done):
+        """Concatenates the segments covering the last `seconds` into filename without re-encoding.
+
+        The segments are hard-linked into a scratch directory first, so pruning
+        can carry on while ffmpeg reads them. on_done(ok, message) runs on the
+        GTK thread when ffmpeg exits.
+        """
+        wanted = self.segments()[-(math.ceil(seconds / self.segment_seconds) + 1):]
+        if not wanted:
+            on_done(False, "The replay buffer is still empty")
+            return
+        scratch = tempfile.mkdtemp(prefix="save_", dir=self.directory)
+        with open(os.path.join(scratch, "list.txt"), "w") as f:
+            for i, path in enumerate(wanted):
+                link = os.path.join(scratch, f"{i:06d}.ts")
+                os.link(path, link)
+                f.write(concat_entry(link))
+        
+        process = subprocess.Popen(
+            [
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                "-f", "concat", "-safe", "0", "-i", os.path.join(scratch, "list.txt"),
+                "-c", "copy", filename,
+            ],
+            stderr=subprocess.PIPE,
+        )
+        
+        def finished(pid, status):
+            shutil.rmtree(scratch, ignore_errors=True)
+            error = process.stderr.read().decode(errors="replace").strip()
+            process.stderr.close()
+            if os.waitstatus_to_exitcode(status) == 0:
+                on_done(True, filename)
+            else:
+                on_done(False, error or "ffmpeg failed")
+        
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, process.pid, finished)
+
+
+# Recordme's own rules, on top of the shared ones in somepyapps.theme
+STYLE = """
+.window {{
+    box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.2);
+}}
+
+.file-frame {{
+    background-color: {mantle};
+    border-radius: 8px;
+    border: 1px solid {border};
+}}
+
+.file-entry {{
+    background-color: {input_bg};
+    color: {text};
+    border-radius: 6px;
+    padding: 6px;
+    border: 1px solid {crust};
+}}
+
+.file-entry:focus {{
+    border-color: {green};
+}}
+
+.record-button {{
+    background-color: {mantle};
+    color: {text};
+    border: 2px solid {green};
+    border-radius: 10px;
+    padding: 12px 24px;
+    font-weight: bold;
+    font-size: 1.1em;
+    transition: all 0.2s ease;
+}}
+
+.record-button:hover {{
+    background-color: {crust};
+    border-color: {lavender};
+}}
+
+.status-label {{
+    font-size: 0.95em;
+}}
+"""
+
 
 class MochaRecorder:
     def __init__(self):
-        self.process = None
+        self.session = None
+        self.monitor = None
+        self.profile = "default"
+        self.container = "mkv"
+        self.replay = ReplayBuffer(
+            os.path.join(GLib.get_user_cache_dir(), "recordme", "replay"), on_failed=self.on_replay_failed
+        )
+        self.post = PostProcessQueue(
+            self.on_post_change,
+            max_jobs=int(os.environ.get("RECORDME_POST_JOBS", "1")),
+            niceness=int(os.environ.get("RECORDME_POST_NICE", "10")),
+        )
+        self.post_failed = 0
+        self.staging_dir = default_staging_dir()
+        self.flusher = StagingFlusher(
+            self.on_flushed, rate=float(os.environ.get("RECORDME_FLUSH_RATE", "32")) * (1 << 20)
+        )
+        self.destination = None
+        self.staged = {}
+        self.staging_stopped = False
+        self.outputs = output_provider("RECORDME")
+        self.geometries = GeometryCache()
+        self.selecting = False
+        self.closing = False
         
-        # Catppuccin Mocha palette
-        self.colors = {
-            "base": "#1e1e2e",          # Base
-            "mantle": "#181825",         # Mantle
-            "crust": "#11111b",          # Crust
-            "text": "#cdd6f4",           # Text
-            "subtext1": "#bac2de",       # Subtext1
-            "green": "#a6e3a1",          # Green
-            "blue": "#89b4fa",           # Blue
-            "lavender": "#b4befe",       # Lavender
-            "border": "#a6e3a1",         # Green border
-            "input_bg": "#313244",       # Input background
-        }
+        self.colors = theme.COLORS
         
         # Configure window
         self.window = Gtk.Window(title="☕ Mocha Recorder")
         self.window.set_default_size(320, 240)  # Increased for larger icons
         self.window.set_resizable(False)
+        self.window.connect("delete-event", self.on_delete)
+        self.window.connect("destroy", lambda window: self.replay.stop())
+        self.window.connect("destroy", lambda window: self.post.shutdown())
+        self.window.connect("destroy", lambda window: self.flusher.close())
         self.window.connect("destroy", Gtk.main_quit)
         
         # Apply CSS
@@ -68,6 +907,43 @@ class MochaRecorder:
         self.file_frame.add(self.file_box)
         self.box.pack_start(self.file_frame, False, False, 8)
         
+        # Encoding profile and container
+        self.profile_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.profile_combo = Gtk.ComboBoxText()
+        for name, profile in PROFILES.items():
+            self.profile_combo.append(name, profile["label"])
+        self.profile_combo.set_active_id(self.profile)
+        self.profile_combo.connect("changed", self.on_profile_changed)
+        self.container_combo = Gtk.ComboBoxText()
+        for container in CONTAINERS:
+            self.container_combo.append(container, container)
+        self.container_combo.set_active_id(self.container)
+        self.container_combo.connect("changed", self.on_container_changed)
+        self.profile_box.pack_start(self.profile_combo, True, True, 0)
+        self.profile_box.pack_start(self.container_combo, False, False, 0)
+        self.box.pack_start(self.profile_box, False, False, 0)
+        
+        self.cost_label = Gtk.Label()
+        self.cost_label.get_style_context().add_class("status-label")
+        self.box.pack_start(self.cost_label, False, False, 0)
+        self.on_profile_changed(self.profile_combo)
+        
+        # What to record: everything, one output, or a region
+        self.target_combo = Gtk.ComboBoxText()
+        self.target_combo.set_tooltip_text("Recording one output or a region saves most of the encode")
+        self.box.pack_start(self.target_combo, False, False, 0)
+        
+        self.name_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.geometry_name_entry = Gtk.Entry()
+        self.geometry_name_entry.set_placeholder_text("Name this region")
+        self.geometry_name_entry.get_style_context().add_class("file-entry")
+        self.geometry_name_button = Gtk.Button(label="Save")
+        self.geometry_name_button.connect("clicked", self.name_geometry)
+        self.name_box.pack_start(self.geometry_name_entry, True, True, 0)
+        self.name_box.pack_start(self.geometry_name_button, False, False, 0)
+        self.box.pack_start(self.name_box, False, False, 0)
+        self.refresh_targets()
+        
         # Button with larger icon
         self.record_button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
         self.record_button_icon = Gtk.Label()
@@ -82,109 +958,385 @@ class MochaRecorder:
         self.record_button.get_style_context().add_class("record-button")
         self.box.pack_start(self.record_button, False, False, 0)
         
+        self.pause_button = Gtk.Button(label="PAUSE")
+        self.pause_button.connect("clicked", self.toggle_pause)
+        self.pause_button.get_style_context().add_class("record-button")
+        self.pause_button.set_sensitive(False)
+        self.box.pack_start(self.pause_button, False, False, 0)
+        
+        # Replay buffer: keep recording into a ring and save the last N seconds on demand
+        self.replay_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.replay_button = Gtk.Button(label="REPLAY")
+        self.replay_button.connect("clicked", self.toggle_replay)
+        self.replay_button.get_style_context().add_class("record-button")
+        self.replay_seconds = Gtk.SpinButton.new_with_range(10, self.replay.keep_seconds, 10)
+        self.replay_seconds.set_value(30)
+        self.replay_seconds.set_tooltip_text("Seconds to save")
+        self.replay_save_button = Gtk.Button(label="SAVE")
+        self.replay_save_button.connect("clicked", self.save_replay)
+        self.replay_save_button.get_style_context().add_class("record-button")
+        self.replay_save_button.set_sensitive(False)
+        self.replay_box.pack_start(self.replay_button, True, True, 0)
+        self.replay_box.pack_start(self.replay_seconds, False, False, 0)
+        self.replay_box.pack_start(self.replay_save_button, False, False, 0)
+        self.box.pack_start(self.replay_box, False, False, 0)
+        
+        # Optional per-session metrics next to the recording
+        self.metrics_check = Gtk.CheckButton(label="Save metrics (CSV)")
+        self.metrics_check.set_tooltip_text("Writes <recording>.metrics.csv with one sample per second")
+        self.box.pack_start(self.metrics_check, False, False, 0)
+        
+        # Record into RAM and move the file to its destination afterwards
+        self.staging_check = Gtk.CheckButton(label="Stage in RAM")
+        self.staging_check.set_tooltip_text(
+            f"Record into {self.staging_dir} and move the file to its destination in the background"
+        )
+        self.staging_check.set_active(os.environ.get("RECORDME_STAGING") == "1")
+        self.box.pack_start(self.staging_check, False, False, 0)
+        
+        # Post-processing queued when a recording or replay is saved
+        self.post_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.post_box.pack_start(Gtk.Label(label="After saving:"), False, False, 0)
+        self.post_checks = {}
+        for step, info in POST_STEPS.items():
+            check = Gtk.CheckButton(label=info["label"])
+            check.set_tooltip_text(info["tooltip"])
+            self.post_checks[step] = check
+            self.post_box.pack_start(check, False, False, 0)
+        self.box.pack_start(self.post_box, False, False, 0)
+        
         # Status
         self.status_label = Gtk.Label(label="Ready to record")
         self.status_label.get_style_context().add_class("status-label")
         self.box.pack_start(self.status_label, False, False, 12)
         
+        self.post_label = Gtk.Label()
+        self.post_label.get_style_context().add_class("status-label")
+        self.box.pack_start(self.post_label, False, False, 0)
+        
         self.window.show_all()
     
     def default_filename(self):
         """Generate a default filename with date and time"""
-        now = datetime.now()
-        return f"recording_{now.strftime('%Y%m%d_%H%M%S')}.mkv"
+        return default_filename(self.container)
     
     def apply_css(self):
-        css = f"""
-        .window {{
-            background-color: {self.colors["base"]};
-            color: {self.colors["text"]};
-            border-radius: 14px;
-            border: 2px solid {self.colors["border"]};
-            box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.2);
-        }}
-        
-        .file-frame {{
-            background-color: {self.colors["mantle"]};
-            border-radius: 8px;
-            border: 1px solid {self.colors["border"]};
-        }}
-        
-        .file-entry {{
-            background-color: {self.colors["input_bg"]};
-            color: {self.colors["text"]};
-            border-radius: 6px;
-            padding: 6px;
-            border: 1px solid {self.colors["crust"]};
-        }}
-        
-        .file-entry:focus {{
-            border-color: {self.colors["green"]};
-        }}
-        
-        .record-button {{
-            background-color: {self.colors["mantle"]};
-            color: {self.colors["text"]};
-            border: 2px solid {self.colors["green"]};
-            border-radius: 10px;
-            padding: 12px 24px;
-            font-weight: bold;
-            font-size: 1.1em;
-            transition: all 0.2s ease;
-        }}
-        
-        .record-button:hover {{
-            background-color: {self.colors["crust"]};
-            border-color: {self.colors["lavender"]};
-        }}
-        
-        .status-label {{
-            color: {self.colors["subtext1"]};
-            font-size: 0.95em;
-        }}
-        """
+        theme.apply(STYLE)
+        self.window.get_style_context().add_class("window")
+    
+    def toggle_recording(self, button):
+        if self.session is None or self.session.state in ("done", "failed"):
+            self.resolve_target(self.start_recording)
+        else:
+            self.session.stop()
+    
+    def start_recording(self, target_args):
+        filename = self.file_entry.get_text().strip()
+        if not filename:
+            filename = self.default_filename()
+        filename = with_container(filename, self.container)
         
-        css_provider = Gtk.CssProvider()
-        css_provider.load_from_data(css.encode())
+        self.destination = None
+        self.staging_stopped = False
+        if self.staging_check.get_active():
+            os.makedirs(self.staging_dir, mode=0o700, exist_ok=True)
+            headroom = staging_headroom(self.staging_dir, self.profile_bytes_per_second())
+            if headroom < STAGING_MIN_SECONDS:
+                self.status_label.set_text(
+                    f"Not enough space in {self.staging_dir}: about {headroom:.0f}s at this profile"
+                )
+                return
+            self.destination = filename
+            filename = os.path.join(self.staging_dir, f"{time.time_ns()}-{os.path.basename(filename)}")
         
-        screen = Gdk.Screen.get_default()
-        style_context = self.window.get_style_context()
-        style_context.add_provider_for_screen(
-            screen, css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
-        )
-        style_context.add_class("window")
+        args = [*target_args, *encoder_args(self.profile, self.container)]
+        session = RecordingSession(filename, lambda path: ["wf-recorder", *args, "-f", path], self.on_session_state)
+        self.session = session
+        try:
+            session.start()
+        except FileNotFoundError:
+            self.session = None
+            self.show_error_dialog()
+        except RuntimeError as e:
+            # Another encoder (a recording still finalizing) is active
+            self.session = None
+            self.status_label.set_text(f"Cannot start recording: {e}")
     
-    def toggle_recording(self, button):
-        if self.process is None:
+    def refresh_targets(self, active=None):
+        active = active or self.target_combo.get_active_id() or "full"
+        self.target_combo.remove_all()
+        self.target_combo.append("full", "Full screen")
+        try:
+            for output in self.outputs.list():
+                self.target_combo.append(f"output:{output.name}", f"Output {output.name} ({output.width}x{output.height})")
+        except (OutputError, ValueError):
+            self.target_combo.set_tooltip_text("Could not list the outputs")
+        self.target_combo.append("select", "Select a region...")
+        for name, geometry in self.geometries.named.items():
+            self.target_combo.append(f"geometry:{geometry}", f"{name} ({geometry})")
+        for geometry in self.geometries.recent:
+            if geometry not in self.geometries.named.values():
+                self.target_combo.append(f"geometry:{geometry}", f"Recent {geometry}")
+        if not self.target_combo.set_active_id(active):
+            self.target_combo.set_active_id("full")
+    
+    def resolve_target(self, then):
+        """Calls then(args) with the wf-recorder -o/-g arguments for the chosen target, running slurp if needed."""
+        target = self.target_combo.get_active_id() or "full"
+        if target.startswith("output:"):
+            then(["-o", target.split(":", 1)[1]])
+        elif target.startswith("geometry:"):
+            then(["-g", target.split(":", 1)[1]])
+        elif target == "select":
+            if self.selecting:
+                return
+            self.selecting = True
+            self.record_button.set_sensitive(False)
+            self.replay_button.set_sensitive(False)
+            self.status_label.set_text("Select a region...")
+            select_region(lambda geometry, error: self.on_region_selected(geometry, error, then))
+        else:
+            then([])
+    
+    def on_region_selected(self, geometry, error, then):
+        self.selecting = False
+        self.record_button.set_sensitive(True)
+        self.replay_button.set_sensitive(True)
+        if error:
+            self.status_label.set_text(error)
+            return
+        self.geometries.add_recent(geometry)
+        self.refresh_targets(f"geometry:{geometry}")
+        then(["-g", geometry])
+    
+    def name_geometry(self, button):
+        name = self.geometry_name_entry.get_text().strip()
+        target = self.target_combo.get_active_id() or ""
+        if not name or not target.startswith("geometry:"):
+            self.status_label.set_text("Select a region first, then give it a name")
+            return
+        self.geometries.name(name, target.split(":", 1)[1])
+        self.geometry_name_entry.set_text("")
+        self.refresh_targets(target)
+    
+    def toggle_pause(self, button):
+        if self.session.state == "recording":
+            self.session.pause()
+        elif self.session.state == "paused":
             try:
-                filename = self.file_entry.get_text().strip()
-                if not filename:
-                    filename = self.default_filename()
-                if not filename.endswith('.mkv'):
-                    filename += '.mkv'
-                
-                self.process = subprocess.Popen(["wf-recorder", "-f", filename])
-                # Update icons
-                self.icon.set_markup('<span font="28">󰑋</span>')  # Large recording icon
-                self.record_button_icon.set_markup('<span font="16">󰓛</span>')  # Stop icon
-                self.record_button_label.set_text("STOP")
-                self.status_label.set_markup(
-                    f'<span foreground="{self.colors["green"]}" weight="bold">RECORDING: {filename}</span>'
-                )
+                self.session.resume()
             except FileNotFoundError:
                 self.show_error_dialog()
-        else:
-            self.process.send_signal(signal.SIGINT)
-            self.process = None
+            except RuntimeError as e:
+                self.status_label.set_text(f"Cannot resume recording: {e}")
+
+    def on_session_state(self, session):
+        state = session.state
+        name = GLib.markup_escape_text(self.destination or session.filename)
+        if state == "starting":
+            # Update icons
+            self.icon.set_markup('<span font="28">󰑋</span>')  # Large recording icon
+            self.record_button_icon.set_markup('<span font="16">󰓛</span>')  # Stop icon
+            self.record_button_label.set_text("STOP")
+            self.record_button.set_sensitive(True)
+            self.pause_button.set_sensitive(False)
+            self.replay_button.set_sensitive(False)
+            self.status_label.set_text(f"Starting wf-recorder: {self.destination or session.filename}")
+            metrics_path = None
+            if self.metrics_check.get_active():
+                metrics_path = f"{self.destination or session.filename}.metrics.csv"
+            self.monitor = RecordingMonitor(
+                session.recorder.process, session.recorder.filename, self.on_monitor_sample, metrics_path
+            )
+        elif state == "recording":
+            self.pause_button.set_label("PAUSE")
+            self.pause_button.set_sensitive(True)
+            self.status_label.set_markup(
+                f'<span foreground="{self.colors["green"]}" weight="bold">RECORDING: {name}</span>'
+            )
+        elif state in ("pausing", "finalizing"):
+            self.monitor.stop()
+            # No new encoder until this one has written its trailer
+            self.record_button.set_sensitive(False)
+            self.pause_button.set_sensitive(False)
+            if state == "finalizing":
+                self.record_button_label.set_text("SAVING")
+            self.status_label.set_text("Pausing..." if state == "pausing" else "Finalizing recording...")
+        elif state == "paused":
+            self.monitor = None
+            self.icon.set_markup('<span font="28">󰏤</span>')  # Large pause icon
+            self.record_button.set_sensitive(True)
+            self.pause_button.set_label("RESUME")
+            self.pause_button.set_sensitive(True)
+            self.status_label.set_markup(
+                f'<span foreground="{self.colors["lavender"]}" weight="bold">PAUSED: {name}</span>\n'
+                f'<span size="small">{len(session.segments)} segment(s) · {session.duration:.0f}s recorded</span>'
+            )
+            if self.closing:
+                session.stop()
+        elif state == "joining":
+            self.record_button_label.set_text("SAVING")
+            self.record_button.set_sensitive(False)
+            self.pause_button.set_sensitive(False)
+            self.status_label.set_text(f"Joining {len(session.segments)} segments...")
+        elif state in ("done", "failed"):
+            if self.monitor:
+                self.monitor.stop()
+                self.monitor = None
             # Restore icons
             self.icon.set_markup('<span font="28">󰄀</span>')  # Large camera icon
             self.record_button_icon.set_markup('<span font="16">󰑭</span>')  # Record icon
             self.record_button_label.set_text("RECORD")
-            self.status_label.set_markup(
-                f'<span foreground="{self.colors["blue"]}">Recording saved</span>'
-            )
-            # Update filename for next recording
-            self.file_entry.set_text(self.default_filename())
+            self.record_button.set_sensitive(True)
+            self.pause_button.set_label("PAUSE")
+            self.pause_button.set_sensitive(False)
+            self.replay_button.set_sensitive(True)
+            if state == "done":
+                note = " (staging space ran low)" if self.staging_stopped else ""
+                # Update filename for next recording
+                self.file_entry.set_text(self.default_filename())
+                if self.destination:
+                    self.staged[session.filename] = session.duration
+                    self.flusher.enqueue(session.filename, self.destination)
+                    self.status_label.set_text(f"Recording stopped{note}, moving to {self.destination}...")
+                else:
+                    self.status_label.set_markup(
+                        f'<span foreground="{self.colors["blue"]}">Recording saved{note}</span>'
+                    )
+                    self.post.enqueue(session.filename, self.post_steps(), session.duration)
+            else:
+                self.status_label.set_text(f"Recording failed: {session.error}")
+            if self.closing:
+                # The staged file is queued by now; destroy lets the flusher finish it
+                GLib.idle_add(self.window.destroy)
+    
+    def on_delete(self, window, event):
+        """Keep the window until an active recording is finalized, then close it."""
+        if self.session is None or self.session.state in ("done", "failed"):
+            return False
+        self.closing = True
+        self.session.stop()
+        self.status_label.set_text("Finalizing recording before closing...")
+        return True
+    
+    def on_monitor_sample(self, sample):
+        fps = f"{sample['fps']:.0f} fps" if sample["fps"] is not None else "fps n/a"
+        stats = (
+            f"CPU {sample['cpu_percent']:.0f}% · RSS {sample['rss_kb'] / 1024:.0f} MB · "
+            f"{sample['bitrate_kbps'] / 1000:.1f} Mbit/s · {fps}"
+        )
+        if sample["dropped"] is not None:
+            stats += f" · {sample['dropped']} dropped"
+        if self.destination:
+            # Budget on whichever is higher, the measured or the expected bitrate
+            rate = max(sample["bitrate_kbps"] * 1000 / 8, self.profile_bytes_per_second())
+            headroom = staging_headroom(self.staging_dir, rate)
+            stats += f" · {headroom / 60:.0f} min left in RAM"
+            if headroom < STAGING_RESERVE_SECONDS and self.session.state == "recording":
+                self.staging_stopped = True
+                self.session.stop()
+                return
+        self.status_label.set_markup(
+            f'<span foreground="{self.colors["green"]}" weight="bold">RECORDING: {GLib.markup_escape_text(self.destination or self.session.filename)}</span>\n'
+            f'<span size="small">{stats}</span>'
+        )
+    
+    def profile_bytes_per_second(self):
+        return PROFILES[self.profile]["bitrate"] * 1000 / 8
+    
+    def on_flushed(self, source, destination, error):
+        duration = self.staged.pop(source, None)
+        if error:
+            self.status_label.set_text(f"Could not move the recording, it is still in {source}: {error}")
+            return
+        self.status_label.set_markup(
+            f'<span foreground="{self.colors["blue"]}">Recording saved: {GLib.markup_escape_text(destination)}</span>'
+        )
+        self.post.enqueue(destination, self.post_steps(), duration)
+    
+    def post_steps(self):
+        return [step for step, check in self.post_checks.items() if check.get_active()]
+    
+    def on_post_change(self, job):
+        if job.state == "failed":
+            self.post_failed += 1
+            self.post_label.set_tooltip_text(f"{job.step} of {job.source}: {job.error}")
+        parts = [f"{j.step} {j.progress:.0%}" if j.duration else j.step for j in self.post.running]
+        if self.post.pending:
+            parts.append(f"{len(self.post.pending)} queued")
+        if self.post_failed:
+            parts.append(f"{self.post_failed} failed")
+        if self.post.running or self.post.pending:
+            self.post_label.set_text("Post-processing: " + " · ".join(parts))
+        elif job.state == "done" and not self.post_failed:
+            self.post_label.set_text(f"Post-processing done: {os.path.basename(job.target)}")
+        else:
+            self.post_label.set_text("Post-processing: " + " · ".join(parts or ["done"]))
+    
+    def on_profile_changed(self, combo):
+        self.profile = combo.get_active_id()
+        self.cost_label.set_text(f"CPU: {PROFILES[self.profile]['cost']}")
+    
+    def on_container_changed(self, combo):
+        self.container = combo.get_active_id()
+        self.file_entry.set_text(with_container(self.file_entry.get_text().strip(), self.container))
+    
+    def toggle_replay(self, button):
+        if not self.replay.running:
+            self.resolve_target(self.start_replay)
+        else:
+            self.replay_button.set_sensitive(False)
+            self.replay_save_button.set_sensitive(False)
+            self.status_label.set_text("Stopping the replay buffer...")
+            self.replay.stop(self.on_replay_stopped)
+    
+    def on_replay_stopped(self):
+        self.replay_button.set_label("REPLAY")
+        self.replay_button.set_sensitive(True)
+        self.record_button.set_sensitive(True)
+        self.status_label.set_text("Ready to record")
+    
+    def on_replay_failed(self, error):
+        self.replay_button.set_label("REPLAY")
+        self.replay_button.set_sensitive(True)
+        self.record_button.set_sensitive(True)
+        # What was buffered can still be saved until the next REPLAY
+        self.replay_save_button.set_sensitive(bool(self.replay.segments()))
+        self.status_label.set_text(f"Replay buffer stopped: {error}")
+    
+    def start_replay(self, target_args):
+        # Segments are MPEG-TS, which carries the profile's H.264 settings but not VP9
+        self.replay.encoder_args = [*target_args, *encoder_args(self.profile)]
+        try:
+            self.replay.start()
+        except FileNotFoundError:
+            self.show_error_dialog()
+            return
+        self.replay_button.set_label("STOP REPLAY")
+        self.replay_save_button.set_sensitive(True)
+        self.record_button.set_sensitive(False)
+        self.status_label.set_markup(
+            f'<span foreground="{self.colors["green"]}" weight="bold">REPLAY BUFFER: last {self.replay.keep_seconds}s</span>'
+        )
+    
+    def save_replay(self, button):
+        filename = self.file_entry.get_text().strip() or self.default_filename()
+        if self.container == "webm":
+            # The segments hold H.264 in MPEG-TS, which webm cannot take without re-encoding
+            filename = with_container(filename, "mkv")
+        seconds = self.replay_seconds.get_value()
+        self.replay_save_button.set_sensitive(False)
+        self.status_label.set_text("Saving replay...")
+        self.replay.save(seconds, filename, lambda ok, message: self.on_replay_saved(ok, message, seconds))
+        self.file_entry.set_text(self.default_filename())
+    
+    def on_replay_saved(self, ok, message, seconds):
+        self.replay_save_button.set_sensitive(self.replay.running or bool(self.replay.segments()))
+        if ok:
+            self.post.enqueue(message, self.post_steps(), seconds)
+            self.status_label.set_markup(f'<span foreground="{self.colors["blue"]}">Replay saved: {GLib.markup_escape_text(message)}</span>')
+        else:
+            self.status_label.set_text(f"Replay failed: {message}")
     
     def show_error_dialog(self):
         dialog = Gtk.MessageDialog(
@@ -192,9 +1344,9 @@ class MochaRecorder:
             flags=0,
             message_type=Gtk.MessageType.ERROR,
             buttons=Gtk.ButtonsType.OK,
-            text="Error: wf-recorder is not installed"
+            text="Error: wf-recorder or ffmpeg is not installed"
         )
-        dialog.format_secondary_text("Install with:\nsudo apt install wf-recorder")
+        dialog.format_secondary_text("Install with:\nsudo apt install wf-recorder ffmpeg")
         dialog.run()
         dialog.destroy()
 
@@ -1,43 +1,1035 @@
-import gi
-import subprocess
+import argparse
 import os
-from datetime import datetime
-import time
+import sqlite3
+import sys
 import threading
+import time
+from datetime import datetime
+
+# Paquete común somepyapps, en src/ junto a las aplicaciones
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from somepyapps import control, trace
+from somepyapps.capture import (
+    DUPLICATES, GEOMETRY_RE, GRIM_MISSING, PRESETS, CaptureError, CaptureIndex, RegionCache, default_filename,
+    grab, grim_command, list_outputs, reserve_filename, select_area, select_outputs,
+)
+
+# Socket de control de la instancia residente
+SOCKET_PATH = control.socket_path("screenme")
+COMMANDS = (
+    "ping", "show", "hide", "toggle",
+    "capture full", "capture area", "capture outputs", "capture focused",
+    "capture last", "copy full", "copy area", "copy last",
+    "cancel", "timing", "trace", "quit",
+    "timelapse start", "timelapse stop", "timelapse video",
+)
+# Órdenes con argumento: "capture region <nombre>"
+REGION_COMMANDS = ("capture region ", "copy region ")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="screenme.py")
+    parser.add_argument("command", nargs="*", help=f"orden para la instancia residente: {', '.join(COMMANDS)}")
+    parser.add_argument("--resident", action="store_true", help="arrancar oculto y quedarse en segundo plano")
+    parser.add_argument("--exit-when-ready", action="store_true", help="salir tras pintar el primer fotograma (medición)")
+    parser.add_argument("--list-regions", action="store_true", help="mostrar las regiones recientes y con nombre")
+    parser.add_argument("--save-region", metavar="NOMBRE", help="dar nombre a una región (por defecto la última)")
+    parser.add_argument("--geometry", help="geometría para --save-region, en formato de slurp: 'x,y anchoxalto'")
+    parser.add_argument("--history", action="store_true", help="listar capturas del índice")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="--history desde esta fecha (ISO 8601)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="--history hasta esta fecha (ISO 8601)")
+    parser.add_argument("--region", help="--history de esta región (nombre o geometría)")
+    parser.add_argument("--output", help="--history de esta pantalla")
+    parser.add_argument("--limit", type=int, default=50, help="máximo de resultados de --history")
+    parser.add_argument("--trace", metavar="FICHERO", help="guardar los tiempos de cada fase (.json: formato Chrome)")
+    args = parser.parse_args(argv)
+    args.command = " ".join(args.command) or None
+    if args.command is not None and args.command not in COMMANDS and not (
+        args.command.startswith(REGION_COMMANDS) and len(args.command.split(" ", 2)) == 3
+    ):
+        parser.error(f"orden desconocida: {args.command}")
+    if args.geometry and not GEOMETRY_RE.match(args.geometry):
+        parser.error(f"geometría no válida: {args.geometry}")
+    return args
+
+
+def manage_regions(args):
+    regions = RegionCache()
+    if args.save_region:
+        geometry = args.geometry or regions.last()
+        if geometry is None:
+            print("No hay ninguna región reciente", file=sys.stderr)
+            sys.exit(1)
+        regions.name(args.save_region, geometry)
+    if args.list_regions:
+        for name, geometry in sorted(regions.named.items()):
+            print(f"{name}\t{geometry}")
+        for geometry in regions.recent:
+            print(f"-\t{geometry}")
+
+
+def show_history(args):
+    geometry = args.region
+    if geometry and not GEOMETRY_RE.match(geometry):
+        geometry = RegionCache().get(geometry)
+        if geometry is None:
+            print(f"Región desconocida: {args.region}", file=sys.stderr)
+            sys.exit(1)
+    rows = CaptureIndex().find(
+        args.since.timestamp() if args.since else None,
+        args.until.timestamp() if args.until else None,
+        geometry, args.output, args.limit,
+    )
+    for taken, path, mode, geometry, output in rows:
+        where = geometry or output or mode
+        print(f"{datetime.fromtimestamp(taken):%Y-%m-%d %H:%M:%S}\t{where}\t{path}")
+
+
+def forward_to_instance(args):
+    if args.exit_when_ready:
+        return False
+    reply = control.send_command(SOCKET_PATH, "ping" if args.resident else args.command or "show")
+    if reply is None:
+        if args.command == "ping":
+            print("No hay ninguna instancia residente", file=sys.stderr)
+            sys.exit(1)
+        return False
+    if not reply.startswith("ok"):
+        print(reply, file=sys.stderr)
+        sys.exit(1)
+    if reply[2:].strip():
+        print(reply[2:].strip())
+    return True
+
+
+if __name__ == "__main__":
+    ARGS = parse_args(sys.argv[1:])
+    if ARGS.list_regions or ARGS.save_region:
+        manage_regions(ARGS)
+        sys.exit(0)
+    if ARGS.history:
+        show_history(ARGS)
+        sys.exit(0)
+    # Si ya hay una instancia residente le pasamos la orden y salimos antes
+    # de cargar GTK, que es lo que domina el arranque en frío.
+    if forward_to_instance(ARGS):
+        sys.exit(0)
+    if ARGS.trace:
+        trace.enable(ARGS.trace)
+
+import gi
+import collections
+import hashlib
+import itertools
+import math
+import queue
+import shutil
+import statistics
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk, GLib
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import Gtk, Gdk, GdkPixbuf, GLib
+from somepyapps import theme
+from somepyapps.record import concat_entry
 
-class GrimScreenshotTool:
-    def __init__(self):
-        # Paleta Catppuccin Mocha
-        self.colors = {
-            "base": "#1e1e2e",
-            "mantle": "#181825",
-            "crust": "#11111b",
-            "text": "#cdd6f4",
-            "subtext1": "#bac2de",
-            "green": "#a6e3a1",
-            "blue": "#89b4fa",
-            "lavender": "#b4befe",
-            "border": "#a6e3a1",
-            "selection": "#585b70",
-        }
+
+class ControlServer:
+    """Escucha órdenes de otras invocaciones en SOCKET_PATH desde el bucle de GTK.
+
+    handler(orden, responder) devuelve la respuesta, o None si contestará más
+    tarde con responder(texto), como "show" tras pintar el primer fotograma.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.sock = control.claim_socket(SOCKET_PATH)
+        if self.sock is not None:
+            GLib.io_add_watch(self.sock.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN, self.on_incoming)
+
+    def on_incoming(self, fd, condition):
+        try:
+            conn, _ = self.sock.accept()
+        except BlockingIOError:
+            return True
+        conn.settimeout(0.5)
+        try:
+            command = conn.recv(256).decode().strip()
+        except OSError:
+            conn.close()
+            return True
+        
+        def reply(text="ok"):
+            with conn:
+                try:
+                    conn.sendall(f"{text}\n".encode())
+                except OSError:
+                    pass
         
+        answer = self.handler(command, reply)
+        if answer is not None:
+            reply(answer)
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            control.release_socket(self.sock, SOCKET_PATH)
+            self.sock = None
+
+
+# Tipos de GdkPixbuf para cada formato de la interfaz
+PIXBUF_TYPES = {"png": "png", "jpg": "jpeg", "webp": "webp"}
+# Espera extra tras el unmap de la ventana, para compositores con animación de cierre
+HIDE_SETTLE_MS = int(os.environ.get("SCREENME_HIDE_SETTLE_MS", "0"))
+# Guardar también el hash perceptual en la columna phash del índice
+PERCEPTUAL_HASH = os.environ.get("SCREENME_PHASH") == "1"
+
+# Tira de historial: cuántas capturas recientes y a qué tamaño máximo las miniaturas
+HISTORY_SIZE = 30
+THUMB_WIDTH, THUMB_HEIGHT = 160, 100
+THUMB_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "screenme", "thumbnails"
+)
+
+# Reglas propias de Screenme, sobre las comunes de somepyapps.theme
+STYLE = """
+.frame {{
+    background-color: {mantle};
+    border-radius: 8px;
+    padding: 12px;
+}}
+
+.title {{
+    font-weight: bold;
+    margin-bottom: 8px;
+}}
+
+.mode-button {{
+    background-color: {mantle};
+    color: {text};
+    border-radius: 6px;
+    padding: 6px 12px;
+    border: 1px solid {border};
+}}
+
+.mode-button:hover {{
+    background-color: {selection};
+}}
+
+.mode-button.active {{
+    background-color: {green};
+    color: {base};
+    font-weight: bold;
+}}
+
+.format-button {{
+    background-color: {mantle};
+    color: {text};
+    border-radius: 6px;
+    padding: 6px 12px;
+    border: 1px solid {border};
+    margin-right: 6px;
+}}
+
+.format-button:hover {{
+    background-color: {selection};
+}}
+
+.format-button.active {{
+    background-color: {green};
+    color: {base};
+    font-weight: bold;
+}}
+
+.capture-button {{
+    background-color: {green};
+    color: {base};
+    border-radius: 8px;
+    padding: 10px 24px;
+    font-weight: bold;
+    font-size: 1.1em;
+    margin-top: 12px;
+}}
+
+.capture-button:hover {{
+    background-color: {lavender};
+}}
+
+.entry {{
+    background-color: {crust};
+    color: {text};
+    border-radius: 6px;
+    padding: 6px;
+    border: 1px solid {border};
+}}
+
+.checkbutton {{
+    margin-top: 8px;
+}}
+
+.timer-box {{
+    margin-top: 8px;
+}}
+
+.timer-label {{
+    margin-right: 8px;
+}}
+
+spinbutton {{
+    min-width: 50px;
+}}
+"""
+
+
+def save_pixbuf(pixbuf, filename, image_format, preset="balanced"):
+    """Guarda con GdkPixbuf usando los mismos parámetros que encoder_args."""
+    if image_format == "png":
+        keys, values = ["compression"], [str(PRESETS[preset]["png_level"])]
+    else:
+        keys, values = ["quality"], [str(PRESETS[preset]["quality"])]
+    pixbuf.savev(filename, PIXBUF_TYPES[image_format], keys, values)
+
+
+def decode_ppm(data):
+    loader = GdkPixbuf.PixbufLoader.new_with_type("pnm")
+    loader.write(data)
+    loader.close()
+    return loader.get_pixbuf()
+
+
+def encode_ppm(data, filename, image_format, preset="balanced"):
+    save_pixbuf(decode_ppm(data), filename, image_format, preset)
+
+
+def pixel_hash(pixbuf):
+    """Hash de los píxeles sin el relleno de fin de fila, cuyo contenido GdkPixbuf no garantiza."""
+    width, height, channels = pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_n_channels()
+    stride = pixbuf.get_rowstride()
+    data = memoryview(pixbuf.read_pixel_bytes().get_data())
+    digest = hashlib.blake2b(f"{width}x{height}x{channels}".encode(), digest_size=16)
+    for y in range(height):
+        digest.update(data[y * stride : y * stride + width * channels])
+    return digest.digest()
+
+
+def perceptual_hash(pixbuf):
+    """dHash de 64 bits: compara el brillo de píxeles vecinos en una miniatura de 9x8."""
+    small = pixbuf.scale_simple(9, 8, GdkPixbuf.InterpType.BILINEAR)
+    stride, channels = small.get_rowstride(), small.get_n_channels()
+    data = small.read_pixel_bytes().get_data()
+    bits = 0
+    for y in range(8):
+        row = [
+            299 * data[o] + 587 * data[o + 1] + 114 * data[o + 2]
+            for o in (y * stride + x * channels for x in range(9))
+        ]
+        for x in range(8):
+            bits = bits << 1 | (row[x] < row[x + 1])
+    return bits
+
+
+def capture_outputs(outputs, base, image_format, include_cursor=False, combined=False, preset="balanced"):
+    """Lanza un grim -o por pantalla a la vez y codifica cada una en paralelo a su fichero.
+
+    Con combined además compone una imagen única con la disposición real de
+    las pantallas. Devuelve la lista de ficheros guardados.
+    """
+    def grab_output(output):
+        cmd = grim_command(include_cursor) + ["-o", output.name, "-t", "ppm", "-"]
+        with trace.span("grim", "capture", output=output.name):
+            result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise CaptureError("Error al capturar", f"{output.name}: {result.stderr.decode(errors='replace').strip()}")
+        pixbuf = decode_ppm(result.stdout)
+        filename = reserve_filename(f"{base}_{output.name}.{image_format}")
+        with trace.span("encode", "capture", output=output.name, format=image_format, preset=preset):
+            save_pixbuf(pixbuf, filename, image_format, preset)
+        return filename, pixbuf
+
+    if not outputs:
+        raise CaptureError("Sin pantallas", "No hay ninguna pantalla seleccionada")
+    with ThreadPoolExecutor(max_workers=len(outputs)) as pool:
+        results = list(pool.map(grab_output, outputs))
+    saved = [filename for filename, _ in results]
+
+    if combined and len(outputs) > 1:
+        min_x = min(o.x for o in outputs)
+        min_y = min(o.y for o in outputs)
+        width = max(o.x - min_x + pixbuf.get_width() for o, (_, pixbuf) in zip(outputs, results))
+        height = max(o.y - min_y + pixbuf.get_height() for o, (_, pixbuf) in zip(outputs, results))
+        canvas = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, width, height)
+        canvas.fill(0x000000ff)
+        for output, (_, pixbuf) in zip(outputs, results):
+            pixbuf.copy_area(0, 0, pixbuf.get_width(), pixbuf.get_height(), canvas, output.x - min_x, output.y - min_y)
+        filename = reserve_filename(f"{base}_combinada.{image_format}")
+        save_pixbuf(canvas, filename, image_format, preset)
+        saved.append(filename)
+    return saved
+
+
+def writable_formats():
+    names = {f.get_name() for f in GdkPixbuf.Pixbuf.get_formats() if f.is_writable()}
+    return [fmt for fmt, pixbuf_type in PIXBUF_TYPES.items() if pixbuf_type in names]
+
+
+class CaptureJob:
+    """Handle de una captura encolada en CaptureEngine."""
+
+    def __init__(self, job_id, filename, mode, include_cursor, destination="file", image_format="png",
+                 outputs="all", combined=False, preset="balanced", geometry=None):
+        self.id = job_id
+        self.filename = filename
+        self.mode = mode  # full, area, outputs
+        self.include_cursor = include_cursor
+        self.destination = destination  # file, clipboard, both
+        self.image_format = image_format
+        self.outputs = outputs  # "all", "focused" o lista de nombres (modo outputs)
+        self.combined = combined
+        self.preset = preset
+        self.geometry = geometry  # región ya conocida (el modo area no lanza slurp) o la elegida al capturar
+        self.saved = []
+        self.output_names = []  # pantalla de cada fichero de saved (modo outputs)
+        self.duplicates = []  # (fichero nuevo, captura idéntica que ya existía)
+        self.deadline = None  # plazo monótono si viene de una captura diferida
+        self.requested = None  # instante monótono en que se pidió, antes de ocultar la ventana
+        self.queued = time.monotonic()
+        self.started = None  # instante monótono en que se lanzó grim
+        self.hide_latency = None  # lo que tardó en desaparecer la ventana
+        self.state = "queued"  # queued, running, done, cancelled, failed
+        self.title = None
+        self.error = None
+        self.finished = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    @property
+    def done(self):
+        return self.finished.is_set()
+
+
+class CaptureEngine:
+    """Ejecuta slurp y grim en hilos de trabajo alimentados por una cola acotada.
+
+    on_finished se llama en el hilo de GTK (vía GLib.idle_add) con el job ya
+    terminado, así que puede tocar widgets directamente.
+    """
+
+    def __init__(self, on_finished, regions=None, workers=2, max_pending=8, index=None):
+        self.on_finished = on_finished
+        self.regions = regions
+        self.index = index
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.ids = itertools.count(1)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    def submit(self, filename, mode="full", include_cursor=False, destination="file", image_format="png",
+               outputs="all", combined=False, preset="balanced", geometry=None):
+        """Encola una captura y devuelve su CaptureJob. Lanza queue.Full si la cola está llena."""
+        job = CaptureJob(
+            next(self.ids), filename, mode, include_cursor, destination, image_format, outputs, combined, preset,
+            geometry,
+        )
+        self.jobs.put_nowait(job)
+        with self.lock:
+            self.in_flight += 1
+        return job
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            trace.record("queue", job.queued, cat="screenme", job=job.id)
+            job.state = "running"
+            try:
+                self.run(job)
+            except Exception as e:
+                job.state, job.title, job.error = "failed", "Error al capturar", str(e)
+            if self.index and job.state == "done":
+                # La captura ya está guardada: un fallo al indexarla no la convierte en error
+                try:
+                    self.index_job(job)
+                except (GLib.Error, sqlite3.Error, OSError) as e:
+                    print(f"No se pudo indexar {job.filename}: {e}", file=sys.stderr)
+            with self.lock:
+                self.in_flight -= 1
+            job.finished.set()
+            GLib.idle_add(self.on_finished, job)
+
+    def run(self, job):
+        try:
+            if job.mode == "outputs":
+                # Cada pantalla va a su propio fichero; el destino no aplica
+                outputs = select_outputs(list_outputs(), job.outputs)
+                job.output_names = [o.name for o in outputs]
+                base = os.path.splitext(job.filename)[0]
+                job.started = time.monotonic()
+                job.saved = capture_outputs(
+                    outputs, base, job.image_format, job.include_cursor, job.combined, job.preset
+                )
+                job.state = "done"
+                return
+            if job.mode == "area":
+                job.geometry = job.geometry or select_area(self.regions)
+            job.started = time.monotonic()
+            grab(
+                job.filename if job.destination != "clipboard" else None,
+                job.geometry if job.mode == "area" else None,
+                include_cursor=job.include_cursor, image_format=job.image_format, preset=job.preset,
+                clipboard=job.destination != "file",
+            )
+            job.state = "done"
+        except CaptureError as e:
+            job.state, job.title, job.error = e.state, e.title, str(e)
+        except FileNotFoundError:
+            job.state, job.title, job.error = "failed", "Error", GRIM_MISSING
+
+    def index_job(self, job):
+        if job.mode == "outputs":
+            # La imagen combinada, si la hay, va al final y no es de ninguna pantalla
+            entries = list(itertools.zip_longest(job.saved, job.output_names))
+        elif job.destination in ("file", "both"):
+            entries = [(job.filename, None)]
+        else:
+            return
+        for path, output in entries:
+            with trace.span("index", "screenme", job=job.id, output=output):
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+                existing = self.index.add(
+                    path, pixel_hash(pixbuf), pixbuf.get_width(), pixbuf.get_height(), job.mode,
+                    job.geometry if job.mode == "area" else None, output,
+                    perceptual_hash(pixbuf) if PERCEPTUAL_HASH else None,
+                )
+            if existing:
+                job.duplicates.append((path, existing))
+
+
+class DelayedCapture:
+    def __init__(self, delay, callback, lead=0.0):
+        self.delay = delay
+        self.deadline = time.monotonic() + delay
+        self.callback = callback
+        self.lead = lead  # el callback se llama este tiempo antes del plazo
+        self.source = None
+
+
+class CaptureScheduler:
+    """Capturas diferidas sobre el bucle de GLib con plazos en reloj monótono.
+
+    Cada captura guarda su plazo absoluto y el temporizador se arma con lo que
+    falte, así que ni los retrasos de GLib ni el refresco de la etiqueta se
+    acumulan. on_change recibe los segundos hasta la próxima captura (o None
+    cuando no queda ninguna) para pintar la cuenta atrás. Con lead el
+    callback llega antes del plazo, para que dé tiempo a ocultar la ventana.
+    """
+
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self.pending = []
+        self.ticker = None
+        self.errors = collections.deque(maxlen=100)
+
+    def schedule(self, delay, callback, lead=0.0):
+        entry = DelayedCapture(delay, callback, lead)
+        self.pending.append(entry)
+        self.arm(entry)
+        self.tick()
+        return entry
+
+    def arm(self, entry):
+        remaining = entry.deadline - entry.lead - time.monotonic()
+        entry.source = GLib.timeout_add(
+            max(0, math.ceil(remaining * 1000)), self.on_timeout, entry, priority=GLib.PRIORITY_HIGH
+        )
+
+    def on_timeout(self, entry):
+        if entry.deadline - entry.lead - time.monotonic() > 0:
+            self.arm(entry)
+            return False
+        entry.source = None
+        self.pending.remove(entry)
+        entry.callback(entry)
+        self.tick()
+        return False
+
+    def cancel(self, entry=None):
+        """Cancela una captura pendiente, o todas si no se indica ninguna; si ya se disparó no hace nada."""
+        if entry is not None and entry not in self.pending:
+            return
+        for pending in [entry] if entry else list(self.pending):
+            if pending.source is not None:
+                GLib.source_remove(pending.source)
+                pending.source = None
+            self.pending.remove(pending)
+        self.tick()
+
+    def restart(self, entry):
+        """Vuelve a contar el retraso completo de una captura pendiente; si ya se disparó no hace nada."""
+        if entry not in self.pending:
+            return
+        if entry.source is not None:
+            GLib.source_remove(entry.source)
+            entry.source = None
+        entry.deadline = time.monotonic() + entry.delay
+        self.arm(entry)
+        self.tick()
+
+    def tick(self):
+        if self.ticker is not None:
+            GLib.source_remove(self.ticker)
+            self.ticker = None
+        if not self.pending:
+            if self.on_change:
+                self.on_change(None)
+            return
+        remaining = min(e.deadline for e in self.pending) - time.monotonic()
+        if self.on_change:
+            self.on_change(remaining)
+        # Siguiente refresco justo cuando cambie el segundo mostrado
+        fraction = remaining - math.floor(remaining)
+        self.ticker = GLib.timeout_add(math.ceil(fraction * 1000) or 1000, self.on_tick)
+
+    def on_tick(self):
+        self.ticker = None
+        self.tick()
+        return False
+
+    def record(self, error):
+        self.errors.append(error)
+
+    def summary(self):
+        if not self.errors:
+            return "sin capturas diferidas medidas"
+        ms = [e * 1000 for e in self.errors]
+        return (
+            f"{len(ms)} capturas: desfase medio {statistics.mean(ms):+.1f} ms, "
+            f"mín {min(ms):+.1f} ms, máx {max(ms):+.1f} ms"
+        )
+
+
+class BurstCapture:
+    """Ráfaga de capturas a intervalo fijo.
+
+    Un hilo lanza `grim -t ppm -` en cada instante programado y deja el PPM en
+    memoria en una cola acotada; un grupo de hilos codifica al formato elegido.
+    Si los codificadores no dan abasto la cola se llena y el fotograma se
+    descarta en vez de retrasar los siguientes.
+    """
+
+    def __init__(self, base, image_format, frames, interval, mode="full", include_cursor=False,
+                 preset="balanced", geometry=None, regions=None, encoders=2, max_pending=4, on_finished=None):
+        self.base = base
+        self.image_format = image_format
+        self.frames = frames
+        self.interval = interval
+        self.mode = mode
+        self.include_cursor = include_cursor
+        self.preset = preset
+        self.geometry = geometry
+        self.regions = regions
+        self.encoders = encoders
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.on_finished = on_finished
+        self.starts = []
+        self.lateness = []
+        self.saved = []
+        self.dropped = 0
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        workers = [threading.Thread(target=self.encode_worker, daemon=True) for _ in range(self.encoders)]
+        for worker in workers:
+            worker.start()
+        try:
+            if self.image_format not in writable_formats():
+                raise CaptureError("Formato no disponible", f"GdkPixbuf no puede escribir {self.image_format}")
+            geometry = None
+            if self.mode == "area":
+                geometry = self.geometry or select_area(self.regions)
+            self.capture_loop(grim_command(self.include_cursor, geometry) + ["-t", "ppm", "-"])
+        except CaptureError as e:
+            self.errors.append(str(e))
+        except FileNotFoundError:
+            self.errors.append(GRIM_MISSING)
+        finally:
+            for _ in workers:
+                self.pending.put(None)
+            for worker in workers:
+                worker.join()
+            if self.on_finished:
+                GLib.idle_add(self.on_finished, self)
+
+    def capture_loop(self, cmd):
+        t0 = time.monotonic()
+        for index in range(self.frames):
+            deadline = t0 + index * self.interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            started = time.monotonic()
+            self.starts.append(started)
+            self.lateness.append(started - deadline)
+            result = subprocess.run(cmd, capture_output=True)
+            if result.returncode != 0:
+                self.errors.append(result.stderr.decode(errors="replace").strip())
+                continue
+            try:
+                self.pending.put_nowait((index, result.stdout))
+            except queue.Full:
+                self.dropped += 1
+
+    def encode_worker(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            index, data = item
+            filename = reserve_filename(f"{self.base}_{index + 1:03d}.{self.image_format}")
+            try:
+                encode_ppm(data, filename, self.image_format, self.preset)
+            except GLib.Error as e:
+                os.unlink(filename)
+                with self.lock:
+                    self.errors.append(str(e))
+                continue
+            with self.lock:
+                self.saved.append(filename)
+
+    def summary(self):
+        intervals = [b - a for a, b in zip(self.starts, self.starts[1:])]
+        text = f"{len(self.saved)}/{self.frames} guardadas, {self.dropped} descartadas"
+        if self.lateness:
+            text += f"\nretraso medio {statistics.mean(self.lateness) * 1000:.1f} ms, máx {max(self.lateness) * 1000:.1f} ms"
+        if len(intervals) > 1:
+            text += f"\njitter del intervalo {statistics.stdev(intervals) * 1000:.1f} ms"
+        return text
+
+
+class Timelapse:
+    """Captura periódica de larga duración, por ejemplo una cada 30 s durante un turno.
+
+    Un hilo lanza `grim -t ppm -` a intervalo fijo y compara el hash de los
+    píxeles con el del fotograma anterior: si la pantalla no ha cambiado, no se
+    guarda nada. Cada fotograma nuevo se codifica a un fichero numerado en
+    directory y se aplica la retención (max_frames, max_bytes; 0 es sin
+    límite) borrando los más antiguos.
+    """
+
+    def __init__(self, directory, interval, image_format="png", preset="balanced", mode="full",
+                 geometry=None, output=None, include_cursor=False, regions=None,
+                 max_frames=0, max_bytes=0, on_change=None):
+        self.directory = directory
+        self.interval = interval
+        self.image_format = image_format
+        self.preset = preset
+        self.mode = mode
+        self.geometry = geometry
+        self.output = output
+        self.include_cursor = include_cursor
+        self.regions = regions
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.on_change = on_change
+        self.frames = collections.deque()  # (instante, ruta, bytes)
+        self.bytes = 0
+        self.saved = 0
+        self.next_index = 0
+        self.skipped = 0
+        self.evicted = 0
+        self.last_hash = None
+        self.last_seen = None
+        self.errors = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.finished = False
+
+    @property
+    def running(self):
+        # finished se marca antes del último aviso; el hilo puede seguir vivo un instante
+        return self.thread is not None and not self.finished
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # Al reanudar en el mismo directorio se sigue la numeración en vez de pisar fotogramas
+        for name in os.listdir(self.directory):
+            stem = os.path.splitext(name)[0]
+            if stem.startswith("frame_") and stem[6:].isdigit():
+                self.next_index = max(self.next_index, int(stem[6:]) + 1)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        try:
+            if self.image_format not in writable_formats():
+                raise CaptureError("Formato no disponible", f"GdkPixbuf no puede escribir {self.image_format}")
+            geometry = None
+            if self.mode == "area":
+                geometry = self.geometry or select_area(self.regions)
+            cmd = grim_command(self.include_cursor, geometry)
+            if self.output:
+                cmd += ["-o", self.output]
+            cmd += ["-t", "ppm", "-"]
+            t0 = time.monotonic()
+            index = 0
+            while not self.stop_event.wait(max(0.0, t0 + index * self.interval - time.monotonic())):
+                try:
+                    self.capture(cmd)
+                except (CaptureError, GLib.Error) as e:
+                    self.errors.append(str(e))
+                # Si la captura se ha comido algún plazo, se salta al siguiente
+                index = int((time.monotonic() - t0) / self.interval) + 1
+                self.notify()
+        except CaptureError as e:
+            self.errors.append(str(e))
+        except FileNotFoundError:
+            self.errors.append(GRIM_MISSING)
+        finally:
+            self.finished = True
+            self.notify()
+
+    def notify(self):
+        if self.on_change:
+            GLib.idle_add(self.on_change, self)
+
+    def capture(self, cmd):
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise CaptureError("Error al capturar", result.stderr.decode(errors="replace").strip())
+        now = time.time()
+        self.last_seen = now
+        digest = hashlib.blake2b(result.stdout, digest_size=16).digest()
+        if digest == self.last_hash:
+            self.skipped += 1
+            return
+        self.last_hash = digest
+        
+        path = reserve_filename(os.path.join(self.directory, f"frame_{self.next_index:06d}.{self.image_format}"))
+        self.next_index += 1
+        try:
+            encode_ppm(result.stdout, path, self.image_format, self.preset)
+        except GLib.Error:
+            os.unlink(path)
+            raise
+        size = os.path.getsize(path)
+        with self.lock:
+            self.saved += 1
+            self.frames.append((now, path, size))
+            self.bytes += size
+            while self.frames and (
+                (self.max_frames and len(self.frames) > self.max_frames)
+                or (self.max_bytes and self.bytes > self.max_bytes and len(self.frames) > 1)
+            ):
+                _, old, old_size = self.frames.popleft()
+                self.bytes -= old_size
+                self.evicted += 1
+                try:
+                    os.unlink(old)
+                except FileNotFoundError:
+                    pass
+
+    def assemble(self, filename, fps=30):
+        """Monta los fotogramas retenidos en un vídeo H.264 y devuelve el error de ffmpeg o None.
+
+        Usa el demuxer concat, así que ffmpeg lee los ficheros de disco de uno
+        en uno en vez de tenerlos todos en memoria. Cada fotograma dura en el
+        vídeo tantos fotogramas de salida como intervalos siguió en pantalla.
+        Los ficheros se enlazan antes a un directorio temporal para que la
+        retención pueda seguir borrando mientras tanto.
+        """
+        with self.lock:
+            frames = list(self.frames)
+        if not frames:
+            return "No hay fotogramas guardados"
+        scratch = tempfile.mkdtemp(prefix=".video_", dir=self.directory)
+        try:
+            list_path = os.path.join(scratch, "list.txt")
+            ends = [t for t, _, _ in frames[1:]] + [max(self.last_seen or 0, frames[-1][0])]
+            with open(list_path, "w") as f:
+                for i, ((start, path, _), end) in enumerate(zip(frames, ends)):
+                    link = os.path.join(scratch, f"{i:06d}{os.path.splitext(path)[1]}")
+                    os.link(path, link)
+                    duration = max(1, round((end - start) / self.interval)) / fps
+                    f.write(f"{concat_entry(link)}duration {duration:.6f}\n")
+                # El demuxer concat ignora la duración de la última entrada si no se repite
+                f.write(concat_entry(link))
+            result = subprocess.run(
+                [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "concat", "-safe", "0", "-i", list_path,
+                    "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2,format=yuv420p", "-r", str(fps),
+                    "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", filename,
+                ],
+                capture_output=True, text=True,
+            )
+        except FileNotFoundError:
+            return "ffmpeg no está instalado. Instálalo con:\nsudo apt install ffmpeg"
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        if result.returncode != 0:
+            return result.stderr.strip() or f"ffmpeg terminó con código {result.returncode}"
+        return None
+
+    def summary(self):
+        return (
+            f"{len(self.frames)} fotogramas ({self.bytes / (1 << 20):.1f} MiB), "
+            f"{self.skipped} repetidos, {self.evicted} descartados por retención"
+        )
+
+
+class ThumbnailCache:
+    """Miniaturas de capturas generadas en un hilo aparte y con dos niveles de caché.
+
+    En memoria hay un LRU acotado por bytes. En disco, THUMB_CACHE_DIR guarda
+    un PNG pequeño por ruta y mtime, así que al abrir la ventana no se vuelve
+    a leer ninguna imagen a tamaño completo ya vista. Las peticiones se
+    atienden de la más reciente a la más antigua, y on_ready(path, pixbuf) se
+    llama en el hilo de GTK.
+    """
+
+    def __init__(self, on_ready, directory=THUMB_CACHE_DIR, max_bytes=8 << 20, max_files=5000):
+        self.on_ready = on_ready
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.memory = collections.OrderedDict()  # (ruta, mtime) -> pixbuf
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.requests = queue.LifoQueue()
+        self.requested = set()
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    @staticmethod
+    def key(path):
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self, path):
+        """Devuelve la miniatura si está en memoria; si no, la pide y devuelve None."""
+        key = self.key(path)
+        if key is None:
+            return None
+        with self.lock:
+            pixbuf = self.memory.get(key)
+            if pixbuf is not None:
+                self.memory.move_to_end(key)
+                return pixbuf
+            if key in self.requested:
+                return None
+            self.requested.add(key)
+        self.requests.put(key)
+        return None
+
+    def remember(self, key, pixbuf):
+        with self.lock:
+            self.requested.discard(key)
+            self.memory[key] = pixbuf
+            self.bytes += pixbuf.get_byte_length()
+            while self.bytes > self.max_bytes and len(self.memory) > 1:
+                _, old = self.memory.popitem(last=False)
+                self.bytes -= old.get_byte_length()
+
+    def disk_path(self, key):
+        path, mtime = key
+        digest = hashlib.sha1(f"{path}\0{mtime}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.png")
+
+    def worker(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.prune()
+        while True:
+            key = self.requests.get()
+            cached = self.disk_path(key)
+            try:
+                try:
+                    pixbuf = GdkPixbuf.Pixbuf.new_from_file(cached)
+                except GLib.Error:
+                    # Solo aquí se lee la captura original, y se decodifica ya reducida
+                    pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(key[0], THUMB_WIDTH, THUMB_HEIGHT, True)
+                    tmp = f"{cached}.{threading.get_ident()}.tmp"
+                    pixbuf.savev(tmp, "png", [], [])
+                    os.replace(tmp, cached)
+            except (GLib.Error, OSError):
+                with self.lock:
+                    self.requested.discard(key)
+                continue
+            self.remember(key, pixbuf)
+            GLib.idle_add(self.on_ready, key[0], pixbuf)
+
+    def prune(self):
+        """Borra las miniaturas en disco más antiguas si pasan de max_files."""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".png")]
+        except OSError:
+            return
+        if len(entries) <= self.max_files:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[: len(entries) - self.max_files]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+class GrimScreenshotTool:
+    def __init__(self, resident=False):
         self.capture_mode = "full"
+        self.output_selection = "all"
         self.include_cursor = False
         self.image_format = "png"
+        self.preset = "balanced"
+        self.destination = "file"
         self.timer_delay = 0
+        self.resident = resident
+        self.regions = RegionCache()
+        self.index = None
+        if os.environ.get("SCREENME_INDEX") != "off":
+            try:
+                self.index = CaptureIndex()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Índice de capturas desactivado: {e}", file=sys.stderr)
+        self.engine = CaptureEngine(self.on_capture_finished, self.regions, index=self.index)
+        self.thumbnails = ThumbnailCache(self.on_thumbnail_ready)
+        self.history_images = {}  # ruta -> Gtk.Image de la tira de historial
+        self.scheduler = CaptureScheduler(self.on_countdown_changed)
+        # Capturas en curso que necesitan la ventana oculta, y si hay que volver a mostrarla
+        self.hide_holds = 0
+        self.reshow_wanted = False
+        self.hide_latencies = collections.deque(maxlen=100)
+        self.hide_waiters = None  # callbacks de la ocultación en curso, hasta que termine de asentarse
+        self.timelapse = None
         self.setup_main_window()
         self.apply_styles()
         self.setup_ui()
-        self.window.show_all()
+        self.server = ControlServer(self.handle_command)
+        if resident:
+            # Ventana construida y realizada pero oculta hasta que llegue "show"
+            self.main_box.show_all()
+            self.window.realize()
+        else:
+            self.window.show_all()
 
     def setup_main_window(self):
         self.window = Gtk.Window(title="☕ Grim Screenshot")
         self.window.set_default_size(400, 350)
         self.window.set_resizable(False)
+        self.window.connect("delete-event", self.on_delete)
         self.window.connect("destroy", Gtk.main_quit)
+        self.window.connect("key-press-event", self.on_key_press)
 
         self.main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
         self.main_box.set_margin_top(12)
@@ -47,110 +1039,8 @@ class GrimScreenshotTool:
         self.window.add(self.main_box)
 
     def apply_styles(self):
-        css = f"""
-        .window {{
-            background-color: {self.colors["base"]};
-            color: {self.colors["text"]};
-            border-radius: 14px;
-            border: 2px solid {self.colors["border"]};
-        }}
-        
-        .frame {{
-            background-color: {self.colors["mantle"]};
-            border-radius: 8px;
-            padding: 12px;
-        }}
-        
-        .title {{
-            font-weight: bold;
-            margin-bottom: 8px;
-        }}
-        
-        .mode-button {{
-            background-color: {self.colors["mantle"]};
-            color: {self.colors["text"]};
-            border-radius: 6px;
-            padding: 6px 12px;
-            border: 1px solid {self.colors["border"]};
-        }}
-        
-        .mode-button:hover {{
-            background-color: {self.colors["selection"]};
-        }}
-        
-        .mode-button.active {{
-            background-color: {self.colors["green"]};
-            color: {self.colors["base"]};
-            font-weight: bold;
-        }}
-        
-        .format-button {{
-            background-color: {self.colors["mantle"]};
-            color: {self.colors["text"]};
-            border-radius: 6px;
-            padding: 6px 12px;
-            border: 1px solid {self.colors["border"]};
-            margin-right: 6px;
-        }}
-        
-        .format-button:hover {{
-            background-color: {self.colors["selection"]};
-        }}
-        
-        .format-button.active {{
-            background-color: {self.colors["green"]};
-            color: {self.colors["base"]};
-            font-weight: bold;
-        }}
-        
-        .capture-button {{
-            background-color: {self.colors["green"]};
-            color: {self.colors["base"]};
-            border-radius: 8px;
-            padding: 10px 24px;
-            font-weight: bold;
-            font-size: 1.1em;
-            margin-top: 12px;
-        }}
-        
-        .capture-button:hover {{
-            background-color: {self.colors["lavender"]};
-        }}
-        
-        .entry {{
-            background-color: {self.colors["crust"]};
-            color: {self.colors["text"]};
-            border-radius: 6px;
-            padding: 6px;
-            border: 1px solid {self.colors["border"]};
-        }}
-        
-        .checkbutton {{
-            margin-top: 8px;
-        }}
-        
-        .timer-box {{
-            margin-top: 8px;
-        }}
-        
-        .timer-label {{
-            margin-right: 8px;
-        }}
-        
-        spinbutton {{
-            min-width: 50px;
-        }}
-        """
-
-        css_provider = Gtk.CssProvider()
-        css_provider.load_from_data(css.encode())
-        
-        screen = Gdk.Screen.get_default()
-        style_context = self.window.get_style_context()
-        style_context.add_provider_for_screen(
-            screen, css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
-        )
-        style_context.add_class("window")
+        theme.apply(STYLE)
+        self.window.get_style_context().add_class("window")
 
     def setup_ui(self):
         # Frame para opciones de captura
@@ -183,6 +1073,65 @@ class GrimScreenshotTool:
         self.area_button.get_style_context().add_class("mode-button")
         mode_box.pack_start(self.area_button, True, True, 0)
         
+        self.outputs_button = Gtk.Button(label="Por Pantalla")
+        self.outputs_button.connect("clicked", self.on_capture_mode_changed, "outputs")
+        self.outputs_button.get_style_context().add_class("mode-button")
+        mode_box.pack_start(self.outputs_button, True, True, 0)
+        
+        self.mode_buttons = {"full": self.full_button, "area": self.area_button, "outputs": self.outputs_button}
+        
+        # Regiones guardadas del modo área, visibles solo en ese modo
+        self.regions_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.regions_box.set_no_show_all(True)
+        capture_box.pack_start(self.regions_box, False, False, 0)
+        
+        region_row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.regions_box.pack_start(region_row, False, False, 0)
+        
+        self.regions_combo = Gtk.ComboBoxText()
+        self.region_choices = {}
+        region_row.pack_start(self.regions_combo, True, True, 0)
+        
+        repeat_button = Gtk.Button(label="Repetir última")
+        repeat_button.set_tooltip_text("Ctrl+R")
+        repeat_button.connect("clicked", self.on_repeat_region_clicked)
+        repeat_button.get_style_context().add_class("mode-button")
+        region_row.pack_start(repeat_button, False, False, 0)
+        
+        name_row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.regions_box.pack_start(name_row, False, False, 0)
+        
+        self.region_name_entry = Gtk.Entry()
+        self.region_name_entry.set_placeholder_text("Nombre para la región")
+        self.region_name_entry.get_style_context().add_class("entry")
+        name_row.pack_start(self.region_name_entry, True, True, 0)
+        
+        save_region_button = Gtk.Button(label="Guardar")
+        save_region_button.connect("clicked", self.on_save_region_clicked)
+        save_region_button.get_style_context().add_class("mode-button")
+        name_row.pack_start(save_region_button, False, False, 0)
+        
+        # Opciones del modo por pantalla, visibles solo en ese modo
+        self.outputs_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.outputs_box.set_no_show_all(True)
+        capture_box.pack_start(self.outputs_box, False, False, 0)
+        
+        self.outputs_combo = Gtk.ComboBoxText()
+        self.outputs_combo.append("all", "Todas las pantallas")
+        self.outputs_combo.append("focused", "Pantalla enfocada")
+        self.outputs_combo.append("custom", "Elegir pantallas")
+        self.outputs_combo.set_active_id("all")
+        self.outputs_combo.connect("changed", self.on_output_selection_changed)
+        self.outputs_box.pack_start(self.outputs_combo, False, False, 0)
+        
+        self.output_checks_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        self.outputs_box.pack_start(self.output_checks_box, False, False, 0)
+        self.output_checks = {}
+        
+        self.combined_check = Gtk.CheckButton(label="Imagen combinada")
+        self.combined_check.get_style_context().add_class("checkbutton")
+        self.outputs_box.pack_start(self.combined_check, False, False, 0)
+        
         # Checkbox para incluir cursor
         self.cursor_check = Gtk.CheckButton(label="Incluir cursor")
         self.cursor_check.connect("toggled", self.on_cursor_toggled)
@@ -206,10 +1155,90 @@ class GrimScreenshotTool:
         timer_box.pack_start(timer_title, False, False, 0)
         
         # Entrada para temporizador
-        self.timer_entry = Gtk.SpinButton.new_with_range(0, 60, 1)
+        self.timer_entry = Gtk.SpinButton.new_with_range(0, 60, 0.5)
+        self.timer_entry.set_digits(1)
         self.timer_entry.set_value(0)
         timer_box.pack_start(self.timer_entry, False, False, 8)
         
+        # Frame para ráfaga
+        burst_frame = Gtk.Frame()
+        burst_frame.get_style_context().add_class("frame")
+        self.main_box.pack_start(burst_frame, False, False, 8)
+        
+        burst_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        burst_frame.add(burst_box)
+        
+        burst_title = Gtk.Label(label="<b>Ráfaga</b>")
+        burst_title.set_use_markup(True)
+        burst_title.get_style_context().add_class("title")
+        burst_box.pack_start(burst_title, False, False, 0)
+        
+        self.burst_frames_entry = Gtk.SpinButton.new_with_range(2, 100, 1)
+        self.burst_frames_entry.set_value(10)
+        self.burst_frames_entry.set_tooltip_text("Número de capturas")
+        burst_box.pack_start(self.burst_frames_entry, False, False, 0)
+        
+        burst_box.pack_start(Gtk.Label(label="cada"), False, False, 0)
+        self.burst_interval_entry = Gtk.SpinButton.new_with_range(50, 10000, 50)
+        self.burst_interval_entry.set_value(200)
+        burst_box.pack_start(self.burst_interval_entry, False, False, 0)
+        burst_box.pack_start(Gtk.Label(label="ms"), False, False, 0)
+        
+        self.burst_button = Gtk.Button(label="Ráfaga")
+        self.burst_button.connect("clicked", self.on_burst_clicked)
+        self.burst_button.get_style_context().add_class("mode-button")
+        burst_box.pack_end(self.burst_button, False, False, 0)
+        
+        # Frame para timelapse
+        timelapse_frame = Gtk.Frame()
+        timelapse_frame.get_style_context().add_class("frame")
+        self.main_box.pack_start(timelapse_frame, False, False, 8)
+        
+        timelapse_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=8)
+        timelapse_frame.add(timelapse_box)
+        
+        timelapse_row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        timelapse_box.pack_start(timelapse_row, False, False, 0)
+        timelapse_title = Gtk.Label(label="<b>Timelapse</b>")
+        timelapse_title.set_use_markup(True)
+        timelapse_title.get_style_context().add_class("title")
+        timelapse_row.pack_start(timelapse_title, False, False, 0)
+        
+        timelapse_row.pack_start(Gtk.Label(label="cada"), False, False, 0)
+        self.timelapse_interval_entry = Gtk.SpinButton.new_with_range(1, 3600, 1)
+        self.timelapse_interval_entry.set_value(30)
+        timelapse_row.pack_start(self.timelapse_interval_entry, False, False, 0)
+        timelapse_row.pack_start(Gtk.Label(label="s"), False, False, 0)
+        
+        self.timelapse_video_button = Gtk.Button(label="Vídeo")
+        self.timelapse_video_button.connect("clicked", self.on_timelapse_video_clicked)
+        self.timelapse_video_button.get_style_context().add_class("mode-button")
+        self.timelapse_video_button.set_sensitive(False)
+        timelapse_row.pack_end(self.timelapse_video_button, False, False, 0)
+        self.timelapse_button = Gtk.Button(label="Iniciar")
+        self.timelapse_button.connect("clicked", self.on_timelapse_clicked)
+        self.timelapse_button.get_style_context().add_class("mode-button")
+        timelapse_row.pack_end(self.timelapse_button, False, False, 0)
+        
+        # Retención: 0 es sin límite
+        retention_row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        timelapse_box.pack_start(retention_row, False, False, 0)
+        retention_row.pack_start(Gtk.Label(label="Conservar"), False, False, 0)
+        self.timelapse_frames_entry = Gtk.SpinButton.new_with_range(0, 1000000, 100)
+        self.timelapse_frames_entry.set_value(2880)
+        self.timelapse_frames_entry.set_tooltip_text("Máximo de fotogramas (0 = sin límite)")
+        retention_row.pack_start(self.timelapse_frames_entry, False, False, 0)
+        retention_row.pack_start(Gtk.Label(label="fotogramas /"), False, False, 0)
+        self.timelapse_mib_entry = Gtk.SpinButton.new_with_range(0, 1000000, 256)
+        self.timelapse_mib_entry.set_value(2048)
+        self.timelapse_mib_entry.set_tooltip_text("Máximo en disco (0 = sin límite)")
+        retention_row.pack_start(self.timelapse_mib_entry, False, False, 0)
+        retention_row.pack_start(Gtk.Label(label="MiB"), False, False, 0)
+        
+        self.timelapse_label = Gtk.Label()
+        self.timelapse_label.set_halign(Gtk.Align.START)
+        timelapse_box.pack_start(self.timelapse_label, False, False, 0)
+        
         # Frame para formato de imagen
         format_frame = Gtk.Frame()
         format_frame.get_style_context().add_class("frame")
@@ -219,13 +1248,13 @@ class GrimScreenshotTool:
         format_frame.add(format_box)
         
         # Título
-        format_title = Gtk.Label(label="<b>Formato de Imagen</b>")
+        format_title = Gtk.Label(label="<b>Formato y Destino</b>")
         format_title.set_use_markup(True)
         format_title.get_style_context().add_class("title")
         format_title.set_halign(Gtk.Align.START)
         format_box.pack_start(format_title, False, False, 0)
         
-        # Botones de formato
+        # Botones de formato y destino
         format_buttons_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=0)
         format_box.pack_start(format_buttons_box, False, False, 0)
         
@@ -241,6 +1270,41 @@ class GrimScreenshotTool:
             format_buttons_box.pack_start(btn, False, False, 0)
             self.format_buttons.append(btn)
         
+        # Botones de preset de codificación
+        preset_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=0)
+        format_box.pack_start(preset_box, False, False, 0)
+        
+        presets = [("fast", "Rápido"), ("balanced", "Equilibrado"), ("smallest", "Mínimo")]
+        self.preset_buttons = {}
+        
+        for preset, label in presets:
+            btn = Gtk.Button(label=label)
+            btn.connect("clicked", self.on_preset_changed, preset)
+            btn.get_style_context().add_class("format-button")
+            btn.set_tooltip_text(
+                f"PNG nivel {PRESETS[preset]['png_level']}, JPG/WebP calidad {PRESETS[preset]['quality']}"
+            )
+            if preset == "balanced":
+                btn.get_style_context().add_class("active")
+            preset_box.pack_start(btn, False, False, 0)
+            self.preset_buttons[preset] = btn
+        
+        # Botones de destino
+        destination_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=0)
+        format_box.pack_start(destination_box, False, False, 0)
+        
+        destinations = [("file", "Archivo"), ("clipboard", "Portapapeles"), ("both", "Ambos")]
+        self.destination_buttons = {}
+        
+        for dest, label in destinations:
+            btn = Gtk.Button(label=label)
+            btn.connect("clicked", self.on_destination_changed, dest)
+            btn.get_style_context().add_class("format-button")
+            if dest == "file":
+                btn.get_style_context().add_class("active")
+            destination_box.pack_start(btn, False, False, 0)
+            self.destination_buttons[dest] = btn
+        
         # Frame para nombre y ruta
         path_frame = Gtk.Frame()
         path_frame.get_style_context().add_class("frame")
@@ -267,20 +1331,263 @@ class GrimScreenshotTool:
         self.capture_button.connect("clicked", self.on_capture_clicked)
         self.capture_button.get_style_context().add_class("capture-button")
         self.main_box.pack_start(self.capture_button, False, False, 12)
+        
+        # Cancelar las capturas diferidas, visible solo durante la cuenta atrás
+        self.cancel_button = Gtk.Button(label="Cancelar cuenta atrás")
+        self.cancel_button.connect("clicked", self.on_cancel_clicked)
+        self.cancel_button.get_style_context().add_class("mode-button")
+        self.cancel_button.set_no_show_all(True)
+        self.main_box.pack_start(self.cancel_button, False, False, 0)
+        
+        # Línea de estado no modal para el resultado de las capturas
+        self.status_label = Gtk.Label(label="Listo")
+        self.status_label.get_style_context().add_class("status-label")
+        self.status_label.set_line_wrap(True)
+        self.status_label.set_halign(Gtk.Align.START)
+        self.main_box.pack_start(self.status_label, False, False, 0)
+        
+        # Tira con las últimas capturas; las miniaturas se piden al dibujarse
+        history_scroll = Gtk.ScrolledWindow()
+        history_scroll.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.NEVER)
+        history_scroll.set_min_content_height(THUMB_HEIGHT + 16)
+        self.history_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        history_scroll.add(self.history_box)
+        self.main_box.pack_start(history_scroll, False, False, 8)
+        
+        recent = []
+        if self.index:
+            recent = [path for _, path, _, _, _ in self.index.find(limit=HISTORY_SIZE) if os.path.exists(path)]
+        for path in reversed(recent):
+            self.add_to_history(path)
 
     def default_filename(self):
-        now = datetime.now()
-        return f"captura_{now.strftime('%Y%m%d_%H%M%S')}.{self.image_format}"
+        return default_filename(self.image_format)
+
+    def after_first_frame(self, callback):
+        """Llama a callback() cuando la ventana termina de pintar su siguiente fotograma."""
+        def after_paint(clock):
+            clock.disconnect(handler)
+            callback()
+        
+        self.window.realize()
+        clock = self.window.get_frame_clock()
+        handler = clock.connect("after-paint", after_paint)
+
+    def present_window(self, on_first_frame=None):
+        """Muestra la ventana y llama a on_first_frame() cuando ya está pintada."""
+        if self.window.get_visible():
+            self.window.present()
+            if on_first_frame:
+                on_first_frame()
+            return
+        if on_first_frame:
+            self.after_first_frame(on_first_frame)
+        self.window.present()
+
+    def on_delete(self, window, event):
+        # En modo residente cerrar solo oculta; la ventana se reutiliza
+        if self.resident:
+            window.hide()
+            return True
+        return False
+
+    def handle_command(self, command, reply=None):
+        if command == "ping":
+            pass
+        elif command == "show":
+            self.present_window(reply)
+            return None
+        elif command == "hide":
+            self.window.hide()
+        elif command == "toggle":
+            if self.window.get_visible():
+                self.window.hide()
+            else:
+                self.present_window(reply)
+                return None
+        elif command in ("capture outputs", "capture focused"):
+            filename = self.filename_entry.get_text().strip() or self.default_filename()
+            selection = "all" if command == "capture outputs" else "focused"
+            GLib.idle_add(self.capture_now, filename, "outputs", None, selection)
+        elif command in ("capture last", "copy last"):
+            destination = "clipboard" if command == "copy last" else self.destination
+            if self.regions.last() is None:
+                return "no hay ninguna región reciente"
+            GLib.idle_add(self.repeat_last_region, destination)
+        elif command.startswith(REGION_COMMANDS):
+            action, _, name = command.split(" ", 2)
+            geometry = self.regions.get(name)
+            if geometry is None:
+                return f"región desconocida: {name}"
+            destination = "clipboard" if action == "copy" else self.destination
+            filename = self.filename_entry.get_text().strip() or self.default_filename()
+            GLib.idle_add(self.capture_now, filename, "area", destination, None, geometry)
+        elif command.startswith(("capture ", "copy ")):
+            action, mode = command.split(" ", 1)
+            destination = "clipboard" if action == "copy" else self.destination
+            filename = self.filename_entry.get_text().strip() or self.default_filename()
+            GLib.idle_add(self.capture_now, filename, mode, destination)
+        elif command == "timelapse start":
+            if self.timelapse and self.timelapse.running:
+                return "el timelapse ya está en marcha"
+            GLib.idle_add(self.on_timelapse_clicked, self.timelapse_button)
+        elif command == "timelapse stop":
+            if not (self.timelapse and self.timelapse.running):
+                return "no hay ningún timelapse en marcha"
+            GLib.idle_add(self.on_timelapse_clicked, self.timelapse_button)
+        elif command == "timelapse video":
+            if self.timelapse is None:
+                return "no hay ningún timelapse"
+            GLib.idle_add(self.on_timelapse_video_clicked, self.timelapse_video_button)
+        elif command == "cancel":
+            self.scheduler.cancel()
+        elif command == "timing":
+            return f"ok {self.scheduler.summary()}; ocultar ventana: {self.hide_summary()}"
+        elif command == "trace":
+            if not trace.enabled:
+                return "trazas desactivadas: arranca con --trace FICHERO o SOMEPYAPPS_TRACE"
+            return f"ok {trace.dump()}"
+        elif command == "quit":
+            GLib.idle_add(Gtk.main_quit)
+        else:
+            return f"orden desconocida: {command}"
+        return "ok"
+
+    def add_to_history(self, path):
+        """Pone path al principio de la tira, quitando la entrada más antigua si sobra."""
+        path = os.path.abspath(path)
+        if path in self.history_images:
+            self.history_images.pop(path).get_parent().destroy()
+        image = Gtk.Image.new_from_icon_name("image-x-generic", Gtk.IconSize.DIALOG)
+        image.set_size_request(THUMB_WIDTH, THUMB_HEIGHT)
+        image.connect("draw", self.on_history_draw, path)
+        button = Gtk.Button()
+        button.add(image)
+        button.set_tooltip_text(path)
+        button.set_relief(Gtk.ReliefStyle.NONE)
+        button.connect("clicked", lambda button: self.open_capture(path))
+        self.history_box.pack_start(button, False, False, 0)
+        self.history_box.reorder_child(button, 0)
+        button.show_all()
+        self.history_images[path] = image
+        while len(self.history_images) > HISTORY_SIZE:
+            oldest = next(iter(self.history_images))
+            self.history_images.pop(oldest).get_parent().destroy()
+
+    def on_history_draw(self, image, cr, path):
+        # Solo la primera vez: a partir de ahí la imagen ya tiene su miniatura
+        image.disconnect_by_func(self.on_history_draw)
+        pixbuf = self.thumbnails.get(path)
+        if pixbuf is not None:
+            image.set_from_pixbuf(pixbuf)
+        return False
+
+    def on_thumbnail_ready(self, path, pixbuf):
+        image = self.history_images.get(path)
+        if image is not None:
+            image.set_from_pixbuf(pixbuf)
+        return False
+
+    def open_capture(self, path):
+        try:
+            Gtk.show_uri_on_window(self.window, GLib.filename_to_uri(path), Gdk.CURRENT_TIME)
+        except GLib.Error as e:
+            self.show_message("No se pudo abrir", str(e))
 
     def on_capture_mode_changed(self, button, mode):
         self.capture_mode = mode
         
-        if mode == "full":
-            self.full_button.get_style_context().add_class("active")
-            self.area_button.get_style_context().remove_class("active")
+        for name, btn in self.mode_buttons.items():
+            if name == mode:
+                btn.get_style_context().add_class("active")
+            else:
+                btn.get_style_context().remove_class("active")
+        
+        if mode == "outputs":
+            self.refresh_outputs()
+            self.outputs_box.show_all()
+        else:
+            self.outputs_box.hide()
+        
+        if mode == "area":
+            self.refresh_regions()
+            self.regions_box.show_all()
         else:
-            self.full_button.get_style_context().remove_class("active")
-            self.area_button.get_style_context().add_class("active")
+            self.regions_box.hide()
+
+    def refresh_regions(self):
+        self.regions.reload()
+        active = self.regions_combo.get_active_id()
+        self.regions_combo.remove_all()
+        self.region_choices = {"new": None}
+        self.regions_combo.append("new", "Nueva selección (slurp)")
+        for name, geometry in sorted(self.regions.named.items()):
+            self.region_choices[f"named:{name}"] = geometry
+            self.regions_combo.append(f"named:{name}", f"{name} ({geometry})")
+        for i, geometry in enumerate(self.regions.recent):
+            self.region_choices[f"recent:{i}"] = geometry
+            self.regions_combo.append(f"recent:{i}", geometry)
+        self.regions_combo.set_active_id(active if active in self.region_choices else "new")
+
+    def selected_region(self):
+        return self.region_choices.get(self.regions_combo.get_active_id())
+
+    def on_repeat_region_clicked(self, button):
+        self.repeat_last_region()
+
+    def repeat_last_region(self, destination=None):
+        geometry = self.regions.last()
+        if geometry is None:
+            self.show_message("Sin regiones", "Todavía no se ha seleccionado ningún área")
+            return False
+        filename = self.filename_entry.get_text().strip() or self.default_filename()
+        self.capture_now(filename, "area", destination, geometry=geometry)
+        return False
+
+    def on_save_region_clicked(self, button):
+        name = self.region_name_entry.get_text().strip()
+        geometry = self.selected_region() or self.regions.last()
+        if not name or geometry is None:
+            self.show_message("Región sin guardar", "Hace falta un nombre y una región seleccionada")
+            return
+        self.regions.name(name, geometry)
+        self.region_name_entry.set_text("")
+        self.refresh_regions()
+        self.regions_combo.set_active_id(f"named:{name}")
+
+    def on_key_press(self, widget, event):
+        # Ctrl+R repite la última región sin pasar por slurp
+        if event.keyval in (Gdk.KEY_r, Gdk.KEY_R) and event.state & Gdk.ModifierType.CONTROL_MASK:
+            self.repeat_last_region()
+            return True
+        return False
+
+    def refresh_outputs(self):
+        try:
+            outputs = list_outputs()
+        except CaptureError as e:
+            self.show_message(e.title, str(e))
+            outputs = []
+        
+        previous = {name for name, check in self.output_checks.items() if check.get_active()}
+        for check in self.output_checks.values():
+            check.destroy()
+        self.output_checks = {}
+        for output in outputs:
+            check = Gtk.CheckButton(label=output.name)
+            check.set_active(output.name in previous or (not previous and output.focused))
+            check.connect("toggled", self.on_output_selection_changed)
+            self.output_checks_box.pack_start(check, False, False, 0)
+            self.output_checks[output.name] = check
+        self.on_output_selection_changed(self.outputs_combo)
+
+    def on_output_selection_changed(self, widget):
+        selection = self.outputs_combo.get_active_id()
+        self.output_checks_box.set_sensitive(selection == "custom")
+        if selection == "custom":
+            self.output_selection = [name for name, check in self.output_checks.items() if check.get_active()]
+        else:
+            self.output_selection = selection
 
     def on_cursor_toggled(self, button):
         self.include_cursor = button.get_active()
@@ -298,104 +1605,347 @@ class GrimScreenshotTool:
         base = os.path.splitext(current_text)[0]
         self.filename_entry.set_text(f"{base}.{fmt}")
 
+    def on_preset_changed(self, button, preset):
+        self.preset = preset
+        
+        for name, btn in self.preset_buttons.items():
+            if name == preset:
+                btn.get_style_context().add_class("active")
+            else:
+                btn.get_style_context().remove_class("active")
+
+    def on_destination_changed(self, button, destination):
+        self.destination = destination
+        
+        for dest, btn in self.destination_buttons.items():
+            if dest == destination:
+                btn.get_style_context().add_class("active")
+            else:
+                btn.get_style_context().remove_class("active")
+
     def on_capture_clicked(self, button):
         filename = self.filename_entry.get_text().strip()
         if not filename:
             filename = self.default_filename()
         
-        self.timer_delay = int(self.timer_entry.get_value())
+        self.timer_delay = self.timer_entry.get_value()
         
         if self.timer_delay > 0:
-            self.capture_button.set_sensitive(False)
-            self.capture_button.set_label(f"Capturando en {self.timer_delay}...")
-            
-            # Iniciar cuenta regresiva
-            threading.Thread(target=self.countdown_and_capture, args=(filename,), daemon=True).start()
+            # Se puede encolar otra captura diferida mientras corre la cuenta atrás
+            self.scheduler.schedule(
+                self.timer_delay,
+                lambda entry: self.capture_now(filename, deadline=entry.deadline),
+                lead=self.hide_lead(),
+            )
+            self.filename_entry.set_text(self.default_filename())
         else:
-            # Ocultar ventana antes de capturar
-            self.window.hide()
-            # Pequeña pausa para asegurar que la ventana se haya ocultado
-            while Gtk.events_pending():
-                Gtk.main_iteration_do(False)
-            self.take_screenshot(filename)
+            self.capture_now(filename)
+
+    def on_cancel_clicked(self, button):
+        self.scheduler.cancel()
+        self.show_message("Cuenta atrás cancelada", "No se ha hecho ninguna captura")
+
+    def on_countdown_changed(self, remaining):
+        if remaining is None:
+            self.cancel_button.hide()
+            self.reset_capture_button()
+            return
+        label = f"Capturando en {math.ceil(remaining)}..."
+        if len(self.scheduler.pending) > 1:
+            label += f" (+{len(self.scheduler.pending) - 1})"
+        self.capture_button.set_label(label)
+        self.cancel_button.show()
+
+    def on_burst_clicked(self, button):
+        if self.capture_mode == "outputs":
+            # Cada fotograma es un único grim; por pantallas serían varias imágenes por instante
+            self.show_message("Ráfaga no disponible", "La ráfaga captura la pantalla completa o un área")
+            return
+        filename = self.filename_entry.get_text().strip() or self.default_filename()
+        burst = BurstCapture(
+            os.path.splitext(filename)[0],
+            self.image_format,
+            int(self.burst_frames_entry.get_value()),
+            self.burst_interval_entry.get_value() / 1000,
+            mode=self.capture_mode,
+            include_cursor=self.include_cursor,
+            preset=self.preset,
+            geometry=self.selected_region(),
+            regions=self.regions,
+            on_finished=self.on_burst_finished,
+        )
+        self.burst_button.set_sensitive(False)
+        # Igual que capture_now: la ventana queda oculta mientras alguna captura la necesite
+        self.hide_holds += 1
+        if self.window.get_visible():
+            self.reshow_wanted = True
+        self.filename_entry.set_text(self.default_filename())
+        self.hide_window(lambda latency, timed_out: burst.start())
+
+    def on_burst_finished(self, burst):
+        message = burst.summary()
+        if burst.errors:
+            message += "\n" + burst.errors[0]
+        self.show_message("Ráfaga terminada", message)
+        self.burst_button.set_sensitive(True)
+        self.release_window()
+        return False
+
+    def on_timelapse_clicked(self, button):
+        if self.timelapse and self.timelapse.running:
+            self.timelapse.stop()
+            self.timelapse_button.set_sensitive(False)
+            return False
+        filename = self.filename_entry.get_text().strip() or self.default_filename()
+        output = None
+        if self.capture_mode == "outputs":
+            # Una sola pantalla: la primera de la selección
+            try:
+                outputs = select_outputs(list_outputs(), self.output_selection)
+            except CaptureError as e:
+                self.show_message(e.title, str(e))
+                return False
+            output = outputs[0].name if outputs else None
+        self.timelapse = Timelapse(
+            f"{os.path.splitext(filename)[0]}_timelapse",
+            self.timelapse_interval_entry.get_value(),
+            self.image_format,
+            self.preset,
+            mode=self.capture_mode,
+            geometry=self.selected_region() if self.capture_mode == "area" else None,
+            output=output,
+            include_cursor=self.include_cursor,
+            regions=self.regions,
+            max_frames=int(self.timelapse_frames_entry.get_value()),
+            max_bytes=int(self.timelapse_mib_entry.get_value()) << 20,
+            on_change=self.on_timelapse_changed,
+        )
+        self.timelapse.start()
+        self.filename_entry.set_text(self.default_filename())
+        self.timelapse_button.set_label("Detener")
+        self.timelapse_video_button.set_sensitive(True)
+        return False
 
-    def countdown_and_capture(self, filename):
-        for i in range(self.timer_delay, 0, -1):
-            GLib.idle_add(self.update_button_label, i)
-            time.sleep(1)
+    def on_timelapse_changed(self, timelapse):
+        if timelapse is not self.timelapse:
+            return False
+        text = timelapse.summary()
+        if timelapse.errors:
+            text += f"\n{timelapse.errors[-1]}"
+        self.timelapse_label.set_text(text)
+        if timelapse.finished:
+            self.timelapse_button.set_label("Iniciar")
+            self.timelapse_button.set_sensitive(True)
+        return False
+
+    def on_timelapse_video_clicked(self, button):
+        timelapse = self.timelapse
+        filename = f"{timelapse.directory}.mp4"
+        self.timelapse_video_button.set_sensitive(False)
+        self.show_message("Montando vídeo...", filename)
         
-        # Ocultar ventana justo antes de capturar
-        GLib.idle_add(self.window.hide)
-        time.sleep(0.1)  # Pequeña pausa para asegurar que se oculte
+        def assemble():
+            error = timelapse.assemble(filename)
+            GLib.idle_add(self.on_timelapse_assembled, filename, error)
         
-        GLib.idle_add(self.take_screenshot, filename)
+        threading.Thread(target=assemble, daemon=True).start()
+        return False
 
-    def update_button_label(self, seconds):
-        self.capture_button.set_label(f"Capturando en {seconds}...")
+    def on_timelapse_assembled(self, filename, error):
+        self.timelapse_video_button.set_sensitive(True)
+        if error:
+            self.show_message("Error al montar el vídeo", error)
+        else:
+            self.show_message("Vídeo guardado", filename)
         return False
 
-    def take_screenshot(self, filename):
-        cmd = ["grim"]
+    def hide_window(self, callback, timeout=0.5):
+        """Oculta la ventana y llama a callback(latencia, timed_out) cuando ya no está en pantalla.
+
+        Se espera al unmap-event y a un ida y vuelta con el compositor; si no
+        llega en `timeout` segundos se sigue igualmente para no bloquear la captura.
+        Si otra ocultación sigue esperando, callback espera con ella.
+        """
+        if self.hide_waiters is not None:
+            # La ventana ya no está mapeada, pero el compositor aún no lo ha confirmado
+            self.hide_waiters.append(callback)
+            return
+        if not self.window.get_mapped():
+            callback(0.0, False)
+            return
+        start = time.monotonic()
+        pending = {}
+        waiters = self.hide_waiters = [callback]
         
-        if self.include_cursor:
-            cmd.append("-c")
+        def finish(timed_out):
+            self.window.disconnect(pending["handler"])
+            if not timed_out:
+                GLib.source_remove(pending["timer"])
+            # Garantiza que el compositor ya procesó el unmap antes de lanzar grim
+            self.window.get_display().sync()
+            latency = time.monotonic() - start
+            self.hide_latencies.append(latency)
+            trace.record("hide", start, cat="screenme", timed_out=timed_out)
+            
+            def notify():
+                self.hide_waiters = None
+                for waiter in waiters:
+                    waiter(latency, timed_out)
+                return False
+            
+            if HIDE_SETTLE_MS:
+                GLib.timeout_add(HIDE_SETTLE_MS, notify)
+            else:
+                notify()
         
-        if self.capture_mode == "area":
-            try:
-                slurp_process = subprocess.Popen(["slurp"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = slurp_process.communicate()
-                
-                if slurp_process.returncode != 0:
-                    if stderr:
-                        error_msg = stderr.decode().strip()
-                        if "selection cancelled" in error_msg.lower():
-                            self.show_message("Captura cancelada", "No se seleccionó ningún área")
-                        else:
-                            self.show_message("Error en slurp", error_msg)
-                    self.reset_capture_button()
-                    self.window.show()  # Mostrar ventana si hay error
-                    return
-                
-                selection = stdout.decode().strip()
-                cmd.extend(["-g", selection])
-            except FileNotFoundError:
-                self.show_message("Error", "slurp no está instalado. Instálalo con:\nsudo apt install grim slurp")
-                self.reset_capture_button()
-                self.window.show()  # Mostrar ventana si hay error
-                return
+        def on_unmap(window, event):
+            finish(False)
+            return False
+        
+        def on_timeout():
+            finish(True)
+            return False
         
-        cmd.append(filename)
+        pending["handler"] = self.window.connect("unmap-event", on_unmap)
+        pending["timer"] = GLib.timeout_add(int(timeout * 1000), on_timeout)
+        self.window.hide()
+
+    def hide_lead(self):
+        """Antelación con la que ocultar la ventana antes de una captura diferida."""
+        if not self.hide_latencies:
+            return 0.05
+        return min(0.5, max(self.hide_latencies) * 1.5)
+
+    def hide_summary(self):
+        if not self.hide_latencies:
+            return "sin medidas"
+        ms = [latency * 1000 for latency in self.hide_latencies]
+        return f"mediana {statistics.median(ms):.1f} ms, máx {max(ms):.1f} ms"
+
+    def capture_now(self, filename, mode=None, destination=None, outputs=None, geometry=None, deadline=None):
+        # Reservar la ventana oculta antes de ocultarla, por si entretanto termina otra captura
+        self.hide_holds += 1
+        if self.window.get_visible():
+            self.reshow_wanted = True
+        requested = time.monotonic()
         
+        def submit(hide_latency, timed_out):
+            job = self.take_screenshot(filename, mode, destination, outputs, geometry, deadline, hide_latency)
+            if job is not None:
+                job.requested = requested
+            return False
+        
+        def hidden(hide_latency, timed_out):
+            remaining = deadline - time.monotonic() if deadline is not None else 0
+            if remaining > 0:
+                # Se ocultó con antelación: grim sale justo en el plazo
+                GLib.timeout_add(math.ceil(remaining * 1000), submit, hide_latency, timed_out, priority=GLib.PRIORITY_HIGH)
+            else:
+                submit(hide_latency, timed_out)
+        
+        self.hide_window(hidden)
+        return False
+
+    def take_screenshot(self, filename, mode=None, destination=None, outputs=None, geometry=None,
+                        deadline=None, hide_latency=None):
+        """Encola la captura y devuelve su CaptureJob sin bloquear el bucle de GTK.
+
+        Quien llama debe haber reservado la ventana oculta con hide_holds; el
+        job la libera al terminar.
+        """
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            self.show_message("Captura exitosa", f"Imagen guardada como:\n{filename}")
-            self.filename_entry.set_text(self.default_filename())
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr if e.stderr else str(e)
-            self.show_message("Error al capturar", error_msg)
-        except FileNotFoundError:
-            self.show_message("Error", "grim no está instalado. Instálalo con:\nsudo apt install grim slurp")
-        finally:
+            job = self.engine.submit(
+                filename, mode or self.capture_mode, self.include_cursor,
+                destination or self.destination, self.image_format,
+                outputs or self.output_selection, self.combined_check.get_active(), self.preset,
+                geometry or self.selected_region(),
+            )
+        except queue.Full:
+            self.show_message("Cola llena", "Hay demasiadas capturas en curso, inténtalo de nuevo")
             self.reset_capture_button()
-            # Mostrar la ventana después de capturar
+            self.release_window()
+            return None
+        
+        job.deadline = deadline
+        job.hide_latency = hide_latency
+        # El nombre se renueva ya para que la siguiente captura no pise esta
+        self.filename_entry.set_text(self.default_filename())
+        self.reset_capture_button()
+        self.show_message("Capturando...", f"{self.engine.in_flight} en curso")
+        return job
+
+    def on_capture_finished(self, job):
+        title = "Captura exitosa"
+        if job.state == "done" and job.mode == "outputs":
+            names = "\n".join(os.path.basename(f) for f in job.saved)
+            message = f"{len(job.saved)} imágenes guardadas:\n{names}"
+        elif job.state == "done" and job.destination == "clipboard":
+            message = "Imagen copiada al portapapeles"
+        elif job.state == "done" and job.destination == "both":
+            message = f"Imagen copiada y guardada como:\n{job.filename}"
+        elif job.state == "done":
+            message = f"Imagen guardada como:\n{job.filename}"
+        else:
+            title, message = job.title, job.error
+        
+        for path, existing in job.duplicates:
+            if DUPLICATES == "skip":
+                message += f"\nYa existía igual: {existing}"
+            elif DUPLICATES == "link":
+                message += f"\n{os.path.basename(path)} es idéntica a {existing}: enlazada sin ocupar espacio"
+            else:
+                message += f"\n{os.path.basename(path)} es idéntica a {existing}"
+        
+        if job.deadline is not None and job.started is not None:
+            error = job.started - job.deadline
+            self.scheduler.record(error)
+            message += f"\nDesfase sobre el plazo: {error * 1000:+.1f} ms"
+        if job.hide_latency:
+            message += f"\nVentana oculta en {job.hide_latency * 1000:.1f} ms"
+        self.show_message(title, message)
+        
+        if job.mode == "area" and self.capture_mode == "area":
+            self.refresh_regions()
+        
+        if job.state == "done":
+            for path in job.saved if job.mode == "outputs" else [job.filename]:
+                if os.path.exists(path):
+                    self.add_to_history(path)
+        
+        trace.record("capture", job.requested or job.queued, cat="screenme", job=job.id, mode=job.mode, state=job.state)
+        self.release_window()
+        return False
+
+    def release_window(self):
+        self.hide_holds -= 1
+        # Mostrar la ventana cuando ya no quede ninguna captura que la necesite oculta
+        if self.hide_holds == 0 and self.reshow_wanted:
+            self.reshow_wanted = False
             self.window.show()
 
     def reset_capture_button(self):
+        if self.scheduler.pending:
+            return  # La cuenta atrás sigue pintando la etiqueta
         self.capture_button.set_label("Capturar Pantalla")
         self.capture_button.set_sensitive(True)
 
     def show_message(self, title, message):
-        dialog = Gtk.MessageDialog(
-            parent=self.window,
-            flags=0,
-            message_type=Gtk.MessageType.INFO,
-            buttons=Gtk.ButtonsType.OK,
-            text=title
+        self.status_label.set_markup(
+            f"<b>{GLib.markup_escape_text(title)}</b>\n{GLib.markup_escape_text(message)}"
         )
-        dialog.format_secondary_text(message)
-        dialog.run()
-        dialog.destroy()
 
 if __name__ == "__main__":
-    app = GrimScreenshotTool()
-    Gtk.main()
+    # Una orden sin instancia previa arranca la residente y la ejecuta
+    app = GrimScreenshotTool(resident=ARGS.resident or ARGS.command is not None)
+    if ARGS.command:
+        app.handle_command(ARGS.command)
+    if ARGS.exit_when_ready:
+        # Residente y oculta no pinta ningún fotograma: basta con que esté construida
+        if app.window.get_visible():
+            app.after_first_frame(Gtk.main_quit)
+        else:
+            GLib.idle_add(Gtk.main_quit)
+    try:
+        Gtk.main()
+    finally:
+        app.server.close()
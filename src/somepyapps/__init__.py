@@ -0,0 +1,15 @@
+"""Shared core of Screenme, Recordme and PyLogOut.
+
+Everything here except theme is plain standard library, so scripts and cron
+jobs can capture, record or run a power action without loading GTK:
+
+    capture   grim/slurp screenshots, saved regions and the capture index
+    record    wf-recorder profiles, geometries and a blocking record()
+    power     power actions and their hooks
+    outputs   monitor listing for Hyprland and Sway
+    control   Unix sockets of the resident instances
+    trace     opt-in timing spans of each phase, as JSON lines or Chrome trace
+    theme     Catppuccin Mocha palette and the GTK stylesheet (imports GTK lazily)
+
+`python3 -m somepyapps` is the command line entry point.
+"""
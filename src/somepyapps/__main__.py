@@ -0,0 +1,5 @@
+import sys
+
+from somepyapps.cli import main
+
+sys.exit(main())
@@ -0,0 +1,395 @@
+"""Capturas con grim y slurp sin GTK: regiones guardadas, índice de capturas y capture().
+
+Es la parte de Screenme que no necesita ventana. Screenme la usa para todo lo
+que no decodifica píxeles, y `python3 -m somepyapps capture` para capturar
+desde scripts o cron en unos milisegundos.
+"""
+
+import itertools
+import json
+import os
+import re
+import shlex
+import sqlite3
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+from somepyapps import trace
+from somepyapps.outputs import OutputError, output_provider
+
+REGIONS_PATH = os.path.join(
+    os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "screenme", "regions.json"
+)
+GEOMETRY_RE = re.compile(r"^-?\d+,-?\d+ \d+x\d+$")
+INDEX_PATH = os.environ.get("SCREENME_INDEX") or os.path.join(
+    os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "screenme", "captures.sqlite3"
+)
+# Qué hacer con una captura idéntica a otra ya indexada: link (enlace duro), skip o keep
+DUPLICATES = os.environ.get("SCREENME_DUPLICATES", "link")
+
+GRIM_MISSING = "grim no está instalado. Instálalo con:\nsudo apt install grim slurp"
+SLURP_MISSING = "slurp no está instalado. Instálalo con:\nsudo apt install grim slurp"
+# Tipos de `grim -t` y MIME para las capturas que salen por stdout
+GRIM_TYPES = {"png": "png", "jpg": "jpeg", "webp": "webp"}
+MIME_TYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp"}
+# Presets de codificación: nivel de compresión PNG (grim -l, 0-9) y calidad
+# JPEG/WebP (grim -q, 0-100). "balanced" coincide con los valores por defecto de grim.
+PRESETS = {
+    "fast": {"png_level": 1, "quality": 90},
+    "balanced": {"png_level": 6, "quality": 80},
+    "smallest": {"png_level": 9, "quality": 60},
+}
+# Orden que recibe la imagen por stdin; {mime} se sustituye por el tipo
+CLIPBOARD_CMD = os.environ.get("SCREENME_CLIPBOARD_CMD", "wl-copy --type {mime}")
+
+# slurp es interactivo: nunca dos selectores a la vez
+selector_lock = threading.Lock()
+
+
+class CaptureError(Exception):
+    def __init__(self, title, message, state="failed"):
+        super().__init__(message)
+        self.title = title
+        self.state = state
+
+
+def select_area(regions=None):
+    """Lanza slurp y devuelve la geometría elegida. Lanza CaptureError si falla o se cancela.
+
+    Si se pasa un RegionCache la geometría queda guardada como la más reciente.
+    """
+    try:
+        with selector_lock, trace.span("slurp", "capture"):
+            slurp_process = subprocess.run(["slurp"], capture_output=True, text=True)
+    except FileNotFoundError:
+        raise CaptureError("Error", SLURP_MISSING)
+    if slurp_process.returncode != 0:
+        error_msg = slurp_process.stderr.strip()
+        if not error_msg or "selection cancelled" in error_msg.lower():
+            raise CaptureError("Captura cancelada", "No se seleccionó ningún área", "cancelled")
+        raise CaptureError("Error en slurp", error_msg)
+    geometry = slurp_process.stdout.strip()
+    if regions is not None:
+        regions.add_recent(geometry)
+    return geometry
+
+
+def grim_command(include_cursor=False, geometry=None):
+    cmd = ["grim"]
+    if include_cursor:
+        cmd.append("-c")
+    if geometry:
+        cmd.extend(["-g", geometry])
+    return cmd
+
+
+def encoder_args(image_format, preset="balanced"):
+    """Parámetros de codificación de grim para el formato y preset dados."""
+    if image_format == "png":
+        return ["-l", str(PRESETS[preset]["png_level"])]
+    return ["-q", str(PRESETS[preset]["quality"])]
+
+
+def stream_capture(cmd, image_format, filename=None, clipboard=False, preset="balanced"):
+    """Ejecuta grim hacia stdout y reparte la imagen entre fichero y portapapeles.
+
+    No se usa ningún fichero temporal: con solo portapapeles la tubería de grim
+    se conecta directamente a wl-copy, y con ambos destinos cada bloque leído
+    se escribe a los dos.
+    """
+    grim = subprocess.Popen(
+        cmd + encoder_args(image_format, preset) + ["-t", GRIM_TYPES[image_format], "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    copier = None
+    try:
+        if clipboard:
+            copy_cmd = shlex.split(CLIPBOARD_CMD.format(mime=MIME_TYPES[image_format]))
+            try:
+                copier = subprocess.Popen(
+                    copy_cmd,
+                    stdin=grim.stdout if filename is None else subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+            except FileNotFoundError:
+                raise CaptureError("Error", f"{copy_cmd[0]} no está instalado. Instálalo con:\nsudo apt install wl-clipboard")
+        if filename is None:
+            grim.stdout.close()  # Solo lo lee wl-copy
+        else:
+            sink = copier.stdin if copier else None
+            with open(filename, "wb") as output:
+                for chunk in iter(lambda: grim.stdout.read(65536), b""):
+                    output.write(chunk)
+                    if sink:
+                        try:
+                            sink.write(chunk)
+                        except BrokenPipeError:
+                            sink = None  # El fichero se sigue escribiendo; el error sale por returncode
+            if copier:
+                try:
+                    copier.stdin.close()
+                except BrokenPipeError:
+                    pass
+    finally:
+        if not grim.stdout.closed:
+            grim.stdout.close()
+        grim_error = grim.stderr.read().decode(errors="replace").strip()
+        grim.wait()
+        if copier:
+            copier.wait()
+    if grim.returncode != 0:
+        raise CaptureError("Error al capturar", grim_error or f"grim terminó con código {grim.returncode}")
+    if copier and copier.returncode != 0:
+        raise CaptureError("Error al copiar", copier.stderr.read().decode(errors="replace").strip())
+
+
+def reserve_filename(path):
+    """Crea el fichero en exclusiva (añadiendo -1, -2... si existe) y devuelve la ruta reservada."""
+    base, ext = os.path.splitext(path)
+    for n in itertools.count():
+        candidate = f"{base}-{n}{ext}" if n else path
+        try:
+            os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return candidate
+        except FileExistsError:
+            continue
+
+
+def select_outputs(outputs, selection):
+    """selection es "all", "focused" o una lista de nombres."""
+    if selection == "all":
+        return outputs
+    if selection == "focused":
+        return [o for o in outputs if o.focused][:1] or outputs[:1]
+    return [o for o in outputs if o.name in selection]
+
+
+def list_outputs():
+    """Pantallas según SCREENME_OUTPUTS. Lanza CaptureError si no se pueden listar."""
+    try:
+        return output_provider("SCREENME").list()
+    except (OutputError, ValueError) as e:
+        raise CaptureError("Error al listar pantallas", str(e))
+
+
+def default_filename(image_format="png"):
+    now = datetime.now()
+    return f"captura_{now.strftime('%Y%m%d_%H%M%S')}_{now.microsecond // 1000:03d}.{image_format}"
+
+
+def grab(filename=None, geometry=None, output=None, include_cursor=False, image_format="png", preset="balanced",
+         clipboard=False):
+    """Una captura con grim hacia filename, el portapapeles o ambos. Lanza CaptureError."""
+    cmd = grim_command(include_cursor, geometry)
+    if output:
+        cmd.extend(["-o", output])
+    try:
+        with trace.span("grim", "capture", format=image_format, clipboard=clipboard, to_file=filename is not None):
+            if clipboard:
+                stream_capture(cmd, image_format, filename, clipboard=True, preset=preset)
+            else:
+                subprocess.run(
+                    cmd + encoder_args(image_format, preset) + [filename], check=True, capture_output=True, text=True
+                )
+    except subprocess.CalledProcessError as e:
+        raise CaptureError("Error al capturar", e.stderr.strip() if e.stderr else str(e))
+    except FileNotFoundError:
+        raise CaptureError("Error", GRIM_MISSING)
+
+
+class RegionCache:
+    """Últimas geometrías devueltas por slurp y regiones con nombre, guardadas en REGIONS_PATH.
+
+    El fichero se vuelve a leer si cambia en disco, así la instancia residente
+    ve las regiones que se nombran desde la línea de órdenes.
+    """
+
+    def __init__(self, path=REGIONS_PATH, size=10):
+        self.path = path
+        self.size = size
+        self.recent = []
+        self.named = {}
+        self.mtime = None
+        self.lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self.mtime:
+                return
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.recent = data.get("recent", [])[: self.size]
+        self.named = data.get("named", {})
+        self.mtime = mtime
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"recent": self.recent, "named": self.named}, f, indent=2)
+        os.replace(tmp, self.path)
+        self.mtime = os.stat(self.path).st_mtime_ns
+
+    def add_recent(self, geometry):
+        with self.lock:
+            self.reload()
+            if geometry in self.recent:
+                self.recent.remove(geometry)
+            self.recent.insert(0, geometry)
+            del self.recent[self.size:]
+            self.save()
+
+    def name(self, name, geometry):
+        with self.lock:
+            self.reload()
+            self.named[name] = geometry
+            self.save()
+
+    def last(self):
+        self.reload()
+        return self.recent[0] if self.recent else None
+
+    def get(self, name):
+        self.reload()
+        return self.named.get(name)
+
+
+class CaptureIndex:
+    """Índice SQLite de capturas por hash de los píxeles decodificados.
+
+    Una captura idéntica a otra que sigue en disco se sustituye por un enlace
+    duro a ella (policy "link"), se borra ("skip") o se guarda igual ("keep").
+    El hash perceptual (dHash de 64 bits) es opcional y solo se guarda en la
+    columna phash. Las búsquedas por hash, fecha, región y pantalla van por índice.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS captures (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            pixel_hash BLOB NOT NULL,
+            phash INTEGER,
+            width INTEGER,
+            height INTEGER,
+            size INTEGER,
+            taken REAL NOT NULL,
+            mode TEXT,
+            geometry TEXT,
+            output TEXT,
+            duplicate_of INTEGER REFERENCES captures(id)
+        );
+        CREATE INDEX IF NOT EXISTS captures_hash ON captures(pixel_hash);
+        CREATE INDEX IF NOT EXISTS captures_taken ON captures(taken);
+        CREATE INDEX IF NOT EXISTS captures_geometry ON captures(geometry, taken);
+        CREATE INDEX IF NOT EXISTS captures_output ON captures(output, taken);
+    """
+
+    def __init__(self, path=INDEX_PATH, policy=DUPLICATES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.policy = policy
+        self.lock = threading.Lock()
+        # Una sola conexión compartida por los hilos de captura, serializada con el lock
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(self.SCHEMA)
+
+    def add(self, path, pixel_hash, width, height, mode=None, geometry=None, output=None, phash=None):
+        """Indexa path y aplica la política de duplicados. Devuelve la ruta con la que existía o None."""
+        path = os.path.abspath(path)
+        with self.lock, self.db:
+            existing = None
+            for row_id, candidate in self.db.execute(
+                "SELECT id, path FROM captures WHERE pixel_hash = ? AND path != ? ORDER BY id", (pixel_hash, path)
+            ):
+                if os.path.exists(candidate):
+                    existing = (row_id, candidate)
+                    break
+
+            if existing and self.policy == "skip":
+                os.unlink(path)
+                return existing[1]
+            if existing and self.policy == "link":
+                tmp = f"{path}.link"
+                try:
+                    os.link(existing[1], tmp)
+                    os.replace(tmp, path)
+                except OSError:
+                    pass  # Otro sistema de ficheros: se queda la copia
+            if phash is not None and phash >= 1 << 63:
+                phash -= 1 << 64  # INTEGER de SQLite es de 64 bits con signo
+            self.db.execute(
+                "INSERT OR REPLACE INTO captures"
+                " (path, pixel_hash, phash, width, height, size, taken, mode, geometry, output, duplicate_of)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path, pixel_hash, phash, width, height, os.path.getsize(path), time.time(),
+                    mode, geometry, output, existing[0] if existing else None,
+                ),
+            )
+            return existing[1] if existing else None
+
+    def find(self, since=None, until=None, geometry=None, output=None, limit=50):
+        """Capturas más recientes primero como (taken, path, mode, geometry, output)."""
+        clauses, params = [], []
+        for clause, value in (("taken >= ?", since), ("taken < ?", until), ("geometry = ?", geometry), ("output = ?", output)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            return self.db.execute(
+                f"SELECT taken, path, mode, geometry, output FROM captures {where} ORDER BY taken DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+
+
+def capture(mode="full", name=None, filename=None, image_format="png", preset="balanced", include_cursor=False,
+            clipboard=False, keep_file=True, regions=None):
+    """Captura sin GTK para scripts y cron. Devuelve la ruta guardada, o None si solo va al portapapeles.
+
+    mode es full, area (slurp), last (la última región), region (la región con
+    nombre name), output (la pantalla name) o focused. Los ficheros se reservan
+    como en Screenme, sin pisar nunca uno existente, pero no entran en el
+    índice, que necesita decodificar los píxeles con GdkPixbuf. Lanza CaptureError.
+    """
+    if not keep_file and not clipboard:
+        raise CaptureError("Sin destino", "La captura no se guarda ni se copia al portapapeles")
+    regions = regions or RegionCache()
+    geometry = output = None
+    if mode == "area":
+        geometry = select_area(regions)
+    elif mode == "last":
+        geometry = regions.last()
+        if geometry is None:
+            raise CaptureError("Sin región", "No hay ninguna región reciente")
+    elif mode == "region":
+        geometry = regions.get(name)
+        if geometry is None:
+            raise CaptureError("Región desconocida", f"No hay ninguna región llamada {name}")
+    elif mode == "output":
+        output = name
+    elif mode == "focused":
+        outputs = select_outputs(list_outputs(), "focused")
+        if not outputs:
+            raise CaptureError("Sin pantallas", "No hay ninguna pantalla")
+        output = outputs[0].name
+    elif mode != "full":
+        raise ValueError(f"modo desconocido: {mode}")
+
+    if keep_file:
+        filename = reserve_filename(filename or default_filename(image_format))
+    else:
+        filename = None
+    try:
+        grab(filename, geometry, output, include_cursor, image_format, preset, clipboard)
+    except CaptureError:
+        if filename:
+            os.unlink(filename)
+        raise
+    return filename
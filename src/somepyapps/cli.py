@@ -0,0 +1,114 @@
+"""Command line entry point: python3 -m somepyapps capture|record|power ...
+
+Each subcommand imports only its own module, so nothing here loads GTK.
+"""
+
+import argparse
+import sys
+
+from somepyapps import trace
+
+CAPTURE_MODES = ("full", "area", "last", "focused", "region", "output")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="somepyapps", description="Capture, record and power actions without GTK")
+    parser.add_argument("--trace", metavar="FILE", help="write phase timings to FILE (.json: Chrome trace, -: stderr)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    capture = commands.add_parser("capture", help="take a screenshot with grim")
+    capture.add_argument("mode", nargs="?", default="full", choices=CAPTURE_MODES)
+    capture.add_argument("name", nargs="?", help="region name (region) or output name (output)")
+    capture.add_argument("-o", "--file", help="where to save it (default: captura_<date>.<format>)")
+    capture.add_argument("-t", "--format", default="png", choices=("png", "jpg", "webp"))
+    capture.add_argument("--preset", default="balanced", choices=("fast", "balanced", "smallest"))
+    capture.add_argument("-c", "--cursor", action="store_true", help="include the pointer")
+    clipboard = capture.add_mutually_exclusive_group()
+    clipboard.add_argument("--copy", action="store_true", help="also copy it to the clipboard")
+    clipboard.add_argument("--copy-only", action="store_true", help="copy it to the clipboard without saving")
+
+    record = commands.add_parser("record", help="record the screen with wf-recorder")
+    record.add_argument("file", nargs="?", help="output file; the extension picks the container (default: mkv)")
+    record.add_argument("-d", "--duration", type=float, help="seconds to record (default: until Ctrl+C)")
+    record.add_argument("-p", "--profile", default="default")
+    target = record.add_mutually_exclusive_group()
+    target.add_argument("--output", help="record a single output")
+    target.add_argument("--geometry", help="record a region, in slurp format: 'x,y WxH'")
+    target.add_argument("--region", help="record a geometry named in Recordme")
+    target.add_argument("--area", action="store_true", help="pick the region with slurp")
+
+    power = commands.add_parser("power", help="run a power action after its hooks")
+    power.add_argument("action", choices=("logout", "poweroff", "reboot", "suspend"))
+    power.add_argument("--no-hooks", action="store_true", help="skip the hooks in ~/.config/pylogout/hooks.json")
+    power.add_argument("-n", "--dry-run", action="store_true", help="print the hooks and the command instead of running them")
+
+    args = parser.parse_args(argv)
+    if args.command == "capture" and (args.name is None) == (args.mode in ("region", "output")):
+        parser.error(f"capture {args.mode} {'needs' if args.name is None else 'takes no'} name")
+    return args
+
+
+def run_capture(args):
+    from somepyapps.capture import CaptureError, capture
+
+    try:
+        filename = capture(
+            args.mode, args.name, args.file, args.format, args.preset, args.cursor,
+            clipboard=args.copy or args.copy_only, keep_file=not args.copy_only,
+        )
+    except CaptureError as e:
+        print(f"{e.title}: {e}", file=sys.stderr)
+        return 1
+    if filename:
+        print(filename)
+    return 0
+
+
+def run_record(args):
+    from somepyapps.record import (
+        CONTAINERS, GEOMETRY_RE, PROFILES, GeometryCache, RecordError, default_filename, pick_geometry, record,
+    )
+
+    if args.profile not in PROFILES:
+        print(f"Unknown profile {args.profile}; choose one of {', '.join(PROFILES)}", file=sys.stderr)
+        return 2
+    geometry = args.geometry
+    try:
+        if geometry and not GEOMETRY_RE.match(geometry):
+            raise RecordError(f"Invalid geometry: {geometry}")
+        if args.region:
+            geometry = GeometryCache().named.get(args.region)
+            if geometry is None:
+                raise RecordError(f"No geometry named {args.region}")
+        elif args.area:
+            geometry = pick_geometry(GeometryCache())
+        filename = record(
+            args.file or default_filename(CONTAINERS[0]), args.profile, args.output, geometry, args.duration
+        )
+    except RecordError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(filename)
+    return 0
+
+
+def run_power(args):
+    from somepyapps.power import PowerError, perform
+
+    try:
+        notes = perform(args.action, hooks=not args.no_hooks, dry_run=args.dry_run)
+    except PowerError as e:
+        print(e, file=sys.stderr)
+        return 1
+    for note in notes:
+        print(note)
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.trace:
+        trace.enable(args.trace)
+    with trace.span(args.command, "cli", argv=argv):
+        return {"capture": run_capture, "record": run_record, "power": run_power}[args.command](args)
@@ -0,0 +1,50 @@
+"""Sockets Unix de las instancias residentes: cliente y reserva del socket."""
+
+import os
+import socket
+
+
+def socket_path(app):
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"{app}-{os.getuid()}.sock")
+
+
+def send_command(path, command, timeout=2.0):
+    """Envía una orden a la instancia residente de path. Devuelve None si no hay ninguna."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        client.close()
+        return None
+    with client:
+        client.sendall(f"{command}\n".encode())
+        return client.recv(256).decode().strip()
+
+
+def claim_socket(path):
+    """Socket de escucha no bloqueante en path, o None si ya hay otra instancia en él."""
+    if send_command(path, "ping") is not None:
+        return None
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(path)
+    except OSError:
+        server.close()
+        return None
+    os.chmod(path, 0o600)
+    server.listen(8)
+    server.setblocking(False)
+    return server
+
+
+def release_socket(server, path):
+    server.close()
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
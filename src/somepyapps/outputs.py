@@ -0,0 +1,69 @@
+"""Monitor listing for Hyprland and Sway, plus made-up outputs for testing."""
+
+import collections
+import json
+import os
+import subprocess
+
+Output = collections.namedtuple("Output", "name x y width height focused")
+
+
+class OutputError(RuntimeError):
+    """The outputs could not be listed; the message says why."""
+
+
+def run_listing(cmd):
+    try:
+        return subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    except FileNotFoundError:
+        raise OutputError(f"{cmd[0]} is not available to list the outputs")
+    except subprocess.CalledProcessError as e:
+        raise OutputError(e.stderr.strip() or str(e))
+
+
+class HyprlandOutputs:
+    def list(self):
+        data = json.loads(run_listing(["hyprctl", "monitors", "-j"]))
+        return [Output(m["name"], m["x"], m["y"], m["width"], m["height"], m.get("focused", False)) for m in data]
+
+
+class SwayOutputs:
+    def list(self):
+        data = json.loads(run_listing(["swaymsg", "-r", "-t", "get_outputs"]))
+        return [
+            Output(o["name"], o["rect"]["x"], o["rect"]["y"], o["rect"]["width"], o["rect"]["height"], o.get("focused", False))
+            for o in data
+            if o.get("active", True)
+        ]
+
+
+class FakeOutputs:
+    """Made-up outputs for testing without a compositor.
+
+    spec may hold a JSON list of objects with the Output fields.
+    """
+
+    def __init__(self, spec=None):
+        self.spec = spec
+
+    def list(self):
+        if self.spec:
+            return [Output(**o) for o in json.loads(self.spec)]
+        return [
+            Output("FAKE-1", 0, 0, 1920, 1080, True),
+            Output("FAKE-2", 1920, 0, 2560, 1440, False),
+            Output("FAKE-3", 4480, 0, 1920, 1080, False),
+        ]
+
+
+def output_provider(prefix):
+    """Provider picked by <prefix>_OUTPUTS (hyprland, sway or fake), or guessed from SWAYSOCK.
+
+    With fake, <prefix>_FAKE_OUTPUTS may describe the outputs.
+    """
+    kind = os.environ.get(f"{prefix}_OUTPUTS")
+    if kind == "fake":
+        return FakeOutputs(os.environ.get(f"{prefix}_FAKE_OUTPUTS"))
+    if kind == "sway" or (kind is None and os.environ.get("SWAYSOCK")):
+        return SwayOutputs()
+    return HyprlandOutputs()
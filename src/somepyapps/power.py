@@ -0,0 +1,103 @@
+"""Acciones de energía (cerrar sesión, apagar, reiniciar, suspender) y sus ganchos, sin GTK.
+
+PyLogOut las ejecuta de forma asíncrona y por D-Bus; perform() hace lo mismo
+de forma bloqueante y con systemctl, que pide la acción a logind, para
+scripts y `python3 -m somepyapps power`.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from somepyapps import trace
+
+HOOKS_PATH = os.path.join(
+    os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "pylogout", "hooks.json"
+)
+# Método de org.freedesktop.login1.Manager de cada acción y orden de reserva si D-Bus falla
+ACTIONS = {
+    "logout": {"method": None, "fallback": ["hyprctl", "dispatch", "exit"], "label": "Cerrando sesión"},
+    "poweroff": {"method": "PowerOff", "fallback": ["systemctl", "poweroff"], "label": "Apagando"},
+    "reboot": {"method": "Reboot", "fallback": ["systemctl", "reboot"], "label": "Reiniciando"},
+    "suspend": {"method": "Suspend", "fallback": ["systemctl", "suspend"], "label": "Suspendiendo"},
+}
+# Ganchos si no hay fichero de configuración. "actions" limita a qué acciones se aplica cada uno
+DEFAULT_HOOKS = {"deadline": 10, "hooks": [{"command": "sync", "actions": ["poweroff", "reboot", "suspend"]}]}
+
+
+def load_hooks(path=HOOKS_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return DEFAULT_HOOKS
+    except (OSError, ValueError) as e:
+        print(f"No se pudo leer {path}: {e}", file=sys.stderr)
+        return DEFAULT_HOOKS
+
+
+def hooks_for(action, config):
+    return [hook["command"] for hook in config.get("hooks", []) if action in hook.get("actions", ACTIONS)]
+
+
+def run_hooks(action, config=None):
+    """Lanza en paralelo los ganchos de action con un único plazo. Devuelve (fallidos, sin terminar)."""
+    config = config or load_hooks()
+    started = time.monotonic()
+    deadline = started + config.get("deadline", 10)
+    pending, failed = {}, []
+    for command in hooks_for(action, config):
+        try:
+            process = subprocess.Popen(["sh", "-c", command], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            failed.append(command)
+            continue
+        pending[process] = command
+    for process, command in list(pending.items()):
+        try:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            continue
+        del pending[process]
+        if process.returncode != 0:
+            failed.append(command)
+    # Los que no han terminado a tiempo se matan y se sigue adelante
+    for process in pending:
+        process.kill()
+        process.wait()
+    trace.record("hooks", started, cat="power", action=action, failed=len(failed), late=len(pending))
+    return failed, list(pending.values())
+
+
+class PowerError(RuntimeError):
+    pass
+
+
+def perform(action, config=None, hooks=True, dry_run=False):
+    """Ejecuta los ganchos y después la acción. Devuelve los avisos de los ganchos; lanza PowerError.
+
+    Con dry_run no se ejecuta nada: se devuelven los ganchos y la orden que se lanzarían.
+    """
+    notes = []
+    cmd = ACTIONS[action]["fallback"]
+    if dry_run:
+        if hooks:
+            notes += [f"gancho: {command}" for command in hooks_for(action, config or load_hooks())]
+        notes.append(" ".join(cmd))
+        return notes
+    if hooks:
+        failed, late = run_hooks(action, config)
+        if failed:
+            notes.append(f"Ganchos con error: {', '.join(failed)}")
+        if late:
+            notes.append(f"Ganchos sin terminar a tiempo: {', '.join(late)}")
+    try:
+        with trace.span("action", "power", action=action, via=cmd[0]):
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    except FileNotFoundError:
+        raise PowerError(f"{cmd[0]} no está instalado")
+    if result.returncode != 0:
+        raise PowerError("\n".join([result.stderr.strip() or f"{cmd[0]} falló", *notes]))
+    return notes
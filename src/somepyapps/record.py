@@ -0,0 +1,313 @@
+"""wf-recorder without GTK: encoding profiles, saved geometries and a blocking record().
+
+This is the part of Recordme that needs no window or main loop. Recordme
+builds its recording sessions on it, and `python3 -m somepyapps record`
+records from scripts or cron.
+"""
+
+import json
+import os
+import re
+import shutil
+import signal
+import struct
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from somepyapps import trace
+
+CONTAINERS = ("mkv", "mp4", "webm")
+
+# Encoding profiles. codec/params map to wf-recorder -c/-p, framerate to -r and
+# scale to a -F scale filter applied at capture time. webm only takes VP8/VP9/AV1,
+# so each profile carries its own VP9 settings for that container. cost is the
+# expected CPU load of a 1080p software encode, shown next to the selector, and
+# bitrate a rough kbit/s estimate used to budget staging space.
+PROFILES = {
+    "default": {
+        "label": "wf-recorder default",
+        "cost": "~1.5 cores (x264 defaults, native size)", "bitrate": 8000,
+        "codec": None, "params": {}, "framerate": None, "scale": None,
+        "webm": {"codec": "libvpx-vp9", "params": {"deadline": "realtime", "cpu-used": "8"}},
+    },
+    "low-cpu": {
+        "label": "Low CPU",
+        "cost": "~0.3 cores (ultrafast, 720p, 30 fps)", "bitrate": 4000,
+        "codec": "libx264", "params": {"preset": "ultrafast", "tune": "zerolatency", "crf": "26"},
+        "framerate": 30, "scale": "scale=-2:720",
+        "webm": {"codec": "libvpx", "params": {"deadline": "realtime", "cpu-used": "16", "b": "2M"}},
+    },
+    "share-size": {
+        "label": "Share size",
+        "cost": "~0.8 cores (veryfast, 720p, 30 fps)", "bitrate": 1500,
+        "codec": "libx264", "params": {"preset": "veryfast", "crf": "30"},
+        "framerate": 30, "scale": "scale=-2:720",
+        "webm": {"codec": "libvpx-vp9", "params": {"deadline": "realtime", "cpu-used": "8", "crf": "40", "b": "0"}},
+    },
+    "archival": {
+        "label": "Archival",
+        "cost": "~3+ cores (slow, CRF 18, native size)", "bitrate": 16000,
+        "codec": "libx264", "params": {"preset": "slow", "crf": "18"},
+        "framerate": None, "scale": None,
+        "webm": {"codec": "libvpx-vp9", "params": {"deadline": "good", "cpu-used": "4", "crf": "24", "b": "0"}},
+    },
+}
+
+
+def encoder_args(profile_name, container="mkv"):
+    """wf-recorder arguments for the codec, parameters, framerate and scale of a profile."""
+    profile = PROFILES[profile_name]
+    codec, params = profile["codec"], profile["params"]
+    if container == "webm":
+        codec, params = profile["webm"]["codec"], profile["webm"]["params"]
+    args = []
+    if codec:
+        args += ["-c", codec]
+    for key, value in params.items():
+        args += ["-p", f"{key}={value}"]
+    if profile["framerate"]:
+        args += ["-r", str(profile["framerate"])]
+    if profile["scale"]:
+        args += ["-F", profile["scale"]]
+    return args
+
+
+def with_container(filename, container):
+    """Make the extension of filename match the chosen container."""
+    base, ext = os.path.splitext(filename)
+    if ext.lower().lstrip(".") in CONTAINERS:
+        return f"{base}.{container}"
+    return f"{filename}.{container}"
+
+
+def concat_entry(path):
+    """A `file` line for an ffmpeg concat list, with single quotes escaped as the demuxer expects."""
+    quoted = path.replace("'", "'\\''")
+    return f"file '{quoted}'\n"
+
+
+GEOMETRIES_PATH = os.path.join(
+    os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "recordme", "geometries.json"
+)
+GEOMETRY_RE = re.compile(r"^-?\d+,-?\d+ \d+x\d+$")
+
+
+class GeometryCache:
+    """Recent slurp geometries and named ones, kept in GEOMETRIES_PATH."""
+
+    def __init__(self, path=GEOMETRIES_PATH, size=5):
+        self.path = path
+        self.size = size
+        self.recent = []
+        self.named = {}
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.recent = data.get("recent", [])[:size]
+            self.named = data.get("named", {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"recent": self.recent, "named": self.named}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def add_recent(self, geometry):
+        if geometry in self.recent:
+            self.recent.remove(geometry)
+        self.recent.insert(0, geometry)
+        del self.recent[self.size:]
+        self.save()
+
+    def name(self, name, geometry):
+        self.named[name] = geometry
+        self.save()
+
+
+def verify_output(filename):
+    """Cheap check that a finished recording has its container trailer. Returns (ok, reason)."""
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        return False, "output file is missing"
+    if size == 0:
+        return False, "output file is empty"
+
+    ext = os.path.splitext(filename)[1].lower()
+    with open(filename, "rb") as f:
+        if ext == ".mp4":
+            # Walk the top-level boxes looking for moov, written on finalize
+            offset = 0
+            while offset + 8 <= size:
+                f.seek(offset)
+                box_size, box_type = struct.unpack(">I4s", f.read(8))
+                if box_size == 1:
+                    box_size = struct.unpack(">Q", f.read(8))[0]
+                elif box_size == 0:
+                    box_size = size - offset
+                if box_type == b"moov":
+                    return True, ""
+                if box_size < 8:
+                    break
+                offset += box_size
+            return False, "mp4 has no moov box (trailer not written)"
+        if ext in (".mkv", ".webm"):
+            if f.read(4) != b"\x1a\x45\xdf\xa3":
+                return False, "not a Matroska file"
+            # Cues are written at the end when the muxer finalizes
+            f.seek(max(0, size - (1 << 20)))
+            if b"\x1c\x53\xbb\x6b" not in f.read():
+                return False, "Matroska cues missing (trailer not written)"
+    return True, ""
+
+
+# Post-processing steps run with ffmpeg once a recording is saved. suffix
+# replaces the extension of the recording to name the result.
+POST_STEPS = {
+    "remux": {
+        "label": "mp4", "tooltip": "Remux to mp4 with faststart (stream copy, no re-encode)",
+        "suffix": ".mp4", "args": ["-c", "copy", "-movflags", "+faststart"],
+    },
+    "share": {
+        "label": "720p", "tooltip": "Smaller H.264 copy for sharing (<name>.share.mp4)",
+        "suffix": ".share.mp4",
+        "args": [
+            "-vf", "scale=-2:'min(720,ih)'", "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+            "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart",
+        ],
+    },
+    "thumbnail": {
+        "label": "thumb", "tooltip": "JPEG thumbnail next to the recording",
+        "suffix": ".jpg", "args": ["-vf", "thumbnail,scale=320:-2", "-frames:v", "1", "-update", "1"],
+    },
+}
+
+# Staging: record into fast local storage and move the file afterwards
+STAGING_MIN_SECONDS = 120  # refuse to start with less room than this
+STAGING_RESERVE_SECONDS = 15  # stop recording when headroom drops below this
+STAGING_RESERVE_BYTES = 64 << 20  # never fill the staging filesystem completely
+
+
+def default_staging_dir():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.environ.get("RECORDME_STAGING_DIR") or os.path.join(base, f"recordme-{os.getuid()}")
+
+
+def staging_headroom(directory, bytes_per_second):
+    """Seconds of recording left in directory at bytes_per_second."""
+    free = shutil.disk_usage(directory).free - STAGING_RESERVE_BYTES
+    return max(0, free) / max(1, bytes_per_second)
+
+
+def default_filename(container="mkv"):
+    """Default filename with date and time."""
+    return f"recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{container}"
+
+
+# Stopping wf-recorder: SIGINT lets it write the container trailer, then SIGTERM
+# and SIGKILL. Each signal gets its deadline in seconds before the next one
+INT_TIMEOUT = 5
+TERM_TIMEOUT = 3
+
+
+def stop_signals(int_timeout=INT_TIMEOUT, term_timeout=TERM_TIMEOUT):
+    """The (signal, deadline) steps used to stop wf-recorder; SIGKILL has no deadline."""
+    return ((signal.SIGINT, int_timeout), (signal.SIGTERM, term_timeout), (signal.SIGKILL, None))
+
+
+def check_finished(filename, stopped, returncode, signals_sent, last_message=""):
+    """Why a finished wf-recorder run is unusable, or None if filename is complete.
+
+    stopped says whether the exit was asked for; signals_sent lists the names
+    of the signals that reached the child.
+    """
+    if not stopped:
+        reason = f"wf-recorder exited unexpectedly (code {returncode})"
+        return f"{reason}: {last_message}" if last_message else reason
+    if "SIGKILL" in signals_sent:
+        return "wf-recorder did not stop and was killed; the file is probably incomplete"
+    with trace.span("verify", "record"):
+        ok, reason = verify_output(filename)
+    if not ok:
+        return f"{reason}: {last_message}" if last_message else reason
+    return None
+
+
+class RecordError(RuntimeError):
+    """A headless recording could not be made or finished; the message says why."""
+
+
+def pick_geometry(geometries=None):
+    """Runs slurp and returns the selected geometry, remembered in geometries if given."""
+    try:
+        process = subprocess.run(["slurp"], capture_output=True, text=True)
+    except FileNotFoundError:
+        raise RecordError("slurp is not installed")
+    geometry = process.stdout.strip()
+    if process.returncode != 0 or not GEOMETRY_RE.match(geometry):
+        raise RecordError(process.stderr.strip() or "Selection cancelled")
+    if geometries is not None:
+        geometries.add_recent(geometry)
+    return geometry
+
+
+def record(filename, profile="default", output=None, geometry=None, duration=None,
+           int_timeout=INT_TIMEOUT, term_timeout=TERM_TIMEOUT):
+    """Records with wf-recorder until duration seconds have passed, or until Ctrl+C without one.
+
+    Blocks the caller and needs no main loop. Like Recordme, it stops with
+    SIGINT so the container trailer gets written, escalates to SIGTERM and
+    SIGKILL if wf-recorder misses the deadlines, and checks the trailer
+    afterwards. Returns filename or raises RecordError.
+    """
+    container = os.path.splitext(filename)[1].lower().lstrip(".")
+    if container not in CONTAINERS:
+        container = "mkv"
+        filename = with_container(filename, container)
+    cmd = ["wf-recorder"]
+    if output:
+        cmd += ["-o", output]
+    elif geometry:
+        cmd += ["-g", geometry]
+    cmd += [*encoder_args(profile, container), "-f", filename]
+
+    # stderr goes to a file: wf-recorder redraws a progress line every frame and would fill a pipe
+    with tempfile.TemporaryFile() as log:
+        try:
+            process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stderr=log)
+        except FileNotFoundError:
+            raise RecordError("wf-recorder is not installed")
+        started = time.monotonic()
+        stopped = False
+        try:
+            process.wait(timeout=duration)
+        except (subprocess.TimeoutExpired, KeyboardInterrupt):
+            stopped = True
+        trace.record("recording", started, cat="record", profile=profile)
+
+        stopping = time.monotonic()
+        signals_sent = []
+        for sig, timeout in stop_signals(int_timeout, term_timeout):
+            if process.poll() is not None:
+                break
+            process.send_signal(sig)
+            signals_sent.append(sig.name)
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                pass
+        trace.record("stop", stopping, cat="record", signals=signals_sent)
+
+        log.seek(0)
+        lines = [line.strip() for line in log.read().decode(errors="replace").replace("\r", "\n").splitlines()]
+    last_message = next((line for line in reversed(lines) if line), "")
+
+    error = check_finished(filename, stopped, process.returncode, signals_sent, last_message)
+    if error:
+        raise RecordError(error)
+    return filename
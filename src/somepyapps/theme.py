@@ -0,0 +1,70 @@
+"""Catppuccin Mocha palette and the GTK stylesheet shared by the three apps.
+
+Importing this module does not load GTK; apply() does, so call it after the
+app has picked its GTK version. Stylesheets are templates formatted with
+COLORS, so "{green}" becomes the palette's green and CSS blocks use doubled
+braces. Each one is formatted and parsed once per process, however many
+windows ask for it.
+"""
+
+import functools
+
+# Catppuccin Mocha
+PALETTE = {
+    "base": "#1e1e2e",
+    "mantle": "#181825",
+    "crust": "#11111b",
+    "text": "#cdd6f4",
+    "subtext1": "#bac2de",
+    "surface0": "#313244",
+    "surface1": "#45475a",
+    "surface2": "#585b70",
+    "green": "#a6e3a1",
+    "blue": "#89b4fa",
+    "lavender": "#b4befe",
+    "red": "#f38ba8",
+}
+# Roles the apps style by, on top of the plain palette names
+COLORS = dict(
+    PALETTE,
+    border=PALETTE["green"],
+    input_bg=PALETTE["surface0"],
+    selection=PALETTE["surface2"],
+)
+
+# Rules every app shares; each adds its own after these
+BASE_CSS = """
+.window {{
+    background-color: {base};
+    color: {text};
+    border-radius: 14px;
+    border: 2px solid {border};
+}}
+
+.status-label {{
+    color: {subtext1};
+}}
+"""
+
+_providers = {}
+
+
+@functools.lru_cache(maxsize=None)
+def stylesheet(app_css=""):
+    """BASE_CSS followed by app_css, with the palette filled in."""
+    return (BASE_CSS + app_css).format_map(COLORS)
+
+
+def apply(app_css=""):
+    """Installs the stylesheet on the default screen and returns its Gtk.CssProvider."""
+    from gi.repository import Gdk, Gtk
+
+    provider = _providers.get(app_css)
+    if provider is None:
+        provider = Gtk.CssProvider()
+        provider.load_from_data(stylesheet(app_css).encode())
+        Gtk.StyleContext.add_provider_for_screen(
+            Gdk.Screen.get_default(), provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
+        )
+        _providers[app_css] = provider
+    return provider
@@ -0,0 +1,133 @@
+"""Monotonic-clock spans for the slow phases of capture, record and power actions.
+
+Off by default, and then span() hands back one shared no-op object and
+record() returns at once, so instrumented code costs a function call. It is
+enabled with SOMEPYAPPS_TRACE=<file> or an app's --trace <file>. The last
+SOMEPYAPPS_TRACE_SIZE spans (2000) stay in a ring buffer that is written on
+exit, or earlier by dump(). A file ending in .json gets Chrome trace format
+(chrome://tracing, Perfetto), anything else JSON lines, and "-" JSON lines
+on stderr.
+
+Spans that start in one callback and end in another keep their start from
+time.monotonic() and are closed with record(name, start).
+"""
+
+import atexit
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+enabled = False
+path = None
+spans = collections.deque(maxlen=2000)
+# Wall clock at monotonic zero, to put real dates on the spans
+wall_offset = time.time() - time.monotonic()
+
+
+class Span:
+    __slots__ = ("name", "cat", "start", "args")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, tb):
+        if kind is not None:
+            self.args["error"] = kind.__name__
+        record(self.name, self.start, cat=self.cat, **self.args)
+        return False
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def enable(destination, size=None):
+    """Start tracing into destination (see the module docstring); safe to call twice."""
+    global enabled, path, spans
+    if size:
+        spans = collections.deque(spans, maxlen=size)
+    path = destination
+    if not enabled:
+        enabled = True
+        atexit.register(dump)
+
+
+def span(name, cat="", **args):
+    """Context manager timing its block. Its args end up in the trace next to the timings."""
+    if not enabled:
+        return NULL_SPAN
+    return Span(name, cat, args)
+
+
+def record(name, start, end=None, cat="", **args):
+    """Adds a span from start to end (now by default), both from time.monotonic()."""
+    if not enabled:
+        return
+    end = time.monotonic() if end is None else end
+    spans.append((name, cat, start, end - start, threading.get_native_id(), args))
+
+
+def events():
+    """The buffered spans as JSON lines records, oldest first."""
+    pid = os.getpid()
+    return [
+        {
+            "name": name, "cat": cat, "pid": pid, "tid": tid,
+            "time": round(wall_offset + start, 6), "start_ms": round(start * 1000, 3),
+            "duration_ms": round(duration * 1000, 3), **args,
+        }
+        for name, cat, start, duration, tid, args in list(spans)
+    ]
+
+
+def chrome_events():
+    pid = os.getpid()
+    return [
+        {
+            "name": name, "cat": cat or "app", "ph": "X", "pid": pid, "tid": tid,
+            "ts": round(start * 1e6, 1), "dur": round(duration * 1e6, 1), "args": args,
+        }
+        for name, cat, start, duration, tid, args in list(spans)
+    ]
+
+
+def dump(destination=None):
+    """Writes the ring buffer to destination (the enabled path by default) and returns that path."""
+    destination = destination or path
+    if not destination:
+        return None
+    if destination == "-":
+        for event in events():
+            print(json.dumps(event, default=str), file=sys.stderr)
+        return destination
+    tmp = f"{destination}.tmp"
+    with open(tmp, "w") as f:
+        if destination.endswith(".json"):
+            json.dump({"traceEvents": chrome_events(), "displayTimeUnit": "ms"}, f, default=str)
+        else:
+            for event in events():
+                f.write(json.dumps(event, default=str) + "\n")
+    os.replace(tmp, destination)
+    return destination
+
+
+if os.environ.get("SOMEPYAPPS_TRACE"):
+    enable(os.environ["SOMEPYAPPS_TRACE"], int(os.environ.get("SOMEPYAPPS_TRACE_SIZE", "0")) or None)
@@ -0,0 +1,31 @@
+"""Headless tests for somepyapps, run against the stand-ins in benchmarks/fakes.
+
+    python3 -m pytest -q
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+FAKES = os.path.join(ROOT, "benchmarks", "fakes")
+# Small screens keep the synthetic PNGs cheap to compress
+MONITORS = [
+    {"name": "FAKE-1", "x": 0, "y": 0, "width": 320, "height": 200, "focused": True},
+    {"name": "FAKE-2", "x": 320, "y": 0, "width": 160, "height": 100, "focused": False},
+]
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """Put the grim, slurp, wl-copy, wf-recorder and hyprctl stand-ins first on PATH."""
+    monkeypatch.setenv("PATH", FAKES + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("FAKE_MONITORS", json.dumps(MONITORS))
+    for name in list(os.environ):
+        if name.startswith(("FAKE_WF_", "FAKE_GRIM_", "FAKE_SLURP_", "FAKE_WL_COPY_")):
+            monkeypatch.delenv(name)
+    return FAKES
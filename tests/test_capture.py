@@ -0,0 +1,86 @@
+import struct
+
+import pytest
+
+from somepyapps.capture import CaptureError, RegionCache, capture
+
+
+def png_size(data):
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    return struct.unpack(">II", data[16:24])
+
+
+@pytest.fixture
+def regions(tmp_path):
+    return RegionCache(str(tmp_path / "regions.json"))
+
+
+def test_capture_full(fakes, tmp_path, regions):
+    filename = str(tmp_path / "full.png")
+    assert capture("full", filename=filename, regions=regions) == filename
+    # Rectangle covering both fake screens
+    assert png_size((tmp_path / "full.png").read_bytes()) == (480, 200)
+
+
+def test_capture_never_overwrites(fakes, tmp_path, regions):
+    (tmp_path / "shot.png").write_bytes(b"keep")
+    saved = capture("full", filename=str(tmp_path / "shot.png"), regions=regions)
+    assert saved == str(tmp_path / "shot-1.png")
+    assert (tmp_path / "shot.png").read_bytes() == b"keep"
+
+
+def test_capture_area_remembers_the_selection(fakes, tmp_path, regions, monkeypatch):
+    monkeypatch.setenv("FAKE_SLURP_GEOMETRY", "10,10 64x48")
+    filename = capture("area", filename=str(tmp_path / "area.png"), regions=regions)
+    assert png_size(open(filename, "rb").read()) == (64, 48)
+    assert regions.last() == "10,10 64x48"
+    assert RegionCache(regions.path).last() == "10,10 64x48"
+
+
+def test_capture_area_cancelled(fakes, tmp_path, regions, monkeypatch):
+    monkeypatch.setenv("FAKE_SLURP_CANCEL", "1")
+    with pytest.raises(CaptureError) as error:
+        capture("area", filename=str(tmp_path / "area.png"), regions=regions)
+    assert error.value.state == "cancelled"
+    assert not (tmp_path / "area.png").exists()
+
+
+def test_capture_region(fakes, tmp_path, regions):
+    regions.name("panel", "0,0 32x16")
+    filename = capture("region", "panel", filename=str(tmp_path / "panel.png"), regions=regions)
+    assert png_size(open(filename, "rb").read()) == (32, 16)
+
+
+def test_capture_unknown_region(fakes, tmp_path, regions):
+    with pytest.raises(CaptureError, match="panel"):
+        capture("region", "panel", filename=str(tmp_path / "panel.png"), regions=regions)
+
+
+def test_capture_output(fakes, tmp_path, regions):
+    filename = capture("output", "FAKE-2", filename=str(tmp_path / "out.png"), regions=regions)
+    assert png_size(open(filename, "rb").read()) == (160, 100)
+
+
+def test_capture_copy_only(fakes, tmp_path, regions, monkeypatch):
+    monkeypatch.setenv("FAKE_WL_COPY_FILE", str(tmp_path / "clipboard"))
+    assert capture("full", clipboard=True, keep_file=False, regions=regions) is None
+    assert png_size((tmp_path / "clipboard").read_bytes()) == (480, 200)
+    assert list(tmp_path.glob("*.png")) == []
+
+
+def test_capture_to_file_and_clipboard(fakes, tmp_path, regions, monkeypatch):
+    monkeypatch.setenv("FAKE_WL_COPY_FILE", str(tmp_path / "clipboard"))
+    filename = capture("full", filename=str(tmp_path / "both.png"), clipboard=True, regions=regions)
+    assert open(filename, "rb").read() == (tmp_path / "clipboard").read_bytes()
+
+
+def test_capture_needs_a_destination(fakes, regions):
+    with pytest.raises(CaptureError):
+        capture("full", clipboard=False, keep_file=False, regions=regions)
+
+
+def test_capture_grim_failure_leaves_no_file(fakes, tmp_path, regions, monkeypatch):
+    monkeypatch.setenv("FAKE_GRIM_FAIL", "1")
+    with pytest.raises(CaptureError, match="sustituto"):
+        capture("full", filename=str(tmp_path / "fail.png"), regions=regions)
+    assert not (tmp_path / "fail.png").exists()
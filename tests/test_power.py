@@ -0,0 +1,36 @@
+import time
+
+from somepyapps.power import perform, run_hooks
+
+
+def test_run_hooks_shares_one_deadline(tmp_path):
+    config = {
+        "deadline": 0.5,
+        "hooks": [
+            {"command": "sleep 5"},
+            {"command": "sleep 5; true"},
+            {"command": "true"},
+            {"command": "false"},
+            {"command": f"touch {tmp_path / 'ran'}"},
+        ],
+    }
+    started = time.monotonic()
+    failed, late = run_hooks("reboot", config)
+    # Two slow hooks must not add up their waits
+    assert time.monotonic() - started < 2
+    assert failed == ["false"]
+    assert sorted(late) == ["sleep 5", "sleep 5; true"]
+    assert (tmp_path / "ran").exists()
+
+
+def test_run_hooks_only_for_their_actions(tmp_path):
+    config = {"deadline": 5, "hooks": [{"command": f"touch {tmp_path / 'ran'}", "actions": ["poweroff"]}]}
+    assert run_hooks("suspend", config) == ([], [])
+    assert not (tmp_path / "ran").exists()
+
+
+def test_dry_run_runs_no_hooks(tmp_path):
+    config = {"deadline": 5, "hooks": [{"command": f"touch {tmp_path / 'ran'}"}]}
+    notes = perform("reboot", config, dry_run=True)
+    assert notes == [f"gancho: touch {tmp_path / 'ran'}", "systemctl reboot"]
+    assert not (tmp_path / "ran").exists()
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from somepyapps.record import RecordError, record, stop_signals, verify_output
+
+
+def test_stop_signals_order():
+    assert [(sig.name, timeout) for sig, timeout in stop_signals(2, 1)] == [
+        ("SIGINT", 2), ("SIGTERM", 1), ("SIGKILL", None),
+    ]
+
+
+@pytest.mark.parametrize("container", ["mkv", "mp4", "webm"])
+def test_record_stops_with_sigint(fakes, tmp_path, container):
+    filename = str(tmp_path / f"clip.{container}")
+    assert record(filename, duration=0.3) == filename
+    assert verify_output(filename) == (True, "")
+
+
+def test_record_escalates_to_sigterm_when_sigint_is_ignored(fakes, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_WF_IGNORE_SIGINT", "1")
+    filename = str(tmp_path / "clip.mkv")
+    assert record(filename, duration=0.3, int_timeout=0.5, term_timeout=2) == filename
+    assert verify_output(filename) == (True, "")
+
+
+def test_record_kills_and_fails_when_every_signal_is_ignored(fakes, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_WF_IGNORE_SIGINT", "1")
+    monkeypatch.setenv("FAKE_WF_IGNORE_SIGTERM", "1")
+    with pytest.raises(RecordError, match="killed"):
+        record(str(tmp_path / "clip.mkv"), duration=0.3, int_timeout=0.3, term_timeout=0.3)
+
+
+def test_record_reports_a_missing_trailer(fakes, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_WF_NO_TRAILER", "1")
+    with pytest.raises(RecordError, match="moov"):
+        record(str(tmp_path / "clip.mp4"), duration=0.3)
+
+
+def test_record_without_wf_recorder(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    with pytest.raises(RecordError, match="not installed"):
+        record(str(tmp_path / "clip.mkv"), duration=0.1)
+
+
+def truncate(filename, size):
+    with open(filename, "r+b") as f:
+        f.truncate(size)
+
+
+@pytest.mark.parametrize("cut", [8, "half"])
+def test_verify_output_rejects_a_truncated_mp4(fakes, tmp_path, cut):
+    filename = str(tmp_path / "clip.mp4")
+    record(filename, duration=0.3)
+    size = os.path.getsize(filename)
+    truncate(filename, size // 2 if cut == "half" else size - cut)
+    ok, reason = verify_output(filename)
+    assert not ok
+    assert "moov" in reason
+
+
+@pytest.mark.parametrize("container", ["mkv", "webm"])
+def test_verify_output_rejects_a_truncated_matroska(fakes, tmp_path, container):
+    filename = str(tmp_path / f"clip.{container}")
+    record(filename, duration=0.3)
+    truncate(filename, os.path.getsize(filename) // 2)
+    ok, reason = verify_output(filename)
+    assert not ok
+    assert "cues" in reason
+
+
+def test_verify_output_rejects_missing_and_empty_files(tmp_path):
+    assert verify_output(str(tmp_path / "missing.mkv")) == (False, "output file is missing")
+    (tmp_path / "empty.mp4").write_bytes(b"")
+    assert verify_output(str(tmp_path / "empty.mp4")) == (False, "output file is empty")
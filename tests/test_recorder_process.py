@@ -0,0 +1,61 @@
+"""Recordme's RecorderProcess lifecycle under a plain GLib.MainLoop, with no display."""
+
+import importlib.util
+import os
+
+import pytest
+
+pytest.importorskip("gi")
+from gi.repository import GLib
+
+from conftest import ROOT
+
+
+@pytest.fixture(scope="module")
+def recordme():
+    path = os.path.join(ROOT, "src", "Recordme.py", "recordme.py", "recordme.py")
+    spec = importlib.util.spec_from_file_location("recordme", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(recordme, filename, **timeouts):
+    """Records for a moment, stops and returns the recorder once it is done or failed."""
+    loop = GLib.MainLoop()
+    states = []
+
+    def on_state(recorder):
+        states.append(recorder.state)
+        if recorder.state == "recording":
+            GLib.timeout_add(300, recorder.stop)
+        elif recorder.state in ("done", "failed"):
+            loop.quit()
+
+    recorder = recordme.RecorderProcess(["wf-recorder", "-f", filename], filename, on_state, **timeouts)
+    recorder.start()
+    GLib.timeout_add_seconds(20, loop.quit)
+    loop.run()
+    assert states[:3] == ["starting", "recording", "finalizing"]
+    return recorder
+
+
+def test_stops_with_sigint(fakes, tmp_path, recordme):
+    recorder = run(recordme, str(tmp_path / "clip.mkv"))
+    assert (recorder.state, recorder.signals_sent, recorder.error) == ("done", ["SIGINT"], None)
+    assert recordme.RecorderProcess.active is None
+
+
+def test_escalates_when_sigint_is_ignored(fakes, tmp_path, recordme, monkeypatch):
+    monkeypatch.setenv("FAKE_WF_IGNORE_SIGINT", "1")
+    recorder = run(recordme, str(tmp_path / "clip.mp4"), int_timeout=1, term_timeout=1)
+    assert (recorder.state, recorder.signals_sent) == ("done", ["SIGINT", "SIGTERM"])
+
+
+def test_kill_fails_the_recording(fakes, tmp_path, recordme, monkeypatch):
+    monkeypatch.setenv("FAKE_WF_IGNORE_SIGINT", "1")
+    monkeypatch.setenv("FAKE_WF_IGNORE_SIGTERM", "1")
+    recorder = run(recordme, str(tmp_path / "clip.mkv"), int_timeout=1, term_timeout=1)
+    assert recorder.state == "failed"
+    assert recorder.signals_sent == ["SIGINT", "SIGTERM", "SIGKILL"]
+    assert "killed" in recorder.error